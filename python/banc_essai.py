@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Bancs d'essai des performances
+
+Le premier argument désigne le banc, les suivants sont ceux de la
+configuration commune (-f nom_fichier…) :
+
+  banc_essai.py décodage -f h04l04m05-p10.log
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from commun import Configuration
+from tectonic import Progrès
+from tectonic.fichier import paquets
+from tectonic.fichier import lecteur
+from tectonic.fichier import écrivain
+from tectonic.serial import Codec
+from tectonic.serial import CodecBinaire
+from tectonic.serial import GrilleParesseuse
+from générateur import Analyseur
+from générateur import ProducteurProgrès
+
+
+def chronométrer(nom, traitement, codes):
+    """Exécute le traitement sur chacun des codes et affiche le débit
+    """
+    début = time.perf_counter()
+    for code in codes:
+        traitement(code)
+    durée = time.perf_counter() - début
+    print(f"{nom} : {len(codes) / durée:.0f} codes/s")
+    return durée
+
+
+def taille_fichier(base, codes, **options):
+    """Taille en octets du fichier produit pour les codes fournis
+    """
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = os.path.join(dossier, "banc.log")
+        sortie = écrivain(chemin, base, **options)
+        sortie.ajouter_lot(codes)
+        sortie.clore()
+        return os.path.getsize(chemin)
+
+
+def banc_format(lot, codes):
+    """Taille et débit de lecture selon le format d'enregistrement
+    """
+    variantes = [
+        ("001", codes, dict()),
+        ("002", codes, dict(format=2)),
+        ("002, zlib", codes, dict(format=2, compression=True)),
+        ("002, trié", sorted(codes), dict(format=2)),
+        ("002, trié, zlib", sorted(codes), dict(format=2, compression=True)),
+    ]
+    with tempfile.TemporaryDirectory() as dossier:
+        for nom, contenu, options in variantes:
+            chemin = os.path.join(dossier, "banc.log")
+            sortie = écrivain(chemin, lot.base, **options)
+            sortie.ajouter_lot(contenu)
+            sortie.clore()
+            taille = os.path.getsize(chemin)
+
+            début = time.perf_counter()
+            nb_codes = sum(1 for _ in lecteur(chemin))
+            durée = time.perf_counter() - début
+            print(f"{nom} : {taille / nb_codes:.2f} octets par code, "
+                  f"lecture à {nb_codes / durée:.0f} codes/s")
+
+
+def banc_binaire(lot, codes):
+    """Codes à base mixte contre codes à champs de bits fixes
+    """
+    codec = Codec(lot.base)
+    binaire = CodecBinaire(lot.base)
+    binaires = [binaire.depuis_codec(codec, c) for c in codes]
+    assert codes == [binaire.vers_codec(codec, b) for b in binaires]
+
+    print("Décodage")
+    avant = chronométrer("Codec", codec.décoder_compacte, codes)
+    après = chronométrer("CodecBinaire", binaire.décoder_compacte, binaires)
+    print(f"→ ×{avant / après:.2f}")
+
+    print("Encodage")
+    grilles = [codec.décoder_compacte(c) for c in codes]
+    avant = chronométrer("Codec", codec.encoder, grilles)
+    après = chronométrer("CodecBinaire", binaire.encoder, grilles)
+    print(f"→ ×{avant / après:.2f}")
+
+    print("Accès à une case")
+    avant = chronométrer(
+        "Codec", lambda c: c // codec.poids(c)[3] % codec.pad_valeur, codes)
+    après = chronométrer("CodecBinaire", lambda b: binaire.valeur(b, 3),
+                         binaires)
+    print(f"→ ×{avant / après:.2f}")
+
+    print("Taille sur disque")
+    avant = taille_fichier(lot.base, codes)
+    après = taille_fichier(lot.base, binaires)
+    print(f"Codec : {avant} octets, {avant / len(codes):.2f} par code")
+    print(f"CodecBinaire : {après} octets, {après / len(codes):.2f} par code")
+    print(f"→ ×{après / avant:.2f}")
+
+
+def banc_décodage(lot, codes):
+    """Décodage puis analyse, Grille contre GrilleCompacte
+    """
+    codec = Codec(lot.base)
+    avant = chronométrer("Grille", lambda c: Analyseur(codec.décoder(c)),
+                         codes)
+    après = chronométrer("GrilleCompacte",
+                         lambda c: Analyseur(codec.décoder_compacte(c)),
+                         codes)
+    print(f"→ ×{avant / après:.2f}")
+
+
+def banc_production(lot, codes):
+    """Production des grilles du palier suivant
+
+    Chaque code produit est comparé à l'encodage complet de la grille
+    correspondante.
+    """
+    progrès = Progrès.depuis_chaîne(lot.chemin)
+    progrès.palier += 1
+    producteur = ProducteurProgrès(progrès)
+
+    enfants = list()
+    durée = chronométrer("Parents", lambda c: enfants.extend(
+        producteur.itérer(c)), codes)
+    print(f"Enfants : {len(enfants) / durée:.0f} codes/s")
+
+    codec = producteur.codec
+    for enfant in enfants:
+        attendu = codec.encoder(codec.décoder_compacte(enfant))
+        assert enfant == attendu, f"{enfant} ≠ {attendu}"
+
+
+def banc_mémoïsation(lot, codes):
+    """Production des grilles du palier suivant, sans et avec mémorisation
+    des développements par signature de frontière
+    """
+    progrès = Progrès.depuis_chaîne(lot.chemin)
+    progrès.palier += 1
+
+    résultats = list()
+    for nom, taille_cache in (("Sans cache", 0), ("Cache LRU", 2**14)):
+        producteur = ProducteurProgrès(progrès, taille_cache)
+        enfants = list()
+        résultats.append((chronométrer(
+            nom, lambda c: enfants.extend(producteur.itérer(c)),
+            codes), enfants))
+
+    succès, échecs = producteur.consultations()
+    print(f"Succès : {succès / max(1, succès + échecs):.2%} "
+          f"({échecs} signatures distinctes)")
+    (avant, sans), (après, avec) = résultats
+    assert sans == avec
+    print(f"→ ×{avant / après:.2f}")
+
+
+def banc_lot(lot, codes):
+    """Décodage code par code contre décodage par lots
+    """
+    codec = Codec(lot.base)
+    avant = chronométrer("décoder_compacte", codec.décoder_compacte, codes)
+
+    début = time.perf_counter()
+    for paquet in paquets(codes):
+        codec.décoder_lot(paquet)
+    après = time.perf_counter() - début
+    print(f"décoder_lot : {len(codes) / après:.0f} codes/s")
+    print(f"→ ×{avant / après:.2f}")
+
+
+def banc_préfixe(lot, codes):
+    """Décodage complet contre décodage du seul préfixe défini
+    """
+    progrès = Progrès.depuis_chaîne(lot.chemin)
+    codec = Codec(lot.base)
+    avant = chronométrer("décoder_compacte", codec.décoder_compacte, codes)
+    après = chronométrer(
+        "décoder_préfixe",
+        lambda c: codec.décoder_préfixe(c, progrès.palier), codes)
+    print(f"→ ×{avant / après:.2f}")
+    dernière = progrès.palier - 1
+    chronométrer("GrilleParesseuse, dernière case",
+                 lambda c: GrilleParesseuse(codec, c).valeur(dernière), codes)
+
+
+def banc_dédoublonnage(lot, codes):
+    """Insertion dans un ensemble, selon la représentation retenue
+
+    La moitié des grilles est insérée deux fois, pour que les doublons
+    sollicitent aussi l'égalité.
+    """
+    codec = Codec(lot.base)
+    codes = codes[:2**17]
+    codes += codes[:len(codes) // 2]
+    grilles = [codec.décoder(c) for c in codes]
+    compactes = [codec.décoder_compacte(c) for c in codes]
+    identités = [g.identité() for g in compactes]
+
+    rendus = set()
+    chronométrer("Grille, hachage du rendu texte (ancien)",
+                 lambda g: rendus.add(str(g)), grilles)
+    chronométrer("Grille", set().add, grilles)
+    chronométrer("GrilleCompacte", set().add, compactes)
+    chronométrer("Identité", set().add, identités)
+    chronométrer("Code", set().add, codes)
+
+
+BANCS = {
+    "binaire": banc_binaire,
+    "décodage": banc_décodage,
+    "dédoublonnage": banc_dédoublonnage,
+    "format": banc_format,
+    "lot": banc_lot,
+    "mémoïsation": banc_mémoïsation,
+    "préfixe": banc_préfixe,
+    "production": banc_production,
+}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    BANC = BANCS[sys.argv.pop(1)]
+    CONF = Configuration.charger()
+    for LOT in CONF.lots:
+        print(f"{LOT.chemin} : {LOT.nb_codes} codes")
+        BANC(LOT, list(LOT))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Crée ou met à jour le catalogue de dossiers de données, et l'affiche
+
+  cataloguer.py [-s] dossier…
+
+Avec -s, seuls les fichiers à surveiller sont affichés : ceux qui ne sont
+pas intègres, à réparer ou à supprimer, et ceux qui n'ont pas été clos.
+"""
+
+import getopt
+import logging
+import sys
+
+from tectonic import fichier
+
+
+class Cataloguer:
+
+    def __init__(self, surveillance=False, dossiers=list()):
+        self.surveillance = surveillance
+        self.dossiers = dossiers
+
+    @staticmethod
+    def charger():
+        retour = Cataloguer()
+        opts, args = getopt.getopt(sys.argv[1:], "s")
+        for opt, _ in opts:
+            if opt == "-s":
+                retour.surveillance = True
+        retour.dossiers[:] = args
+
+        return retour
+
+    @staticmethod
+    def état(entrée):
+        if not entrée.intègre:
+            return "non intègre"
+        if not entrée.clos:
+            return "non clos"
+        return "trié" if entrée.trié else ""
+
+    def cataloguer(self, dossier):
+        catalogue = fichier.cataloguer(dossier)
+        for entrée in catalogue.entrées():
+            if self.surveillance and entrée.intègre and entrée.clos:
+                continue
+            nb_codes = "?" if entrée.nb_codes is None else entrée.nb_codes
+            print(f"{entrée.nom:<32} n°{entrée.format} {nb_codes:>12} "
+                  f"{self.état(entrée)}")
+
+    def lancer(self):
+        for dossier in self.dossiers:
+            self.cataloguer(dossier)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    CATALOGUER = Cataloguer.charger()
+    CATALOGUER.lancer()
@@ -10,7 +10,11 @@
 import enum
 import logging
 
+import numpy
+
 from commun import Configuration
+from tectonic import topologie
+from tectonic.fichier import paquets
 from tectonic.serial import Codec
 
 
@@ -24,31 +28,47 @@ class Terrain(enum.IntEnum):
     terre = enum.auto()
 
 
-def est_4_coloriable(grille):
-    """Vrai ssi la Grille est coloriable avec 4 couleurs.
+def voisinages(base, régions):
+    """Itérateur des graphes des voisinages de Régions, {région: voisines},
+    des grilles dont la matrice des régions est fournie (voir
+    `Codec.décoder_lot`)
 
     Une case peut partager la couleur d'une de ses 8 voisines ssi elles
     sont dans la même Région
+
+    >>> from tectonic import Base
+    >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+    >>> _, régions = codec.décoder_lot([45665103876])
+    >>> next(voisinages(codec.base, régions))[2]
+    {0, 1}
+    """
+    # Chaque paire de cases voisines est considérée une seule fois, depuis la
+    # case d'index le plus élevé
+    précédents = topologie(base).précédents
+    paires = [(i, j) for i in range(base.nb_cases()) for j in précédents[i]]
+
+    # Les régions sont décalées d'une unité dans la matrice
+    régions = régions.astype(numpy.int16) - 1
+    premières = régions[:, [i for i, _ in paires]]
+    secondes = régions[:, [j for _, j in paires]]
+    for r1, r2 in zip(premières.tolist(), secondes.tolist()):
+        voisinage = dict()
+        for a, b in zip(r1, r2):
+            # Les cases indéfinies (-1) n'appartiennent à aucune Région
+            if a != b and a >= 0 and b >= 0:
+                voisinage.setdefault(a, set()).add(b)
+                voisinage.setdefault(b, set()).add(a)
+        yield voisinage
+
+
+def est_4_coloriable(voisinage):
+    """Vrai ssi la grille, donnée par son graphe des voisinages de Régions
+    (voir `voisinages`), est coloriable avec 4 couleurs.
     """
     # https://fr.wikipedia.org/wiki/Th%C3%A9or%C3%A8me_des_quatre_couleurs
     # Attention, le théorême ne vaut que pour le partage de frontière. Ce
     # qui n'est pas la définition retenue dans Tiwanaku.
 
-    # On établit le graphe des voisinages de Régions
-    voisinage = dict()
-    for h1 in range(grille.base.hauteur):
-        for l1 in range(grille.base.largeur):
-            r1 = grille[(h1, l1)].région
-            for delta_h, delta_l in [(-1, -1), (-1, 0), (-1, 1), (0, -1)]:
-                h2 = h1 + delta_h
-                l2 = l1 + delta_l
-                if (0 <= h2 < grille.base.hauteur
-                        and 0 <= l2 < grille.base.largeur):
-                    r2 = grille[(h2, l2)].région
-                    if r1 != r2:
-                        voisinage.setdefault(r1, set()).add(r2)
-                        voisinage.setdefault(r2, set()).add(r1)
-
     # Recherche d'un coloriage valide
     for k in sorted(voisinage):
         logging.debug(f"{k} → {sorted(voisinage[k])}")
@@ -89,10 +109,13 @@ def statuer(lots):
 
     for lot in lots:
         codec = Codec(lot.base)
-        for code in lot:
-            grille = codec.décoder(code)
-            if not est_4_coloriable(grille):
-                logging.debug(grille)
+        for paquet in paquets(lot):
+            _, régions = codec.décoder_lot(paquet)
+            for code, voisinage in zip(paquet,
+                                       voisinages(codec.base, régions)):
+                if est_4_coloriable(voisinage):
+                    continue
+                logging.debug(codec.décoder(code))
                 if affichage:
                     print("")
                 print(code)
@@ -2,17 +2,21 @@
 
 import getopt
 import logging
+import os.path
 import sys
 
 from tectonic import Base
 from tectonic import Lecteur
+from tectonic.fichier import Lot
 from tectonic.fichier import lecteur
 
 
 class Configuration:
     """Socle commun de configuration des différents scripts :
 
-    -f nom_fichier
+    -f nom_fichier  fichier à traiter, ou lot «nom_fichier:début:nombre»
+    -d N            rang du premier code à traiter
+    -n N            nombre de codes à traiter
     -g              active le mode DEBUG
     -o suffixe      précise le suffixe à employer pour les sorties
     -h N
@@ -25,6 +29,8 @@ class Configuration:
         self.lots = list()
         self.debug = False
         self.suffixe = ".out"
+        self.début = 0
+        self.nombre = None
 
     @staticmethod
     def charger():
@@ -34,10 +40,14 @@ class Configuration:
         hauteur = None
         largeur = None
         maximum = None
-        opts, args = getopt.getopt(sys.argv[1:], "f:gh:l:m:o:")
+        opts, args = getopt.getopt(sys.argv[1:], "d:f:gh:l:m:n:o:")
         for opt, val in opts:
             if opt == "-f":
-                retour.lots.append(lecteur(val))
+                lot = Lot.depuis_chaîne(val)
+                if lot is None or os.path.exists(val):
+                    retour.lots.append(lecteur(val))
+                else:
+                    retour.lots.append(lot.ouvrir())
             elif opt == "-g":
                 retour.debug = True
             elif opt == "-o":
@@ -52,6 +62,10 @@ class Configuration:
                     largeur = val
                 elif opt == "-m":
                     maximum = val
+                elif opt == "-d":
+                    retour.début = val
+                elif opt == "-n":
+                    retour.nombre = val
         codes = [int(c) for c in args]
         if not (hauteur is None and largeur is None and maximum is None):
             if not (hauteur is None or largeur is None or maximum is None):
@@ -73,3 +87,11 @@ class Configuration:
                 retour.lots.append(Lecteur(base, codes))
 
         return retour
+
+    def codes(self, lot):
+        """Itérateur des codes du lot, restreint par les options -d et -n
+        """
+        fin = len(lot)
+        if self.nombre is not None:
+            fin = min(fin, self.début + self.nombre)
+        return lot.iter_range(self.début, fin)
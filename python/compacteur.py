@@ -2,116 +2,166 @@
 # -*- coding: utf-8 -*-
 """Compacteur de fichiers au format TECTONIC1
 
-Limite à 1 unique bloc de description
+Limite à 1 unique bloc de description. Plusieurs fichiers de même base,
+produits par exemple par des processus travaillant en parallèle, sont
+réunis dans celui nommé d'après le premier :
+
+  compacteur.py [-o suffixe] -f fichier [-f fichier…]
+
+Les octets des segments sont recopiés par le noyau, sans transiter par le
+programme, lorsque le système le permet.
 """
 
-from collections import namedtuple
+import collections
+import contextlib
 import logging
 import os
+import struct
+import time
+import zlib
 
 from commun import Configuration
-
-Segment = namedtuple("Segment", "taille nombre")
-
-
-class Bloc:
-
-    def __init__(self, entrée):
-        self.décalage = entrée.tell()
-        self.segments = list()
-        n = int.from_bytes(entrée.read(1), byteorder="big", signed=True)
-        while n > 0:
-            taille = int.from_bytes(entrée.read(1),
-                                    byteorder="big",
-                                    signed=False)
-            nombre = int.from_bytes(entrée.read(4),
-                                    byteorder="big",
-                                    signed=False)
-            self.segments.append(Segment(taille, nombre))
-            n -= 1
-        self.contenu = entrée.tell()
-
-    def __str__(self):
-        lignes = list()
-        lignes.append("Bloc")
-        lignes.append(
-            "  - en-tête : [0x{self.décalage:08x} 0x{self.contenu:08x}]")
-        début = self.contenu
-        for i, s in enumerate(self.segments):
-            fin = début + s.nombre * s.taille
-            lignes.append(
-                f"  - bloc {i} : {s.nombre:8d} codes × {s.taille} octets : [0x{début:08x} 0x{fin:08x}]"
-            )
-            début = fin
-        return "\n".join(lignes)
-
-    def fin(self):
-        retour = self.contenu
-        for s in self.segments:
-            retour += s.nombre * s.taille
-        return retour
-
-    def tailles(self):
-        retour = sorted(set([s.taille for s in self.segments]))
-        return retour
-
-    def sélection(self, taille):
-        """Itérateur des segments de la taille demandée
-
-        Chaque réponse est de la forme (décalage, nombre)
-        """
-        décalage = self.contenu
-        for s in self.segments:
-            if s.taille == taille:
-                yield (décalage, s.nombre)
-            décalage += s.nombre * s.taille
-
-
-def compacter(lecteur, suffixe):
-    chemin = lecteur.chemin
-
-    # Cartographie
-    blocs = list()
-    with open(chemin, "rb") as entrée:
-        entrée.seek(16, os.SEEK_SET)
-        while True:
-            b = Bloc(entrée)
-            if len(b.segments) == 0:
-                break
-            blocs.append(b)
-            entrée.seek(b.fin(), os.SEEK_SET)
-
-    # Caractéristiques du bloc compact
-    segments = dict()
-    for b in blocs:
-        for s in b.segments:
-            segments[s.taille] = segments.get(s.taille, 0) + s.nombre
-
-    # Compactage
-    with (open(chemin, "rb") as entrée, open(chemin + suffixe, "wb") as
-          sortie):
-        # En-tête
-        sortie.write(entrée.read(16))
+from tectonic.fichier_001 import CONTRÔLE
+from tectonic.fichier_001 import PRÉLUDE_CONTRÔLÉ
+from tectonic.fichier_001 import contrôle_bloc
+from tectonic.fichier_001 import en_tête_bloc
+from tectonic.statistiques import STAT
+from tectonic.statistiques import Statistiques
+from tectonic.statistiques import encoder_pied
+
+
+# Taille des lectures lorsque le noyau ne sait pas copier seul
+TAMPON = 2**20
+
+# Faux dès que la copie par le noyau a échoué une fois
+_copie_noyau = True
+
+
+def _copier(entrée, sortie, décalage, longueur):
+    """Recopie 'longueur' octets du descripteur 'entrée', à partir de
+    'décalage', à la position courante du descripteur 'sortie'
+
+    La copie est confiée au noyau (`os.copy_file_range`, à défaut
+    `os.sendfile`) ; s'il la refuse, les octets transitent par un tampon.
+    """
+    global _copie_noyau
+    while longueur > 0:
+        n = 0
+        if _copie_noyau:
+            try:
+                if hasattr(os, "copy_file_range"):
+                    n = os.copy_file_range(entrée, sortie, longueur,
+                                           décalage)
+                else:
+                    n = os.sendfile(sortie, entrée, décalage, longueur)
+            except OSError:
+                _copie_noyau = False
+        if n == 0:
+            n = os.write(sortie,
+                         os.pread(entrée, min(longueur, TAMPON), décalage))
+            if n == 0:
+                raise EOFError(f"{longueur} octets manquants")
+        décalage += n
+        longueur -= n
+
+
+def _crc32(données, décalage, longueur, crc):
+    """CRC32 'crc' prolongé de 'longueur' octets des données, à partir de
+    'décalage', lus par tranches de `TAMPON` octets
+    """
+    with memoryview(données) as vue:
+        for début in range(décalage, décalage + longueur, TAMPON):
+            fin = min(début + TAMPON, décalage + longueur)
+            crc = zlib.crc32(vue[début:fin], crc)
+    return crc
+
+
+def compacter(lecteurs, chemin):
+    """Réunit les codes des fichiers de 'lecteurs', de même base, en un
+    unique bloc contrôlé écrit dans 'chemin'
+
+    Les segments de même taille sont mis bout à bout, dans l'ordre des
+    fichiers puis des segments. Les statistiques sont reportées dans le pied
+    si tous les fichiers en ont. Renvoie le nombre de codes écrits.
+    """
+    base = lecteurs[0].base
+    for lecteur in lecteurs:
+        if lecteur.base != base:
+            raise ValueError(f"«{lecteur.chemin}» : base {lecteur.base} "
+                             f"au lieu de {base}")
+
+    # Cartographie : taille → [(lecteur, décalage, nombre)]
+    segments = collections.defaultdict(list)
+    for lecteur in lecteurs:
+        for _, décalage, taille, nombre in lecteur.segments:
+            segments[taille].append((lecteur, décalage, nombre))
+    nb_codes = sum(len(lecteur) for lecteur in lecteurs)
+
+    # Statistiques réunies sans relire les codes
+    statistiques = Statistiques(base)
+    for lecteur in lecteurs:
+        if statistiques is not None and lecteur.statistiques is not None:
+            statistiques.fusionner(lecteur.statistiques)
+        else:
+            statistiques = None
+
+    # Compactage, en un bloc contrôlé par groupe de tailles (un seul en
+    # pratique) : le contenu copié par le noyau est relu pour son CRC32
+    tailles = sorted(segments)
+    with contextlib.ExitStack() as pile:
+        entrées = {
+            lecteur.chemin: pile.enter_context(open(lecteur.chemin, "rb"))
+            for lecteur in lecteurs
+        }
+        sortie = pile.enter_context(open(chemin, "wb"))
+        sortie.write(PRÉLUDE_CONTRÔLÉ)
         sortie.write(
-            len(segments).to_bytes(length=1, byteorder="big", signed=False))
-        for taille in sorted(segments):
-            sortie.write(
-                taille.to_bytes(length=1, byteorder="big", signed=False))
-            sortie.write(segments[taille].to_bytes(length=4,
-                                                   byteorder="big",
-                                                   signed=False))
-        # Bloc
-        for taille in sorted(segments):
-            for b in blocs:
-                for décalage, nombre in b.sélection(taille):
-                    entrée.seek(décalage, os.SEEK_SET)
-                    sortie.write(entrée.read(taille * nombre))
-        # Marque finale
-        sortie.write((-128).to_bytes(length=1, byteorder="big", signed=True))
+            struct.pack(">BBBL", base.hauteur, base.largeur, base.maximum,
+                        nb_codes))
+        sortie.flush()
+
+        cumul = 0
+        for i in range(0, len(tailles), CONTRÔLE - 1):
+            groupe = tailles[i:i + CONTRÔLE - 1]
+            paires = [(taille,
+                       sum(nombre for _, _, nombre in segments[taille]))
+                      for taille in groupe]
+            en_tête = en_tête_bloc(paires)
+            os.write(sortie.fileno(), en_tête)
+            longueur = len(en_tête)
+            crc = zlib.crc32(en_tête)
+            for taille in groupe:
+                for lecteur, décalage, nombre in segments[taille]:
+                    _copier(entrées[lecteur.chemin].fileno(),
+                            sortie.fileno(), décalage, taille * nombre)
+                    crc = _crc32(lecteur.données, décalage, taille * nombre,
+                                 crc)
+                    longueur += taille * nombre
+            cumul += sum(nombre for _, nombre in paires)
+            os.write(sortie.fileno(), contrôle_bloc(cumul, longueur, crc))
+
+        # Marque finale, puis pied
+        os.write(sortie.fileno(), struct.pack(">B", 128))
+        if statistiques is not None:
+            os.write(sortie.fileno(),
+                     encoder_pied({STAT: statistiques.en_octets()}))
+
+    return nb_codes
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     CONF = Configuration.charger()
-    for lot in CONF.lots:
-        compacter(lot, CONF.suffixe)
+    LOTS = [lot for lot in CONF.lots if getattr(lot, "FORMAT", None) == 1]
+    if len(LOTS) < len(CONF.lots):
+        logging.warning("Seuls les fichiers au format n°1 sont compactés")
+    if len(LOTS) > 0:
+        CHEMIN = LOTS[0].chemin + CONF.suffixe
+        DÉBUT = time.perf_counter()
+        with contextlib.ExitStack() as PILE:
+            for LOT in LOTS:
+                PILE.enter_context(LOT)
+            NB_CODES = compacter(LOTS, CHEMIN)
+        DURÉE = time.perf_counter() - DÉBUT
+        logging.info(f"{NB_CODES} codes de {len(LOTS)} fichier(s) réunis "
+                     f"dans «{CHEMIN}» en {DURÉE:.2f}s")
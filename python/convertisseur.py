@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 """Convertit une sauvegarde d'un format à un autre.
 
-Par défaut, réalise la conversion du format n°0 au format n°1.
+Par défaut, réalise la conversion du format n°0 au format n°1. L'option -z
+active la compression des blocs du format n°2.
 """
 
 import getopt
@@ -11,25 +12,30 @@ import sys
 
 from tectonic import fichier_000
 from tectonic import fichier_001
+from tectonic import fichier_002
 
 
 class Convertisseur:
 
-    FORMATS = [fichier_000, fichier_001]
+    FORMATS = [fichier_000, fichier_001, fichier_002]
 
-    def __init__(self, nid=0, but=1, chemins=list(), suffixe=".out"):
+    def __init__(self, nid=0, but=1, chemins=list(), suffixe=".out",
+                 compression=False):
         self.nid = nid
         self.but = but
         self.chemins = chemins
         self.suffixe = suffixe
+        self.compression = compression
 
     @staticmethod
     def charger():
         retour = Convertisseur()
-        opts, args = getopt.getopt(sys.argv[1:], "b:n:o:")
+        opts, args = getopt.getopt(sys.argv[1:], "b:n:o:z")
         for opt, val in opts:
             if opt == "-o":
                 retour.suffixe = val
+            elif opt == "-z":
+                retour.compression = True
             else:
                 if not val.isdecimal():
                     logging.warning(f"Option «{opt} {val}» ignorée")
@@ -45,6 +51,11 @@ class Convertisseur:
                         retour.nid = val
         retour.chemins[:] = args
 
+        if retour.compression and Convertisseur.FORMATS[retour.but] is not (
+                fichier_002):
+            logging.warning("Option «-z» ignorée : format sans compression")
+            retour.compression = False
+
         retour.lecteur = Convertisseur.FORMATS[retour.nid].Lecteur
         retour.écrivain = Convertisseur.FORMATS[retour.but].Écrivain
 
@@ -52,7 +63,12 @@ class Convertisseur:
 
     def convertir(self, chemin):
         lecteur = self.lecteur(chemin)
-        écrivain = self.écrivain(chemin + self.suffixe, lecteur.base)
+        if self.compression:
+            écrivain = self.écrivain(chemin + self.suffixe,
+                                     lecteur.base,
+                                     compression=True)
+        else:
+            écrivain = self.écrivain(chemin + self.suffixe, lecteur.base)
 
         for code in lecteur:
             écrivain.ajouter(code)
@@ -20,13 +20,68 @@ def identifier_sorties(nom):
 
 
 def filtrer(lot):
-    nom_ok, nom_ko = identifier_sorties(lot.chemin)
+    """Répartit les grilles du lot entre formes canoniques (.ok) et autres
+    (.ko)
+
+    Sur un palier, chaque classe de symétrie garde un représentant :
+
+    >>> import os
+    >>> import tempfile
+    >>> from générateur import GénérateurGrilleVide, ProducteurProgrès
+    >>> from tectonic import Progrès
+    >>> from tectonic.fichier import lecteur
+    >>> def décimer(palier):
+    ...     codes = list(GénérateurGrilleVide(Progrès(hauteur=3, largeur=4,
+    ...                                               maximum=4).base()))
+    ...     for p in range(1, palier + 1):
+    ...         producteur = ProducteurProgrès(
+    ...             Progrès(hauteur=3, largeur=4, maximum=4, palier=p))
+    ...         codes = [e for code in codes for e in producteur.itérer(code)]
+    ...     with tempfile.TemporaryDirectory() as dossier:
+    ...         chemin = os.path.join(dossier, f"h03l04m04-p{palier:02d}.log")
+    ...         sortie = écrivain(chemin, producteur.codec.base)
+    ...         sortie.ajouter_lot(codes)
+    ...         sortie.clore()
+    ...         filtrer(lecteur(chemin))
+    ...         ok = list(lecteur(chemin + ".ok"))
+    ...         ko = list(lecteur(chemin + ".ko"))
+    ...     codec = producteur.codec
+    ...     formes = {codec.code_canonique(code) for code in codes}
+    ...     return len(codes), len(ok), len(ko), len(formes)
+    >>> décimer(4)
+    (708, 354, 354, 354)
+    >>> décimer(5)
+    (2118, 2118, 0, 2118)
+
+    Un lot issu d'un fichier a ses propres sorties, les codes fournis en
+    arguments gardent celles par défaut :
+
+    >>> from tectonic.fichier import Lot
+    >>> with tempfile.TemporaryDirectory() as dossier:
+    ...     chemin = os.path.join(dossier, "h03l04m04-p04.log")
+    ...     sortie = écrivain(chemin, Progrès(hauteur=3, largeur=4,
+    ...                                       maximum=4).base())
+    ...     sortie.ajouter_lot([259, 515, 771])
+    ...     sortie.clore()
+    ...     filtrer(Lot(chemin, 1, 2).ouvrir())
+    ...     for nom in sorted(os.listdir(dossier)):
+    ...         print(nom)
+    h03l04m04-p04.log
+    h03l04m04-p04.log-1-2.ko
+    h03l04m04-p04.log-1-2.ok
+    """
+    # Les lots d'un même fichier ont chacun leurs sorties, nommées d'après
+    # le fichier et les rangs concernés
+    nom = lot.chemin
+    if hasattr(lot, "lot"):
+        nom = f"{nom}-{lot.lot.début}-{lot.lot.nombre}"
+    nom_ok, nom_ko = identifier_sorties(nom)
     sortie_ok = écrivain(nom_ok, lot.base)
     sortie_ko = écrivain(nom_ko, lot.base)
 
     codec = Codec(lot.base)
     for code in lot:
-        grille = codec.décoder(code)
+        grille = codec.décoder_compacte(code)
         if grille.est_canonique():
             sortie_ok.ajouter(code)
         else:
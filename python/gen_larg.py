@@ -3,18 +3,25 @@
 """Générateur de grille complète
 """
 
+import collections
 import dataclasses
 import getopt
 import logging
+import multiprocessing
 import os.path
+import struct
 import sys
+import time
 
 from tectonic import Base
-from tectonic import Case
+from tectonic import GrilleCompacte
 from tectonic import Progrès
+from tectonic import fichier
 from tectonic.fichier import lecteur as get_lecteur
 from tectonic.fichier import écrivain as get_écrivain
 from tectonic.serial import Codec
+from tectonic.dédoublonnage import Partition
+from tectonic.statistiques import GÉNÉRATION
 from générateur import Analyseur
 from générateur import ProducteurProgrès
 from générateur import GénérateurGrilleVide
@@ -30,14 +37,21 @@ class Configuration:
     mono_palier: bool = False
     palier_max: int = None
     strict: bool = False
+    nb_processus: int = 1
+    nb_seaux: int = 0
+    mémoire: int = 2**30
+    empreintes: bool = False
 
     @staticmethod
     def charger():
         retour = Configuration()
-        opts, args = getopt.getopt(sys.argv[1:], "h:l:m:qs:", ["strict"])
+        opts, args = getopt.getopt(sys.argv[1:], "d:h:j:l:m:M:qs:",
+                                   ["empreintes", "strict"])
         for opt, val in opts:
             if opt == "--strict":
                 retour.strict = True
+            elif opt == "--empreintes":
+                retour.empreintes = True
             elif opt == "-q":
                 retour.mono_palier = True
             elif not val.isdecimal():
@@ -53,6 +67,12 @@ class Configuration:
                     retour.maximum = val
                 elif opt == "-s" and val > 0:
                     retour.palier_max = val
+                elif opt == "-j" and val > 0:
+                    retour.nb_processus = val
+                elif opt == "-d":
+                    retour.nb_seaux = val
+                elif opt == "-M" and val > 0:
+                    retour.mémoire = val * 2**20
         if len(args) != 0:
             retour.chemin = args[0]
 
@@ -68,56 +88,90 @@ class Configuration:
                     maximum=self.maximum)
 
 
+def est_transposé(conf, progrès):
+    """Vrai ssi le progrès est un résultat final aux dimensions interverties
+    """
+    return (progrès.hauteur == conf.largeur and progrès.largeur == conf.hauteur
+            and progrès.hauteur != progrès.largeur
+            and progrès.palier == progrès.hauteur * progrès.largeur)
+
+
 def identifier_meilleur_départ(conf):
     """Renvoie une paire (Progrès, str)
 
     Si str est différent de None, c'est un chemin d'accès à un fichier en
-    lecture
+    lecture. Un résultat final aux dimensions interverties est éligible : il
+    suffira de le transposer.
+
+    Les candidats sont les fichiers intègres du catalogue du dossier, mis à
+    jour au préalable. Un fichier non clos n'est retenu qu'à défaut de tout
+    fichier clos éligible.
     """
     meilleur_fichier = None
     meilleur_progrès = None
+    meilleur_transposé = False
+    meilleur_clos = None
     extension_min = None
 
     if not os.path.isdir(conf.chemin):
         os.makedirs(conf.chemin, mode=0o755)
-    else:
-        _, _, fichiers = next(os.walk(conf.chemin))
-        for f in fichiers:
-            p = Progrès.depuis_chaîne(f)
-            if p is not None:
-                éligible = False
-                if conf.strict:
-                    éligible = (p.largeur == conf.largeur
-                                and p.hauteur == conf.hauteur
-                                and p.maximum == conf.maximum)
-                elif p.maximum >= conf.maximum:
-                    if p.largeur == conf.largeur:
-                        if p.hauteur == conf.hauteur:
-                            éligible = True
-                        elif p.palier <= (min(p.hauteur, conf.hauteur) -
-                                          1) * p.largeur + 1:
-                            éligible = True
-                    elif p.palier < min(p.largeur, conf.largeur):
+    catalogue = fichier.cataloguer(conf.chemin)
+    for entrée in catalogue.entrées(intègre=True):
+        f = entrée.nom
+        p = entrée.progrès()
+        if p is not None:
+            éligible = False
+            if conf.strict:
+                éligible = (p.largeur == conf.largeur
+                            and p.hauteur == conf.hauteur
+                            and p.maximum == conf.maximum)
+            elif p.maximum >= conf.maximum:
+                if p.largeur == conf.largeur:
+                    if p.hauteur == conf.hauteur:
                         éligible = True
-                if éligible:
-                    # À choisir, on ne veut pas à avoir à modifier le nombre de
-                    # cases. Si ce n'est pas possible, on veut optimiser les
-                    # temps de chargement, ce qui signifie :
-                    # - s'il faut rajouter des cases, en ajouter le plus
-                    # possible ;
-                    # - s'il faut en retirer, en retirer le moins possible.
-                    extension = conf.base().nb_cases() - p.base().nb_cases()
-                    if (meilleur_fichier is None
-                            or p.palier > meilleur_progrès.palier
-                            or (p.palier == meilleur_progrès.palier and
-                                (p.maximum < meilleur_progrès.maximum or
-                                 (p.maximum == meilleur_progrès.maximum and
-                                  (extension == 0 or
-                                   (extension_min != 0
-                                    and extension > extension_min)))))):
-                        meilleur_progrès = p
-                        meilleur_fichier = f
-                        extension_min = extension
+                    elif p.palier <= (min(p.hauteur, conf.hauteur) -
+                                      1) * p.largeur + 1:
+                        éligible = True
+                elif p.palier < min(p.largeur, conf.largeur):
+                    éligible = True
+                elif est_transposé(conf, p):
+                    éligible = True
+            if éligible:
+                # À choisir, on ne veut pas à avoir à modifier le nombre de
+                # cases. Si ce n'est pas possible, on veut optimiser les
+                # temps de chargement, ce qui signifie :
+                # - s'il faut rajouter des cases, en ajouter le plus
+                # possible ;
+                # - s'il faut en retirer, en retirer le moins possible.
+                # À mérite égal, on évite la transposition.
+                # Un fichier clos l'emporte toujours sur un fichier qui ne
+                # l'est pas, possiblement interrompu.
+                extension = conf.base().nb_cases() - p.base().nb_cases()
+                transposé = est_transposé(conf, p)
+                clos = bool(entrée.clos)
+                if meilleur_fichier is not None and clos != meilleur_clos:
+                    meilleur = clos
+                else:
+                    meilleur = (
+                        meilleur_fichier is None
+                        or p.palier > meilleur_progrès.palier
+                        or (p.palier == meilleur_progrès.palier and
+                            (p.maximum < meilleur_progrès.maximum or
+                             (p.maximum == meilleur_progrès.maximum and
+                              ((extension == 0 and
+                                (meilleur_transposé or not transposé))
+                               or (extension_min != 0
+                                   and extension > extension_min))))))
+                if meilleur:
+                    meilleur_progrès = p
+                    meilleur_fichier = f
+                    meilleur_transposé = transposé
+                    meilleur_clos = clos
+                    extension_min = extension
+
+    if meilleur_fichier is not None and not meilleur_clos:
+        logging.warning(f"«{meilleur_fichier}» n'a pas été clos : il peut "
+                        f"s'agir d'un palier interrompu")
 
     if meilleur_fichier is None:
         return (Progrès(hauteur=conf.hauteur,
@@ -128,6 +182,19 @@ def identifier_meilleur_départ(conf):
         return (meilleur_progrès, meilleur_fichier)
 
 
+def transposer(conf, progrès, nom_fichier):
+    logging.info(f"Transposition depuis «{nom_fichier}»")
+
+    progrès = Progrès(hauteur=progrès.largeur,
+                      largeur=progrès.hauteur,
+                      maximum=progrès.maximum)
+    nom_transposé = str(progrès) + ".log"
+    fichier.transposer(os.path.join(conf.chemin, nom_fichier),
+                       os.path.join(conf.chemin, nom_transposé))
+
+    return progrès, nom_transposé
+
+
 def convertir(conf, progrès, nom_fichier):
     logging.info(f"Conversion depuis «{nom_fichier}»")
 
@@ -136,13 +203,7 @@ def convertir(conf, progrès, nom_fichier):
     décodeur = Codec(progrès.base())
 
     filtrage_case_par_case = (progrès.maximum != conf.maximum)
-    extension = conf.base().nb_cases() - progrès.base().nb_cases()
-    if extension <= 0:
-        cases_ext = None
-    else:
-        cases_ext = [None] * extension
-        for i in range(extension):
-            cases_ext[i] = Case()
+    nb_cases = min(conf.base().nb_cases(), progrès.base().nb_cases())
 
     # Configuration de l'écriture
     progrès = Progrès(hauteur=conf.hauteur,
@@ -155,27 +216,23 @@ def convertir(conf, progrès, nom_fichier):
                             progrès.base())
 
     # Conversion à la volée des codes
+    base = progrès.base()
     for code in lecteur:
-        grille = décodeur.décoder(code)
+        grille = décodeur.décoder_préfixe(code, progrès.palier)
 
         retenu = True
         if filtrage_case_par_case:
-            for case in grille.cases[:progrès.palier]:
-                if case.valeur > conf.maximum:
-                    retenu = False
-                    break
-            else:
-                grille.base.maximum = conf.maximum
+            retenu = (max(grille.valeurs[:progrès.palier], default=0) <=
+                      conf.maximum)
 
         if retenu:
-            grille.base.hauteur = conf.hauteur
-            grille.base.largeur = conf.largeur
-            if extension > 0:
-                grille.cases.extend(cases_ext)
-            elif extension < 0:
-                del grille.cases[extension:]
-
-            code = encodeur.encoder(grille)
+            # Les cases ajoutées restent indéfinies, les cases retirées sont
+            # ignorées
+            conversion = GrilleCompacte(base)
+            conversion.valeurs[:nb_cases] = grille.valeurs[:nb_cases]
+            conversion.régions[:nb_cases] = grille.régions[:nb_cases]
+
+            code = encodeur.encoder(conversion)
             écrivain.ajouter(code)
     écrivain.clore()
 
@@ -188,7 +245,6 @@ class Chercheur:
         self.conf = conf
         self.progrès = progrès
         self.nom_fichier = nom_fichier
-        self.codec = Codec(progrès.base())
 
         self.nuls = 0
         self.consommés = 0
@@ -222,42 +278,134 @@ class Chercheur:
             # Statistiques
             self.consommés = 0
             self.nuls = 0
-
-            # Génération
-            pp = ProducteurProgrès(self.progrès)
-            for code in lecteur:
-                self.consommés += 1
-                nouveaux = list(pp.itérer(code))
-
-                if len(nouveaux) == 0:
-                    # logging.warning(f"Le code {code} est nullipare")
-                    self.nuls += 1
-                for neuf in nouveaux:
-                    if (self.progrès.palier != base.nb_cases() - 1
-                            or self.valider(neuf)):
-                        écrivain.ajouter(neuf)
-
-            # Itération
+            succès = 0
+            échecs = 0
+            début = time.perf_counter()
+
+            # Dédoublonnage éventuel, les grilles filles étant d'abord
+            # réparties entre des seaux sur disque
+            partition = None
+            if self.conf.nb_seaux > 0:
+                partition = Partition(self.progrès.base(),
+                                      self.conf.chemin,
+                                      self.conf.nb_seaux,
+                                      mémoire=self.conf.mémoire,
+                                      nb_processus=self.conf.nb_processus,
+                                      empreintes=self.conf.empreintes)
+
+            # Génération, les grilles filles étant écrites dans l'ordre des
+            # paquets de codes parents
+            validation = self.progrès.palier == base.nb_cases() - 1
+            destination = écrivain if partition is None else partition
+            for nb_codes, nouveaux, nuls, consultations in self.générer(
+                    lecteur, validation):
+                self.consommés += nb_codes
+                self.nuls += nuls
+                succès += consultations[0]
+                échecs += consultations[1]
+                destination.ajouter_lot(nouveaux)
+
+            if partition is not None:
+                for paquet in partition.dédoublonner():
+                    écrivain.ajouter_lot(paquet)
+                logging.info(f"Palier n°{self.progrès.palier} : "
+                             f"{partition.doublons} doublons retirés")
+
+            durée = time.perf_counter() - début
+
+            # Itération, les statistiques de génération étant conservées
+            # dans le pied du fichier
+            écrivain.sections[GÉNÉRATION] = struct.pack(
+                ">QQ", self.consommés, self.nuls)
             logging.info(
                 f"Palier n°{self.progrès.palier} atteint : "
                 f"{écrivain.nb_codes} grilles "
                 f"(×{écrivain.nb_codes/self.consommés:.2f}) "
                 f"et {self.nuls/self.consommés:.2%} nuls "
                 f"→ ×{écrivain.nb_codes/(self.consommés-self.nuls):.2f}")
+            logging.info(
+                f"Palier n°{self.progrès.palier} généré en {durée:.2f} s "
+                f"par {self.conf.nb_processus} processus : "
+                f"{écrivain.nb_codes/max(durée, 1e-9):.0f} grilles/s, "
+                f"{succès/max(1, succès + échecs):.2%} des développements "
+                f"trouvés en cache")
             écrivain.clore()
 
             # Génération d'un seul palier demandée
             if self.conf.mono_palier:
                 break
 
-    def valider(self, code):
-        retour = True
-        grille = self.codec.décoder(code)
-        analyseur = Analyseur(grille)
-        for r in analyseur.régions.values():
-            if r.est_anormal():
-                retour = False
-        return retour
+    def générer(self, lecteur, validation):
+        """Itérateur des quadruplets (nombre de codes parents, grilles
+        filles, nombre de parents nullipares, consultations du cache de
+        développements), paquet par paquet, dans l'ordre
+
+        Avec plusieurs processus, au plus deux paquets par processus sont en
+        cours de traitement : la mémoire consommée ne dépend pas de la taille
+        du palier.
+        """
+        arguments = (self.progrès, validation)
+        if self.conf.nb_processus == 1:
+            _préparer_génération(*arguments)
+            for paquet in fichier.paquets(lecteur, TAILLE_PAQUET):
+                yield _générer_paquet(paquet)
+            return
+
+        with multiprocessing.Pool(self.conf.nb_processus,
+                                  _préparer_génération, arguments) as pool:
+            en_cours = collections.deque()
+            for paquet in fichier.paquets(lecteur, TAILLE_PAQUET):
+                en_cours.append(pool.apply_async(_générer_paquet,
+                                                 (paquet, )))
+                if len(en_cours) > 2 * self.conf.nb_processus:
+                    yield en_cours.popleft().get()
+            while len(en_cours) > 0:
+                yield en_cours.popleft().get()
+
+
+# Nombre de codes parents confiés d'un coup à un processus de génération
+TAILLE_PAQUET = 2**12
+
+# Producteur et codec de validation propres à chaque processus de génération
+_GÉNÉRATION = None
+
+
+def _préparer_génération(progrès, validation):
+    global _GÉNÉRATION
+    _GÉNÉRATION = (ProducteurProgrès(progrès),
+                   Codec(progrès.base()) if validation else None)
+
+
+def _générer_paquet(paquet):
+    producteur, codec = _GÉNÉRATION
+    retour = list()
+    nuls = 0
+    succès, échecs = producteur.consultations()
+    for code in paquet:
+        nouveaux = list(producteur.itérer(code))
+
+        if len(nouveaux) == 0:
+            # logging.warning(f"Le code {code} est nullipare")
+            nuls += 1
+        if codec is not None:
+            nouveaux = [n for n in nouveaux if valider(codec, n)]
+        retour.extend(nouveaux)
+
+    consultations = producteur.consultations()
+    return (len(paquet), retour, nuls,
+            (consultations[0] - succès, consultations[1] - échecs))
+
+
+def valider(codec, code):
+    """Vrai si aucune région de la grille n'est anormale
+    """
+    retour = True
+    grille = codec.décoder_compacte(code)
+    analyseur = Analyseur(grille)
+    for r in analyseur.régions.values():
+        if r.est_anormal():
+            retour = False
+    return retour
 
 
 if __name__ == "__main__":
@@ -269,7 +417,9 @@ if __name__ == "__main__":
     # Chargement du meilleur contexte
     PROGRÈS, NOM_FICHIER = identifier_meilleur_départ(CONF)
 
-    # Conversion si nécessaire
+    # Transposition, puis conversion si nécessaire
+    if est_transposé(CONF, PROGRÈS):
+        PROGRÈS, NOM_FICHIER = transposer(CONF, PROGRÈS, NOM_FICHIER)
     if PROGRÈS.base() != CONF.base():
         PROGRÈS, NOM_FICHIER = convertir(CONF, PROGRÈS, NOM_FICHIER)
         assert PROGRÈS.base() == CONF.base()
@@ -182,7 +182,7 @@ class Chercheur:
                     niveaux[k].générateur = enumerate(
                         niveaux[k].producteur.itérer(code))
                 else:
-                    grille = niveaux[k].producteur.codec.décoder(code)
+                    grille = niveaux[k].producteur.codec.décoder_compacte(code)
                     analyse = Analyseur(grille)
                     for r in analyse.régions.values():
                         if r.est_anormal():
@@ -3,9 +3,13 @@
 """
 
 import dataclasses
+import functools
 import itertools
 
 from tectonic import Grille
+from tectonic import GrilleCompacte
+from tectonic import Progrès
+from tectonic import topologie
 from tectonic.serial import Codec
 
 
@@ -72,18 +76,23 @@ class Analyseur:
     def _calculer(self):
         bords = dict()
 
-        for i, case in enumerate(self.g.cases):
-            r1 = case.région
+        topo = topologie(self.g.base)
+        if isinstance(self.g, GrilleCompacte):
+            valeurs = self.g.valeurs
+            régions = self.g.régions
+        else:
+            valeurs = [c.valeur for c in self.g.cases]
+            régions = [c.région for c in self.g.cases]
+
+        for i, r1 in enumerate(régions):
             if r1 >= 0:
-                if case.valeur > 0:
-                    self.régions.setdefault(r1,
-                                            Région()).valeurs.add(case.valeur)
-
-                h1, l1 = self.g.base.en_position(i)
-                for h2, l2 in [(h1, l1 + 1), (h1 + 1, l1)]:
-                    if (h2 < self.g.base.hauteur and l2 < self.g.base.largeur):
-                        j = self.g.base.en_index(hauteur=h2, largeur=l2)
-                        r2 = self.g.cases[j].région
+                valeur = valeurs[i]
+                if valeur > 0:
+                    self.régions.setdefault(r1, Région()).valeurs.add(valeur)
+
+                for j in (topo.droite[i], topo.bas[i]):
+                    if j >= 0:
+                        r2 = régions[j]
                         if r2 < 0:
                             bords.setdefault(r1, set()).add(j)
                         elif r2 != r1:
@@ -119,93 +128,244 @@ class GénérateurGrilleVide:
             return self.code
 
 
+# Genres de développement d'une grille, voir `ProducteurProgrès`
+_EXTENSION, _NOUVELLE, _FUSION = range(3)
+
+
 class ProducteurProgrès:
     """Produit des grilles *pour* un certain palier, à partir d'un code issu
     du palier précédent
+
+    Chaque grille n'est produite qu'une fois, à partir d'un palier sans
+    doublon : aucun dédoublonnage n'est nécessaire.
+
+    - Les régions restent connexes au sein des cases définies. Une grille
+      n'a donc qu'un parent possible : celui dont les régions sont les
+      composantes connexes des siennes, privées de la dernière case.
+    - D'un même parent, les trois façons de rattacher la nouvelle case (à une
+      région existante, à une nouvelle région, ou à la fusion de deux
+      régions) donnent des découpages différents.
+    - Les régions sont numérotées dans l'ordre d'apparition : une grille n'a
+      qu'un code.
+
+    C'est ce que vérifient `dénombrer`, et la comparaison des `paliers` avec
+    ceux produits en fusionnant aussi les régions déjà limitrophes, puis
+    dédoublonnés : aucune grille n'est perdue.
+
+    Les grilles produites ne dépendent que de la frontière de la case à
+    placer : valeurs des cases voisines déjà placées, et résumé des régions
+    de la case du dessus et de celle de gauche (valeurs, bordure réduite à
+    une case, contact entre elles). Une région ne comptant pas plus de
+    cases que de valeurs, ces régions sont parcourues localement, sans
+    analyser toute la grille. Les développements sont mémorisés par
+    signature de frontière, dans un cache LRU de 'taille_cache' entrées.
+
+    'fusion_limitrophes' rétablit la fusion des régions déjà limitrophes,
+    source de doublons : elle ne sert qu'à la vérification.
     """
 
-    def __init__(self, progrès):
+    def __init__(self, progrès, taille_cache=2**14, *,
+                 fusion_limitrophes=False):
         self.palier = progrès.palier
+        self.fusion_limitrophes = fusion_limitrophes
         self.codec = Codec(progrès.base())
+        self.topologie = topologie(self.codec.base)
+        self._développements = functools.lru_cache(maxsize=taille_cache)(
+            self._développer)
 
-    def itérer(self, code):
-        """Itérateur des grilles du palier suivant
+    def consultations(self):
+        """Nombre de développements trouvés dans le cache, et nombre de
+        développements calculés
         """
-        grille = self.codec.décoder(code)
-        analyseur = Analyseur(grille)
+        infos = self._développements.cache_info()
+        return infos.hits, infos.misses
 
-        i = self.palier - 1
-        h, l = grille.base.en_position(i)
-
-        # Régions à compléter
-        régions = set()
-        # → case du dessus
-        if h > 0:
-            régions.add(grille[(h - 1, l)].région)
-        # → case de gauche
-        if l > 0:
-            régions.add(grille[(h, l - 1)].région)
-        régions = sorted(régions)
+    def _région(self, grille, départ, i):
+        """Cases de la région de la case 'départ', parmi les 'i' premières,
+        et cases indéfinies qui la bordent
+        """
+        régions = grille.régions
+        orthogonaux = self.topologie.orthogonaux
+        région = régions[départ]
+        cases = {départ}
+        bords = set()
+        pile = [départ]
+        while len(pile) > 0:
+            for j in orthogonaux[pile.pop()]:
+                if j >= i:
+                    bords.add(j)
+                elif j not in cases and régions[j] == région:
+                    cases.add(j)
+                    pile.append(j)
+        return cases, bords
+
+    def _signature(self, grille, i):
+        """Signature de la frontière de la case 'i', et numéros des régions
+        qu'elle concerne, par ordre croissant
+
+        Les valeurs d'une région y sont représentées par un masque de bits.
+        """
+        topo = self.topologie
+        départs = dict()
+        for j in (topo.haut[i], topo.gauche[i]):
+            if j >= 0:
+                départs.setdefault(grille.régions[j], j)
+        régions = sorted(départs)
+
+        résumés = list()
+        ensembles = list()
+        for r in régions:
+            cases, bords = self._région(grille, départs[r], i)
+            masque = 0
+            for c in cases:
+                masque |= 1 << grille.valeurs[c]
+            résumés.append((masque, len(bords) == 1))
+            ensembles.append(cases)
+
+        limitrophes = len(ensembles) == 2 and any(
+            j in ensembles[1] for c in ensembles[0]
+            for j in topo.orthogonaux[c])
+
+        précédents = tuple(grille.valeurs[j] for j in topo.précédents[i])
+        return (précédents, tuple(résumés), limitrophes), régions
+
+    def _développer(self, signature):
+        """Développements d'une frontière : liste de triplets (genre, rang
+        de la région concernée, valeurs possibles)
+        """
+        précédents, résumés, limitrophes = signature
+        maximum = self.codec.base.maximum
+        régions = [
+            Région(valeurs={
+                v
+                for v in range(1, maximum + 1) if masque >> v & 1
+            }) for masque, _ in résumés
+        ]
+        fermables = [
+            bordure_unique and r.est_incomplète()
+            for r, (_, bordure_unique) in zip(régions, résumés)
+        ]
 
         # Calcul des valeurs possibles au maximum, selon la règle du voisinage
-        valeurs_possibles = set(range(1, grille.base.maximum + 1))
-        if l > 0:
-            valeurs_possibles.discard(grille[(h, l - 1)].valeur)
-        if h > 0:
-            valeurs_possibles.discard(grille[(h - 1, l)].valeur)
-            if l > 0:
-                valeurs_possibles.discard(grille[(h - 1, l - 1)].valeur)
-            if l + 1 < grille.base.largeur:
-                valeurs_possibles.discard(grille[(h - 1, l + 1)].valeur)
+        # avec les cases déjà placées
+        valeurs_possibles = set(range(1, maximum + 1))
+        for v in précédents:
+            valeurs_possibles.discard(v)
+
+        retour = list()
 
         # 1) On étend chacune des régions de toutes les façons possibles
         if len(régions) == 1:
-            r = régions[0]
-            valeurs = valeurs_possibles.difference(
-                analyseur.régions[r].valeurs)
-            for v in valeurs:
-                grille.cases[i].région = r
-                grille.cases[i].valeur = v
-                yield self.codec.encoder(grille)
+            valeurs = valeurs_possibles.difference(régions[0].valeurs)
+            retour.append((_EXTENSION, 0, tuple(valeurs)))
         else:
-            for r1, r2 in itertools.permutations(régions, 2):
-                # On vérifie qu'on ne rendrait pas «r2» incomplète de toute
+            for k1, k2 in itertools.permutations(range(len(régions)), 2):
+                # On vérifie qu'on ne rendrait pas «k2» incomplète de toute
                 # pièce
-                if not (analyseur.régions[r2].bordure == 1
-                        and analyseur.régions[r2].est_incomplète()):
+                if not fermables[k2]:
                     valeurs = valeurs_possibles.difference(
-                        analyseur.régions[r1].valeurs)
-                    for v in valeurs:
-                        grille.cases[i].région = r1
-                        grille.cases[i].valeur = v
-                        yield self.codec.encoder(grille)
+                        régions[k1].valeurs)
+                    retour.append((_EXTENSION, k1, tuple(valeurs)))
 
         # 2) On crée une toute nouvelle région, en veillant à ce qu'elle ne
         # puisse pas être incomplète
-        for r in régions:
-            if (analyseur.régions[r].bordure == 1
-                    and analyseur.régions[r].est_incomplète()):
-                break
-        else:
-            for v in valeurs_possibles:
-                grille.cases[i].région = analyseur.région_max() + 1
-                grille.cases[i].valeur = v
-                yield self.codec.encoder(grille)
-
-        # 3) On fusionne les régions voisines
-        for r1, r2 in itertools.combinations(régions, 2):
-            if (r2 not in analyseur.régions[r1].voisins
-                    and analyseur.régions[r1].valeurs.isdisjoint(
-                        analyseur.régions[r2].valeurs)):
-                valeurs = valeurs_possibles.difference(
-                    analyseur.régions[r1].valeurs)
-                valeurs.difference_update(analyseur.régions[r2].valeurs)
-                if len(valeurs) > 0:
-                    for case in grille.cases:
-                        if case.région == r2:
-                            case.région = r1
-                    grille.cases[i].région = r1
-                    grille.normaliser()
-                    for v in valeurs:
-                        grille.cases[i].valeur = v
-                        yield self.codec.encoder(grille)
+        if not any(fermables):
+            retour.append((_NOUVELLE, None, tuple(valeurs_possibles)))
+
+        # 3) On fusionne les régions voisines. Deux régions déjà limitrophes
+        # ne sont pas fusionnées : la grille obtenue est celle issue de
+        # l'extension d'un autre parent, où elles ne forment qu'une région
+        if (len(régions) == 2
+                and (self.fusion_limitrophes or not limitrophes)
+                and régions[0].valeurs.isdisjoint(régions[1].valeurs)):
+            valeurs = valeurs_possibles.difference(régions[0].valeurs)
+            valeurs.difference_update(régions[1].valeurs)
+            if len(valeurs) > 0:
+                retour.append((_FUSION, None, tuple(valeurs)))
+
+        return retour
+
+    def itérer(self, code):
+        """Itérateur des grilles du palier suivant
+        """
+        # Seules les cases des paliers précédents sont définies
+        i = self.palier - 1
+        grille = self.codec.décoder_préfixe(code, i)
+        signature, régions = self._signature(grille, i)
+
+        # Les grilles produites ne diffèrent de la grille d'origine que par la
+        # case 'i' : leurs codes sont calculés par incrément
+        codec = self.codec
+        for genre, k, valeurs in self._développements(signature):
+            if genre == _EXTENSION:
+                for v in valeurs:
+                    yield codec.encoder_incrément(code,
+                                                  i,
+                                                  valeur=v,
+                                                  région=régions[k])
+            elif genre == _NOUVELLE:
+                # Les régions étant numérotées dans l'ordre d'apparition, la
+                # nouvelle région suit la dernière
+                nouvelle = codec.encoder_incrément(
+                    code, i, région=code % codec.pad_dimension - 1)
+                for v in valeurs:
+                    yield codec.encoder_incrément(nouvelle, i, valeur=v)
+            else:
+                # La renumérotation impose un encodage complet, mais une
+                # seule fois pour toutes les valeurs
+                r1, r2 = régions
+                for j, r in enumerate(grille.régions):
+                    if r == r2:
+                        grille.régions[j] = r1
+                grille.régions[i] = r1
+                grille.normaliser()
+                fusion = codec.encoder(grille)
+                for v in valeurs:
+                    yield codec.encoder_incrément(fusion, i, valeur=v)
+
+
+def paliers(base, fusion_limitrophes=False):
+    """Itérateur des listes de codes produites, palier par palier, à partir
+    de la grille vide
+
+    Avec 'fusion_limitrophes', chaque palier est dédoublonné avant de
+    produire le suivant, comme le faisait la génération à sa suite.
+
+    >>> from tectonic import Base
+    >>> bases = [Base(hauteur=h, largeur=l, maximum=m)
+    ...          for h in range(1, 4) for l in range(1, 4) for m in (2, 3, 4)]
+    >>> all(set(codes) == set(référence)
+    ...     for base in bases for codes, référence in zip(
+    ...         paliers(base), paliers(base, fusion_limitrophes=True)))
+    True
+    """
+    codes = list(GénérateurGrilleVide(base))
+    for palier in range(1, base.nb_cases() + 1):
+        producteur = ProducteurProgrès(Progrès(hauteur=base.hauteur,
+                                               largeur=base.largeur,
+                                               maximum=base.maximum,
+                                               palier=palier),
+                                       fusion_limitrophes=fusion_limitrophes)
+        codes = [
+            enfant for code in codes for enfant in producteur.itérer(code)
+        ]
+        if fusion_limitrophes:
+            codes = list(set(codes))
+        yield codes
+
+
+def dénombrer(base):
+    """Liste, palier par palier, du nombre de grilles produites à partir de
+    la grille vide, et du nombre de grilles distinctes parmi elles
+
+    Tous les paliers sont produits en mémoire, sans dédoublonnage : ce
+    dénombrement exhaustif est réservé aux petites bases.
+
+    >>> from tectonic import Base
+    >>> bases = [Base(hauteur=h, largeur=l, maximum=m)
+    ...          for h in range(1, 4) for l in range(1, 4) for m in (2, 3, 4)]
+    >>> all(produits == distincts
+    ...     for base in bases for produits, distincts in dénombrer(base))
+    True
+    """
+    return [(len(codes), len(set(codes))) for codes in paliers(base)]
@@ -10,6 +10,7 @@ from tectonic.serial import Codec
 class Traitement:
 
     def __init__(self, conf):
+        self.conf = conf
         self.lots = conf.lots
         self.debug = conf.debug
         self.saut_requis = False
@@ -17,7 +18,7 @@ class Traitement:
     def afficher(self):
         for lot in self.lots:
             codec = Codec(lot.base)
-            for code in lot:
+            for code in self.conf.codes(lot):
                 grille = codec.décoder(code)
                 self.afficher_grille(grille)
 
@@ -5,10 +5,44 @@
 
 import logging
 
+import numpy
+
 from commun import Configuration
+from tectonic.fichier import paquets
 from tectonic.serial import Codec
 
 
+def normaux(codec, codes):
+    """Tableau de booléens, vrai pour chaque code identifiant une grille en
+    forme normale
+
+    Équivaut à `Codec.est_normal_code`, appliqué à tout le lot à la fois :
+
+    >>> from tectonic import Base
+    >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+    >>> codes = [45665103876, 1,
+    ...          codec.encoder_incrément(45665103876, 6, région=4),
+    ...          codec.encoder_incrément(45665103876, 6, région=2),
+    ...          45665103876 + 1]
+    >>> normaux(codec, codes).tolist()
+    [True, True, False, True, False]
+    >>> [codec.est_normal_code(code) for code in codes]
+    [True, True, False, True, False]
+    """
+    # Les régions sont décalées d'une unité : une région est en forme normale
+    # si elle ne dépasse pas de plus d'une unité les précédentes
+    _, régions = codec.décoder_lot(codes)
+    régions = régions.astype(numpy.int16)
+    maxima = numpy.maximum.accumulate(régions, axis=1)
+    précédents = numpy.zeros_like(maxima)
+    précédents[:, 1:] = maxima[:, :-1]
+    ordonnées = numpy.all(régions <= précédents + 1, axis=1)
+
+    # `pad_région` correspond au nombre de régions
+    pads = numpy.array([code % codec.pad_dimension for code in codes])
+    return ordonnées & (maxima[:, -1] + 1 == pads)
+
+
 class Traitement:
 
     def __init__(self, conf):
@@ -18,15 +52,11 @@ class Traitement:
     def afficher(self):
         for lot in self.lots:
             codec = Codec(lot.base)
-            for code in lot:
-                self.tester(code, codec)
-
-    def tester(self, code, codec):
-        grille = codec.décoder(code)
-        grille.normaliser()
-        nouveau = codec.encoder(grille)
-        if nouveau != code:
-            self.afficher_code(code)
+            for paquet in paquets(lot):
+                for code, normal in zip(paquet,
+                                        normaux(codec, paquet).tolist()):
+                    if not normal:
+                        self.afficher_code(code)
 
     def afficher_code(self, code):
         if self.saut_requis:
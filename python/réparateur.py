@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Vérifie, et au besoin répare, des fichiers au format n°1
+
+Un fichier interrompu en cours d'écriture est tronqué après son dernier bloc
+valide. Avec -n, les fichiers sont seulement vérifiés.
+
+  réparateur.py [-n] fichier…
+"""
+
+import getopt
+import logging
+import sys
+
+from tectonic import fichier_001
+from tectonic.fichier import lecteur
+
+
+class Réparateur:
+
+    def __init__(self, vérification_seule=False, chemins=list()):
+        self.vérification_seule = vérification_seule
+        self.chemins = chemins
+
+    @staticmethod
+    def charger():
+        retour = Réparateur()
+        opts, args = getopt.getopt(sys.argv[1:], "n")
+        for opt, _ in opts:
+            if opt == "-n":
+                retour.vérification_seule = True
+        retour.chemins[:] = args
+
+        return retour
+
+    def traiter(self, chemin):
+        entrée = lecteur(chemin)
+        if entrée is None or entrée.FORMAT != fichier_001.Écrivain.FORMAT:
+            logging.warning(f"«{chemin}» ignoré : format non pris en charge")
+            return
+
+        if fichier_001.vérifier(chemin):
+            logging.info(f"«{chemin}» intègre : {len(entrée)} codes")
+        elif self.vérification_seule:
+            logging.warning(f"«{chemin}» corrompu")
+        else:
+            nb_codes = fichier_001.réparer(chemin)
+            logging.warning(f"«{chemin}» réparé : {nb_codes} codes conservés")
+
+    def lancer(self):
+        for chemin in self.chemins:
+            self.traiter(chemin)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    RÉPARATEUR = Réparateur.charger()
+    RÉPARATEUR.lancer()
@@ -13,6 +13,7 @@ import logging
 import random
 
 from commun import Configuration
+from tectonic import topologie
 from tectonic.serial import Codec
 
 
@@ -76,16 +77,9 @@ class GrilleNavigable:
             région.cases.append(self.cases[i])
 
         # Voisinages
+        voisins = topologie(self.base).voisins
         for i, case in enumerate(self.cases):
-            h, l = self.base.en_position(i)
-            self._ajouter_voisin(case, h + 1, l)
-            self._ajouter_voisin(case, h + 1, l + 1)
-            self._ajouter_voisin(case, h + 1, l - 1)
-            self._ajouter_voisin(case, h, l + 1)
-            self._ajouter_voisin(case, h, l - 1)
-            self._ajouter_voisin(case, h - 1, l)
-            self._ajouter_voisin(case, h - 1, l + 1)
-            self._ajouter_voisin(case, h - 1, l - 1)
+            case.voisins.extend(self.cases[j] for j in voisins[i])
 
         # Initialisation des possibles
         for case in self.cases:
@@ -107,13 +101,6 @@ class GrilleNavigable:
         index = self.base.en_index(hauteur=h, largeur=l)
         self.cases[index] = valeur
 
-    def _ajouter_voisin(self, case, h, l):
-        """Ajoute la case de coordonnées (h, l) aux voisins de la case
-        si ces coordonnées sont valides
-        """
-        if (0 <= h < self.base.hauteur and 0 <= l < self.base.largeur):
-            case.voisins.append(self[(h, l)])
-
 
 class Traitement:
 
@@ -4,18 +4,16 @@
 import logging
 
 from commun import Configuration
-from tectonic.serial import Codec
+from tectonic.fichier import statistiques
 
 
 def déterminer_nb_régions(conf):
     nb_régions = dict()
 
     for lot in conf.lots:
-        codec = Codec(lot.base)
-        for code in lot:
-            grille = codec.décoder(code)
-            n = grille.nb_régions()
-            nb_régions[n] = nb_régions.get(n, 0) + 1
+        # Le pied du fichier en dispense, sinon les codes sont parcourus
+        for n, nombre in statistiques(lot).régions.items():
+            nb_régions[n] = nb_régions.get(n, 0) + nombre
 
     for n in sorted(nb_régions):
         print(f"{n} régions : {nb_régions[n]}")
@@ -2,6 +2,8 @@
 """Éléments de base pour la manipulation de grilles de Tectonic
 """
 
+import array
+import copy
 import dataclasses
 import re
 
@@ -122,6 +124,101 @@ class BaseDiagonale:
 Base = BaseLinéaire
 
 
+class Topologie:
+    """Voisinages précalculés des cases d'une Base
+
+    Toutes les tables sont des tuples indexés par index de case, dans l'ordre
+    de la Base. L'absence de voisin est représentée par -1.
+
+    Une Topologie ne dépend que des dimensions et de l'ordre des cases : elle
+    est partagée par toutes les Bases concernées, via `topologie(base)`.
+    """
+
+    def __init__(self, base):
+        hauteur = base.hauteur
+        largeur = base.largeur
+        nb_cases = base.nb_cases()
+
+        # Conversions index ↔ position
+        self.positions = tuple(base.en_position(i) for i in range(nb_cases))
+        self.index = tuple(
+            tuple(base.en_index(hauteur=h, largeur=l) for l in range(largeur))
+            for h in range(hauteur))
+
+        def voisin(h, l):
+            if 0 <= h < hauteur and 0 <= l < largeur:
+                return self.index[h][l]
+            return -1
+
+        # Voisinages élémentaires
+        self.haut = tuple(voisin(h - 1, l) for h, l in self.positions)
+        self.bas = tuple(voisin(h + 1, l) for h, l in self.positions)
+        self.gauche = tuple(voisin(h, l - 1) for h, l in self.positions)
+        self.droite = tuple(voisin(h, l + 1) for h, l in self.positions)
+        self.orthogonaux = tuple(
+            tuple(j for j in (self.haut[i], self.gauche[i], self.droite[i],
+                              self.bas[i]) if j >= 0)
+            for i in range(nb_cases))
+
+        # Voisinage des 8 cases alentour
+        self.voisins = tuple(
+            tuple(
+                voisin(h + dh, l + dl) for dh in (-1, 0, 1)
+                for dl in (-1, 0, 1)
+                if (dh, dl) != (0, 0) and voisin(h + dh, l + dl) >= 0)
+            for h, l in self.positions)
+
+        # Voisins déjà placés quand on place la case i (palier i + 1)
+        self.précédents = tuple(
+            tuple(j for j in self.voisins[i] if j < i)
+            for i in range(nb_cases))
+
+        # Symétries de la grille (groupe D2, ou D4 pour une grille carrée)
+        # Pour chacune, symétrie[i] est l'index de la case qui occupe la
+        # position i une fois la symétrie appliquée. L'identité est en tête.
+        H = hauteur - 1
+        L = largeur - 1
+        transformations = [
+            lambda h, l: (h, l),
+            lambda h, l: (h, L - l),
+            lambda h, l: (H - h, l),
+            lambda h, l: (H - h, L - l),
+        ]
+        if hauteur == largeur:
+            transformations.extend([
+                lambda h, l: (l, h),
+                lambda h, l: (L - l, h),
+                lambda h, l: (l, H - h),
+                lambda h, l: (L - l, H - h),
+            ])
+        self.symétries = tuple(
+            tuple(self.index[hs][ls]
+                  for hs, ls in (f(h, l) for h, l in self.positions))
+            for f in transformations)
+
+        # transposition[i] est l'index de la case qui occupe la position i
+        # une fois la Base transposée
+        duale = copy.deepcopy(base)
+        duale.transposer()
+        self.transposition = tuple(
+            self.index[l][h]
+            for h, l in (duale.en_position(i) for i in range(nb_cases)))
+
+
+_TOPOLOGIES = dict()
+
+
+def topologie(base):
+    """Topologie partagée par toutes les Bases de mêmes caractéristiques
+    """
+    clef = (type(base), base.largeur, base.hauteur)
+    retour = _TOPOLOGIES.get(clef)
+    if retour is None:
+        retour = Topologie(base)
+        _TOPOLOGIES[clef] = retour
+    return retour
+
+
 class Progrès:
     """Progrès de recherche : base & palier atteints
     """
@@ -173,6 +270,57 @@ class Case:
     région: int = -1
 
 
+class Identité:
+    """Identité d'une grille, destinée aux conteneurs de dédoublonnage
+
+    Deux grilles de mêmes dimensions ont la même identité ssi leurs cases
+    sont identiques. Seules les dimensions et les cases, rangées dans un
+    unique `bytes`, sont conservées : l'objet est immuable et léger.
+    """
+
+    __slots__ = ("dimensions", "cases")
+
+    def __init__(self, base, valeurs, régions):
+        self.dimensions = (base.hauteur, base.largeur, base.maximum)
+        self.cases = valeurs.tobytes() + régions.tobytes()
+
+    def __eq__(self, autre):
+        return (self.cases == autre.cases
+                and self.dimensions == autre.dimensions)
+
+    def __hash__(self):
+        return hash(self.cases)
+
+
+def comparer_images(valeurs, régions, image_a, image_b):
+    """Compare deux images d'une même grille par des permutations de cases
+
+    L'ordre est lexicographique, d'abord sur les valeurs puis, à valeurs
+    égales, sur les régions renumérotées en forme normale. Le résultat est
+    négatif, nul ou positif selon que l'image 'a' est plus petite, égale ou
+    plus grande que l'image 'b'. La comparaison s'arrête à la première
+    différence rencontrée.
+    """
+    for i, j in zip(image_a, image_b):
+        if valeurs[i] != valeurs[j]:
+            return valeurs[i] - valeurs[j]
+
+    # Second filtre : la structure
+    nouvelles_a = dict()
+    nouvelles_b = dict()
+    for i, j in zip(image_a, image_b):
+        ra = régions[i]
+        if ra >= 0:
+            ra = nouvelles_a.setdefault(ra, len(nouvelles_a))
+        rb = régions[j]
+        if rb >= 0:
+            rb = nouvelles_b.setdefault(rb, len(nouvelles_b))
+        if ra != rb:
+            return ra - rb
+
+    return 0
+
+
 class Grille:
 
     def __init__(self, base):
@@ -187,7 +335,14 @@ class Grille:
         return (self.base == autre.base and self.cases == autre.cases)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.identité())
+
+    def identité(self):
+        """Identité de la grille, calculée sans rendu textuel
+        """
+        valeurs = array.array("b", [c.valeur for c in self.cases])
+        régions = array.array("h", [c.région for c in self.cases])
+        return Identité(self.base, valeurs, régions)
 
     def __repr__(self):
         # On détermine la longueur des champs à afficher
@@ -200,6 +355,8 @@ class Grille:
         lgc = 3 + lgv + lgr
 
         # Constitution de la grille, ligne à ligne
+        cases = [[self.cases[i] for i in ligne]
+                 for ligne in topologie(self.base).index]
         lignes = list()
         for h in range(self.base.hauteur):
             # Séparateur horizontal
@@ -209,8 +366,8 @@ class Grille:
                 if h == 0:
                     séparateur = "-"
                 else:
-                    r = self[(h, l)].région
-                    if r >= 0 and self[(h - 1, l)].région != r:
+                    r = cases[h][l].région
+                    if r >= 0 and cases[h - 1][l].région != r:
                         séparateur = "-"
                 ligne += séparateur * lgc + "+"
             lignes.append(ligne)
@@ -218,13 +375,13 @@ class Grille:
             # Cases
             ligne = str()
             for l in range(self.base.largeur):
-                case = self[(h, l)]
+                case = cases[h][l]
                 séparateur = " "
                 if l == 0:
                     séparateur = "|"
                 else:
                     r = case.région
-                    if r >= 0 and self[(h, l - 1)].région != r:
+                    if r >= 0 and cases[h][l - 1].région != r:
                         séparateur = "|"
                 ligne += séparateur
                 if case.valeur >= 1:
@@ -254,6 +411,8 @@ class Grille:
         lgc = lgv
 
         # Constitution de la grille, ligne à ligne
+        cases = [[self.cases[i] for i in ligne]
+                 for ligne in topologie(self.base).index]
         lignes = list()
         for h in range(self.base.hauteur):
             # Séparateur horizontal
@@ -263,8 +422,8 @@ class Grille:
                 if h == 0:
                     séparateur = "-"
                 else:
-                    r = self[(h, l)].région
-                    if r >= 0 and self[(h - 1, l)].région != r:
+                    r = cases[h][l].région
+                    if r >= 0 and cases[h - 1][l].région != r:
                         séparateur = "-"
                 ligne += séparateur * lgc + "+"
             lignes.append(ligne)
@@ -272,13 +431,13 @@ class Grille:
             # Cases
             ligne = str()
             for l in range(self.base.largeur):
-                case = self[(h, l)]
+                case = cases[h][l]
                 séparateur = " "
                 if l == 0:
                     séparateur = "|"
                 else:
                     r = case.région
-                    if r >= 0 and self[(h, l - 1)].région != r:
+                    if r >= 0 and cases[h][l - 1].région != r:
                         séparateur = "|"
                 ligne += séparateur
                 if case.valeur >= 1:
@@ -315,50 +474,24 @@ class Grille:
     def est_canonique(self):
         """Vrai ssi la grille est une forme canonique
 
-        La forme canonique permet d'éliminer les symétries
+        La forme canonique permet d'éliminer les symétries : voir
+        `GrilleCompacte.est_canonique`
         """
-        # Premier filtre : les valeurs des cases
-        for h in range(self.base.hauteur // 2):
-            for l in range(self.base.largeur // 2):
-                coords = [(h, l), (h, self.base.largeur - 1 - l),
-                          (self.base.hauteur - 1 - h, l),
-                          (self.base.hauteur - 1 - h,
-                           self.base.largeur - 1 - l)]
-                cases = [self[p].valeur for p in coords]
-                valeurs = [v for v in cases[1:] if v >= 1]
-                if len(valeurs) == 0:
-                    if cases[0] >= 1:
-                        return True
-                else:
-                    for v in valeurs:
-                        if v < cases[0]:
-                            return False  # cases[0] > min(valeurs)
-                        elif v > cases[0]:
-                            return True  # cases[0] < max(valeurs)
-
-        # TODO Second filtre : la structure
-
-        return True
+        return self.compacter().est_canonique()
 
     def est_normale(self):
         """Vrai ssi la grille respecte la forme normale
+
+        Chaque nouvelle région rencontrée doit porter le plus petit numéro
+        encore inutilisé.
         """
-        # Attribution de nouveaux numéros
-        # anciens[r] est l'ancien numéro de la région désormais identifiée 'r'
-        retour = True
-        anciens = list()
+        prochaine = 0
         for case in self.cases:
-            région = case.région
-            if région >= 0:
-                try:
-                    nouvelle_région = anciens.index(région)
-                except ValueError:
-                    nouvelle_région = len(anciens)
-                    anciens.append(région)
-                if nouvelle_région != case.région:
-                    retour = False
-                    break
-        return retour
+            if case.région == prochaine:
+                prochaine += 1
+            elif case.région > prochaine:
+                return False
+        return True
 
     def normaliser(self):
         """Assure un ordre de numérotation entre Régions.
@@ -366,20 +499,22 @@ class Grille:
         La valeur de retour indique si une modification a été effectuée
         """
         # Attribution de nouveaux numéros
-        # anciens[r] est l'ancien numéro de la région désormais identifiée 'r'
+        # nouvelles[r] est le nouveau numéro de la région anciennement 'r'
         utile = False
-        anciens = list()
+        nouvelles = [-1] * (1 + max([c.région for c in self.cases],
+                                    default=-1))
+        nb_régions = 0
         for case in self.cases:
             région = case.région
             if région >= 0:
-                try:
-                    nouvelle_région = anciens.index(région)
-                except ValueError:
-                    nouvelle_région = len(anciens)
-                    anciens.append(région)
-                if nouvelle_région != case.région:
+                nouvelle_région = nouvelles[région]
+                if nouvelle_région < 0:
+                    nouvelle_région = nb_régions
+                    nouvelles[région] = nouvelle_région
+                    nb_régions += 1
+                if nouvelle_région != région:
                     utile = True
-                case.région = nouvelle_région
+                    case.région = nouvelle_région
         return utile
 
     def est_complète(self):
@@ -393,18 +528,188 @@ class Grille:
     def transposer(self):
         """Grille dont largeur et hauteur sont interverties
         """
-        nouvelle_base = Base(largeur=self.base.hauteur,
-                             hauteur=self.base.largeur,
-                             maximum=self.base.maximum)
-        cases = [None] * self.base.nb_cases()
-        for i in range(len(cases)):
-            h, l = nouvelle_base.en_position(i)
-            j = self.base.en_index(hauteur=h, largeur=l)
-            cases[i] = self.cases[j]
+        transposition = topologie(self.base).transposition
+        cases = [self.cases[j] for j in transposition]
 
         self.base.transposer()
         self.cases[:] = cases
 
+    def compacter(self):
+        """GrilleCompacte équivalente
+        """
+        return GrilleCompacte.depuis_grille(self)
+
+
+class GrilleCompacte:
+    """Grille dont les cases sont rangées dans deux tampons
+
+    Les valeurs et les identifiants de région sont stockés dans l'ordre de la
+    Base. Comme pour `Case`, la valeur -1 représente une caractéristique
+    indéfinie. Les identifiants de région sont sur 16 bits, le format de
+    sérialisation autorisant jusqu'à 254 régions.
+
+    La Base est partagée et n'est jamais modifiée : `transposer` en crée une
+    nouvelle.
+    """
+
+    __slots__ = ("base", "valeurs", "régions")
+
+    def __init__(self, base):
+        self.base = base
+
+        taille = base.nb_cases()
+        self.valeurs = array.array("b", [-1]) * taille
+        self.régions = array.array("h", [-1]) * taille
+
+    @staticmethod
+    def depuis_grille(grille):
+        """GrilleCompacte équivalente à la Grille fournie
+        """
+        retour = GrilleCompacte(copy.deepcopy(grille.base))
+        retour.valeurs = array.array("b", [c.valeur for c in grille.cases])
+        retour.régions = array.array("h", [c.région for c in grille.cases])
+        return retour
+
+    def en_grille(self):
+        """Grille équivalente, pour les traitements manipulant des `Case`
+        """
+        retour = Grille(copy.deepcopy(self.base))
+        for case, valeur, région in zip(retour.cases, self.valeurs,
+                                        self.régions):
+            case.valeur = valeur
+            case.région = région
+        return retour
+
+    def __eq__(self, autre):
+        return (self.base == autre.base and self.valeurs == autre.valeurs
+                and self.régions == autre.régions)
+
+    def __hash__(self):
+        return hash(self.identité())
+
+    def identité(self):
+        """Identité de la grille
+        """
+        return Identité(self.base, self.valeurs, self.régions)
+
+    def __repr__(self):
+        return repr(self.en_grille())
+
+    def __str__(self):
+        return str(self.en_grille())
+
+    def __getitem__(self, position):
+        h, l = position
+        index = self.base.en_index(hauteur=h, largeur=l)
+        return Case(self.valeurs[index], self.régions[index])
+
+    def __setitem__(self, position, case):
+        h, l = position
+        index = self.base.en_index(hauteur=h, largeur=l)
+        self.valeurs[index] = case.valeur
+        self.régions[index] = case.région
+
+    def nb_régions(self):
+        """Nombre de régions différentes identifiées
+        """
+        régions = set(self.régions)
+        régions.discard(-1)
+        return len(régions)
+
+    def _symétries(self):
+        """Symétries de la Base qui préservent l'ensemble des cases définies,
+        identité en tête
+        """
+        définies = [
+            v > 0 or r >= 0 for v, r in zip(self.valeurs, self.régions)
+        ]
+        return [
+            symétrie for symétrie in topologie(self.base).symétries
+            if all(définies[j] == d for j, d in zip(symétrie, définies))
+        ]
+
+    def est_canonique(self):
+        """Vrai ssi la grille est une forme canonique
+
+        La forme canonique permet d'éliminer les symétries : c'est la plus
+        petite des images de la grille par les symétries de la Base (au sens
+        de `comparer_images`). Pour une grille partiellement définie, seules
+        comptent les symétries qui préservent l'ensemble des cases définies.
+        """
+        identité, *symétries = self._symétries()
+        for symétrie in symétries:
+            if comparer_images(self.valeurs, self.régions, symétrie,
+                               identité) < 0:
+                return False
+        return True
+
+    def forme_canonique(self):
+        """GrilleCompacte canonique et normale de même classe de symétrie
+        """
+        symétries = self._symétries()
+        meilleure = symétries[0]
+        for symétrie in symétries[1:]:
+            if comparer_images(self.valeurs, self.régions, symétrie,
+                               meilleure) < 0:
+                meilleure = symétrie
+
+        retour = GrilleCompacte(self.base)
+        retour.valeurs = array.array("b", [self.valeurs[j] for j in meilleure])
+        retour.régions = array.array("h", [self.régions[j] for j in meilleure])
+        retour.normaliser()
+        return retour
+
+    def est_normale(self):
+        """Vrai ssi la grille respecte la forme normale
+        """
+        prochaine = 0
+        for région in self.régions:
+            if région == prochaine:
+                prochaine += 1
+            elif région > prochaine:
+                return False
+        return True
+
+    def normaliser(self):
+        """Assure un ordre de numérotation entre Régions.
+
+        La valeur de retour indique si une modification a été effectuée
+        """
+        utile = False
+        régions = self.régions
+        nouvelles = [-1] * (1 + max(régions, default=-1))
+        nb_régions = 0
+        for i, région in enumerate(régions):
+            if région >= 0:
+                nouvelle_région = nouvelles[région]
+                if nouvelle_région < 0:
+                    nouvelle_région = nb_régions
+                    nouvelles[région] = nouvelle_région
+                    nb_régions += 1
+                if nouvelle_région != région:
+                    utile = True
+                    régions[i] = nouvelle_région
+        return utile
+
+    def est_complète(self):
+        """Vrai ssi toutes les cases ont une valeur de fixée
+        """
+        return min(self.valeurs, default=1) >= 1
+
+    def transposer(self):
+        """Grille dont largeur et hauteur sont interverties
+        """
+        nouvelle_base = copy.deepcopy(self.base)
+        nouvelle_base.transposer()
+
+        transposition = topologie(self.base).transposition
+        valeurs = [self.valeurs[j] for j in transposition]
+        régions = [self.régions[j] for j in transposition]
+
+        self.valeurs = array.array("b", valeurs)
+        self.régions = array.array("h", régions)
+        self.base = nouvelle_base
+
 
 class Lecteur:
     """Itérateur de codes généralement issus de l'entrée standard
@@ -422,6 +727,14 @@ class Lecteur:
     def nb_codes(self):
         return len(self.codes)
 
+    def __len__(self):
+        return len(self.codes)
+
+    def iter_range(self, début, fin):
+        """Itérateur des codes de rang début (inclus) à fin (exclu)
+        """
+        return iter(self.codes[début:fin])
+
     def __iter__(self):
         self._i = 0
         return self
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Catalogue des fichiers de codes d'un dossier de données
+
+Le catalogue est une base SQLite rangée dans le dossier lui-même. Chaque
+fichier y est décrit par sa base, son palier (tiré de son nom), son format,
+son nombre de codes et de grilles complètes, s'il est trié, intègre et clos,
+ainsi que par sa taille et sa date de modification : un fichier dont ces
+deux dernières n'ont pas changé n'a pas à être rouvert.
+
+Un fichier est clos si son pied a été écrit, ce que fait l'écrivain à la
+clôture. Un fichier intègre sans pied a été interrompu, est en cours
+d'écriture, ou est antérieur aux pieds. Le format n°0, sans pied, est clos
+et intègre s'il se lit entièrement jusqu'à son marqueur de fin.
+
+Les écrivains créés par `fichier.écrivain` enregistrent leur fichier à la
+clôture, si le dossier a un catalogue. `fichier.cataloguer` crée le
+catalogue au besoin, et le met à jour des fichiers modifiés par ailleurs.
+"""
+
+import contextlib
+import dataclasses
+import os
+import sqlite3
+
+from . import Progrès
+
+_SCHÉMA = """
+CREATE TABLE IF NOT EXISTS fichiers (
+    nom TEXT PRIMARY KEY,
+    hauteur INTEGER,
+    largeur INTEGER,
+    maximum INTEGER,
+    palier INTEGER,
+    format INTEGER,
+    nb_codes INTEGER,
+    nb_complets INTEGER,
+    trié INTEGER,
+    intègre INTEGER,
+    clos INTEGER,
+    taille INTEGER,
+    date INTEGER
+);
+CREATE INDEX IF NOT EXISTS progrès
+    ON fichiers (hauteur, largeur, maximum, palier);
+"""
+
+
+@dataclasses.dataclass
+class Entrée:
+    """Description d'un fichier du catalogue
+
+    Les caractéristiques inconnues valent None : palier d'un fichier dont le
+    nom ne le mentionne pas, tri d'un fichier au format n°1, etc.
+    """
+
+    nom: str
+    hauteur: int = None
+    largeur: int = None
+    maximum: int = None
+    palier: int = None
+    format: int = None
+    nb_codes: int = None
+    nb_complets: int = None
+    trié: bool = None
+    intègre: bool = None
+    clos: bool = None
+    taille: int = None
+    date: int = None
+
+    def progrès(self):
+        """Progrès du fichier, None si son nom n'indique pas de palier
+
+        Un nom non reconnu ne fait pas d'un fichier un résultat final :
+
+        >>> import tempfile
+        >>> from tectonic import Base
+        >>> from tectonic.fichier import cataloguer
+        >>> from tectonic.fichier import écrivain
+        >>> with tempfile.TemporaryDirectory() as dossier:
+        ...     for nom in ("h03l04m04-p04.log", "sauvegarde.log"):
+        ...         sortie = écrivain(os.path.join(dossier, nom),
+        ...                           Base(hauteur=3, largeur=4, maximum=4))
+        ...         sortie.ajouter_lot([259, 515])
+        ...         sortie.clore()
+        ...     for entrée in cataloguer(dossier).entrées():
+        ...         print(entrée.nom, entrée.progrès())
+        h03l04m04-p04.log h03l04m04-p04
+        sauvegarde.log None
+        """
+        if self.palier is None:
+            return None
+        return Progrès(hauteur=self.hauteur,
+                       largeur=self.largeur,
+                       maximum=self.maximum,
+                       palier=self.palier)
+
+
+_COLONNES = [champ.name for champ in dataclasses.fields(Entrée)]
+
+
+class Catalogue:
+    """Accès au catalogue d'un dossier
+
+    Une connexion est ouverte pour chaque opération : l'objet peut être
+    conservé longtemps, ou partagé entre processus.
+    """
+
+    NOM = "catalogue.sqlite"
+
+    def __init__(self, dossier):
+        self.dossier = dossier
+        self.chemin = os.path.join(dossier, self.NOM)
+        with self._connexion() as connexion:
+            connexion.executescript(_SCHÉMA)
+
+    @staticmethod
+    def existant(dossier):
+        """Catalogue du dossier s'il en a un, None sinon
+        """
+        if not os.path.exists(os.path.join(dossier, Catalogue.NOM)):
+            return None
+        return Catalogue(dossier)
+
+    @contextlib.contextmanager
+    def _connexion(self):
+        with contextlib.closing(sqlite3.connect(self.chemin,
+                                                timeout=60)) as connexion:
+            with connexion:
+                yield connexion
+
+    def enregistrer(self, entrée):
+        """Ajoute ou remplace la description d'un fichier
+        """
+        if entrée.palier is None:
+            progrès = Progrès.depuis_chaîne(entrée.nom)
+            if progrès is not None:
+                entrée.palier = progrès.palier
+        with self._connexion() as connexion:
+            connexion.execute(
+                f"INSERT OR REPLACE INTO fichiers ({', '.join(_COLONNES)}) "
+                f"VALUES ({', '.join('?' * len(_COLONNES))})",
+                dataclasses.astuple(entrée))
+
+    def consigner(self, écrivain):
+        """Enregistre le fichier que vient de clore un écrivain
+        """
+        état = os.stat(écrivain.chemin)
+        self.enregistrer(
+            Entrée(nom=os.path.basename(écrivain.chemin),
+                   hauteur=écrivain.base.hauteur,
+                   largeur=écrivain.base.largeur,
+                   maximum=écrivain.base.maximum,
+                   format=écrivain.FORMAT,
+                   nb_codes=écrivain.nb_codes,
+                   nb_complets=écrivain.statistiques.nb_complets,
+                   trié=getattr(écrivain, "trié", None),
+                   intègre=True,
+                   clos=True,
+                   taille=état.st_size,
+                   date=état.st_mtime_ns))
+
+    def retirer(self, noms):
+        """Retire du catalogue les fichiers nommés
+        """
+        with self._connexion() as connexion:
+            connexion.executemany("DELETE FROM fichiers WHERE nom = ?",
+                                  [(nom, ) for nom in noms])
+
+    def entrées(self, **critères):
+        """Liste des entrées dont les caractéristiques valent celles
+        demandées, par ordre de nom
+
+        >>> import tempfile
+        >>> with tempfile.TemporaryDirectory() as dossier:
+        ...     catalogue = Catalogue(dossier)
+        ...     catalogue.enregistrer(Entrée("h03l04m04-p05.log", 3, 4, 4))
+        ...     catalogue.enregistrer(Entrée("h03l04m04.log", 3, 4, 4, 12))
+        ...     [e.nom for e in catalogue.entrées(hauteur=3, palier=5)]
+        ['h03l04m04-p05.log']
+        """
+        for nom in critères:
+            if nom not in _COLONNES:
+                raise ValueError(f"Caractéristique «{nom}» inconnue")
+
+        requête = f"SELECT {', '.join(_COLONNES)} FROM fichiers"
+        if len(critères) > 0:
+            requête += " WHERE " + " AND ".join(
+                f"{nom} IS ?" for nom in critères)
+        requête += " ORDER BY nom"
+        with self._connexion() as connexion:
+            lignes = connexion.execute(requête, list(critères.values()))
+            retour = [Entrée(*ligne) for ligne in lignes]
+        for entrée in retour:
+            for nom in ("trié", "intègre", "clos"):
+                if getattr(entrée, nom) is not None:
+                    setattr(entrée, nom, bool(getattr(entrée, nom)))
+        return retour
+
+    def états(self):
+        """Taille et date de chaque fichier catalogué, {nom: (taille, date)}
+        """
+        with self._connexion() as connexion:
+            lignes = connexion.execute(
+                "SELECT nom, taille, date FROM fichiers")
+            return {nom: (taille, date) for nom, taille, date in lignes}
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""Dédoublonnage de codes par répartition entre seaux sur disque
+
+Les codes sont répartis, selon leur hachage, entre des seaux écrits dans des
+fichiers temporaires au format n°1 : deux codes égaux tombent dans le même
+seau. Chaque seau est ensuite dédoublonné indépendamment des autres, par un
+processus dédié, puis les seaux sont concaténés. L'ordre des codes est
+conservé au sein de chaque seau.
+
+Un seau dont le dédoublonnage dépasserait le budget mémoire d'un processus
+est lui-même réparti, selon un autre hachage, entre des seaux plus petits.
+
+Avec les empreintes, un seau n'est pas chargé sous la forme d'un ensemble
+d'entiers Python, mais d'un tableau NumPy d'empreintes sur 8 octets, trié :
+seuls les codes d'empreintes égales sont relus, en un seul parcours, pour
+être comparés exactement. L'empreinte d'un code est son hachage Python, qui
+n'est autre que le code lui-même en deçà de `sys.hash_info.modulus` : la
+relecture n'est alors pas nécessaire.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .fichier import lecteur
+from .fichier import paquets
+from .fichier_001 import Écrivain as Écrivain001
+
+# Estimation de l'empreinte mémoire d'un code à dédoublonner : entier Python
+# et entrée de l'ensemble, ou bien empreinte, rang et copie triée
+OCTETS_PAR_CODE = 128
+OCTETS_PAR_EMPREINTE = 32
+
+# Nombre de codes par bloc des seaux, qui sont tous ouverts en même temps
+TAILLE_BLOC = 2**12
+
+# Multiplicateurs des hachages de répartition, un par niveau
+_MÉLANGES = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+             0xD6E8FEB86659FD93)
+_MASQUE = 2**64 - 1
+
+
+def _seau(code, nb_seaux, niveau=0):
+    """Numéro du seau du code, parmi 'nb_seaux', au niveau de répartition
+    donné
+    """
+    return ((hash(code) * _MÉLANGES[niveau] & _MASQUE) >> 32) % nb_seaux
+
+
+def _ventiler(codes, seaux, niveau=0):
+    """Ajoute chaque code fourni au seau que lui attribue son hachage
+    """
+    groupes = [list() for _ in seaux]
+    for code in codes:
+        groupes[_seau(code, len(seaux), niveau)].append(code)
+    for seau, groupe in zip(seaux, groupes):
+        if len(groupe) > 0:
+            seau.ajouter_lot(groupe)
+
+
+def _par_ensemble(entrée, sortie):
+    vus = set()
+    doublons = 0
+    for paquet in paquets(entrée):
+        nouveaux = list()
+        for code in paquet:
+            if code in vus:
+                doublons += 1
+            else:
+                vus.add(code)
+                nouveaux.append(code)
+        sortie.ajouter_lot(nouveaux)
+    return doublons
+
+
+def _relire(entrée, rangs):
+    """Codes de rangs donnés, triés, lus en un seul parcours : {rang: code}
+    """
+    retour = dict()
+    début = 0
+    for paquet in paquets(entrée):
+        fin = début + len(paquet)
+        i, j = numpy.searchsorted(rangs, (début, fin)).tolist()
+        for rang in rangs[i:j].tolist():
+            retour[rang] = paquet[rang - début]
+        début = fin
+    return retour
+
+
+def _par_empreintes(entrée, sortie):
+    if len(entrée) == 0:
+        return 0
+
+    empreintes = numpy.fromiter(map(hash, entrée.iter_range(0, len(entrée))),
+                                dtype=numpy.uint64,
+                                count=len(entrée))
+    ordre = numpy.argsort(empreintes, kind="stable")
+    triées = empreintes[ordre]
+    del empreintes
+
+    # Le tri étant stable, seule la première occurrence d'un code est
+    # retenue
+    retenus = numpy.ones(len(ordre), dtype=bool)
+    if entrée.statistiques.maximum < sys.hash_info.modulus:
+        # Empreintes égales, codes égaux
+        retenus[ordre[1:][triées[1:] == triées[:-1]]] = False
+    else:
+        # Vérification exacte des codes d'empreintes égales, relus en une
+        # seule passe
+        égales = triées[1:] == triées[:-1]
+        candidats = numpy.zeros(len(ordre), dtype=bool)
+        candidats[1:] |= égales
+        candidats[:-1] |= égales
+        positions = numpy.flatnonzero(candidats)
+        del égales, candidats
+        codes = _relire(entrée, numpy.sort(ordre[positions]))
+
+        # Suites de candidats d'empreintes égales
+        empreintes = triées[positions]
+        bornes = (numpy.flatnonzero(empreintes[1:] != empreintes[:-1]) +
+                  1).tolist()
+        for début, fin in zip([0] + bornes, bornes + [len(positions)]):
+            vus = set()
+            for rang in ordre[positions[début:fin]].tolist():
+                if codes[rang] in vus:
+                    retenus[rang] = False
+                else:
+                    vus.add(codes[rang])
+        del codes
+    del ordre, triées
+
+    rang = 0
+    for paquet in paquets(entrée):
+        masque = retenus[rang:rang + len(paquet)].tolist()
+        sortie.ajouter_lot(
+            [code for code, retenu in zip(paquet, masque) if retenu])
+        rang += len(paquet)
+    return len(retenus) - int(numpy.count_nonzero(retenus))
+
+
+def _dédoublonner_seau(tâche):
+    """Dédoublonne un seau dans un nouveau fichier, renvoie le nombre de
+    doublons
+    """
+    chemin, chemin_sortie, budget, empreintes, niveau = tâche
+    entrée = lecteur(chemin)
+    sortie = Écrivain001(chemin_sortie, entrée.base, TAILLE_BLOC)
+
+    besoin = len(entrée) * (OCTETS_PAR_EMPREINTE
+                            if empreintes else OCTETS_PAR_CODE)
+    if (besoin > budget and len(entrée) > 1
+            and niveau + 1 < len(_MÉLANGES)):
+        # Seau trop gros : nouvelle répartition, selon un autre hachage
+        chemins = [
+            f"{chemin}.{i}"
+            for i in range(min(len(entrée), 1 + besoin // budget))
+        ]
+        seaux = [
+            Écrivain001(sous_seau, entrée.base, TAILLE_BLOC)
+            for sous_seau in chemins
+        ]
+        for paquet in paquets(entrée):
+            _ventiler(paquet, seaux, niveau + 1)
+        for seau in seaux:
+            seau.clore()
+
+        doublons = 0
+        for sous_seau in chemins:
+            doublons += _dédoublonner_seau(
+                (sous_seau, sous_seau + ".dédoublonné", budget, empreintes,
+                 niveau + 1))
+            for paquet in paquets(lecteur(sous_seau + ".dédoublonné")):
+                sortie.ajouter_lot(paquet)
+            os.remove(sous_seau)
+            os.remove(sous_seau + ".dédoublonné")
+    elif empreintes:
+        doublons = _par_empreintes(entrée, sortie)
+    else:
+        doublons = _par_ensemble(entrée, sortie)
+
+    sortie.clore()
+    return doublons
+
+
+class Partition:
+    """Codes d'une Base répartis entre 'nb_seaux' seaux, écrits dans un
+    dossier temporaire créé dans 'dossier', en vue de leur dédoublonnage
+
+    'mémoire' est le budget, en octets, partagé entre les 'nb_processus'
+    processus de dédoublonnage. Les empreintes ne sont utilisées que si
+    NumPy est disponible.
+
+    >>> import tempfile
+    >>> from tectonic import Base
+    >>> def dédoublonner(empreintes):
+    ...     with tempfile.TemporaryDirectory() as dossier:
+    ...         partition = Partition(Base(hauteur=3, largeur=3, maximum=4),
+    ...                               dossier, 4, nb_processus=1,
+    ...                               empreintes=empreintes)
+    ...         partition.ajouter_lot([259, 515, 259, 771, 2**80 + 3, 515])
+    ...         partition.ajouter_lot([2**80 + 3, 259])
+    ...         codes = [c for lot in partition.dédoublonner() for c in lot]
+    ...     return sorted(codes), partition.doublons
+    >>> dédoublonner(False) == dédoublonner(True)
+    True
+    >>> dédoublonner(True)
+    ([259, 515, 771, 1208925819614629174706179], 4)
+    """
+
+    def __init__(self, base, dossier, nb_seaux, *, mémoire=2**30,
+                 nb_processus=None, empreintes=False):
+        if nb_processus is None:
+            nb_processus = os.cpu_count()
+
+        self.base = base
+        self.nb_processus = nb_processus
+        self.budget = max(1, mémoire // nb_processus)
+        self.empreintes = empreintes and numpy is not None
+        self.doublons = 0
+
+        self._temporaire = tempfile.TemporaryDirectory(dir=dossier)
+        self._chemins = [
+            os.path.join(self._temporaire.name, f"seau{i:06d}.log")
+            for i in range(nb_seaux)
+        ]
+        self._seaux = [
+            Écrivain001(chemin, base, TAILLE_BLOC) for chemin in self._chemins
+        ]
+
+    def ajouter_lot(self, codes):
+        """Répartit les codes fournis entre les seaux
+        """
+        _ventiler(codes, self._seaux)
+
+    def dédoublonner(self):
+        """Itérateur des codes dédoublonnés, par listes, seau après seau
+
+        Les seaux sont dédoublonnés en parallèle, et le nombre de doublons
+        retirés cumulé dans 'doublons'. Le dossier temporaire est supprimé
+        une fois tous les codes fournis.
+        """
+        for seau in self._seaux:
+            seau.clore()
+
+        tâches = [(chemin, chemin + ".dédoublonné", self.budget,
+                   self.empreintes, 0) for chemin in self._chemins]
+        try:
+            with multiprocessing.Pool(self.nb_processus) as pool:
+                for tâche, doublons in zip(
+                        tâches, pool.imap(_dédoublonner_seau, tâches)):
+                    self.doublons += doublons
+                    yield from paquets(lecteur(tâche[1]))
+        finally:
+            self._temporaire.cleanup()
@@ -1,8 +1,26 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import copy
+import dataclasses
+import multiprocessing
+import os
+import re
+import struct
+
+from . import fichier_000
+from . import fichier_001
+from . import fichier_002
+from . import topologie
+from .catalogue import Catalogue
+from .catalogue import Entrée
 from .fichier_000 import Lecteur as Lecteur000
 from .fichier_001 import Lecteur as Lecteur001
 from .fichier_001 import Écrivain as Écrivain001
+from .fichier_002 import Lecteur as Lecteur002
+from .fichier_002 import Écrivain as Écrivain002
+from .serial import Codec
+from .statistiques import Statistiques
 
 
 def lecteur(chemin):
@@ -14,15 +32,348 @@ def lecteur(chemin):
         # Vérification du prélude
         prélude = entrée.read(8)
         if prélude == b"TECTONIC":
-            # Version
+            # Version, '\x41' désignant le format n°1 à blocs contrôlés
             version = entrée.read(1)
             if version == b"\x00":
                 retour = Lecteur000(chemin)
-            elif version == b"\x01":
+            elif version in (b"\x01", b"\x41"):
                 retour = Lecteur001(chemin)
+            elif version == b"\x02":
+                retour = Lecteur002(chemin)
+
+    return retour
+
+
+def écrivain(chemin, base, *, reprise=False, format=1, compression=False):
+    """Écrivain au format demandé
+
+    La compression ne concerne que le format n°2. Si le dossier a un
+    catalogue, le fichier y est enregistré à sa clôture.
+    """
+    if format == 2:
+        retour = Écrivain002(chemin,
+                             base,
+                             2**16,
+                             reprise=reprise,
+                             compression=compression)
+    else:
+        retour = Écrivain001(chemin, base, 2**16, reprise=reprise)
+
+    catalogue = Catalogue.existant(os.path.dirname(os.path.abspath(chemin)))
+    if catalogue is not None:
+        retour.à_la_clôture.append(catalogue.consigner)
+    return retour
+
+
+def décrire(chemin):
+    """Entrée de catalogue décrivant le fichier, None s'il n'est pas un
+    fichier de codes
+    """
+    état = os.stat(chemin)
+    retour = Entrée(nom=os.path.basename(chemin),
+                    intègre=False,
+                    taille=état.st_size,
+                    date=état.st_mtime_ns)
+    try:
+        entrée = lecteur(chemin)
+    except (AssertionError, ValueError, struct.error):
+        # En-tête ou fin de fichier illisible
+        return retour
+    if entrée is None:
+        return None
+
+    with entrée:
+        retour.hauteur = entrée.base.hauteur
+        retour.largeur = entrée.base.largeur
+        retour.maximum = entrée.base.maximum
+        retour.format = entrée.FORMAT
+        retour.nb_codes = len(entrée)
+        if entrée.FORMAT == 2:
+            retour.trié = entrée.trié
+        stats = getattr(entrée, "statistiques", None)
+    if entrée.FORMAT == 0:
+        # Le marqueur de fin n'est écrit qu'à la clôture
+        retour.intègre = fichier_000.intègre(chemin)
+        retour.clos = retour.intègre
+    elif entrée.FORMAT == 1:
+        retour.intègre = fichier_001.intègre(chemin)
+    elif entrée.FORMAT == 2:
+        retour.intègre = fichier_002.intègre(chemin)
+    if stats is not None:
+        retour.nb_complets = stats.nb_complets
+        retour.clos = True
+    return retour
+
+
+def cataloguer(dossier):
+    """Catalogue du dossier, créé au besoin et mis à jour
+
+    Seuls les fichiers nouveaux ou modifiés depuis leur enregistrement sont
+    ouverts ; les fichiers disparus sont retirés.
+    """
+    catalogue = Catalogue(dossier)
+    états = catalogue.états()
+    with os.scandir(dossier) as entrées:
+        for entrée in entrées:
+            if not entrée.is_file() or entrée.name == Catalogue.NOM:
+                continue
+            état = entrée.stat()
+            if états.pop(entrée.name,
+                         None) == (état.st_size, état.st_mtime_ns):
+                continue
+            description = décrire(entrée.path)
+            if description is not None:
+                catalogue.enregistrer(description)
+    catalogue.retirer(états)
+    return catalogue
+
+
+@dataclasses.dataclass(frozen=True)
+class Lot:
+    """Portion d'un fichier : 'nombre' codes à partir du code de rang
+    'début'
+
+    Sa forme textuelle «chemin:début:nombre» est acceptée par l'option -f
+    des scripts.
+    """
+
+    chemin: str
+    début: int = 0
+    nombre: int = 0
+
+    _REGEX = re.compile("(.+):(\\d+):(\\d+)")
+
+    def __str__(self):
+        return f"{self.chemin}:{self.début}:{self.nombre}"
+
+    @staticmethod
+    def depuis_chaîne(chaîne):
+        """Lot décrit par «chemin:début:nombre», None à défaut
+
+        >>> Lot.depuis_chaîne("h04l04m05-p10.log:1000:500")
+        Lot(chemin='h04l04m05-p10.log', début=1000, nombre=500)
+        >>> print(Lot.depuis_chaîne("h04l04m05-p10.log"))
+        None
+        """
+        retour = None
+        m = Lot._REGEX.fullmatch(chaîne)
+        if m:
+            retour = Lot(m.group(1), int(m.group(2)), int(m.group(3)))
+        return retour
+
+    def ouvrir(self):
+        return Tranche(self)
+
+
+class Tranche:
+    """Lecteur restreint aux codes d'un Lot
+
+    Les rangs sont relatifs au début du lot. L'accès direct des formats
+    n°1 et n°2 permet d'atteindre ce début sans lire les codes précédents.
+    """
+
+    def __init__(self, lot):
+        self.lot = lot
+        self.chemin = lot.chemin
+        self.lecteur = lecteur(lot.chemin)
+        self.début = min(lot.début, len(self.lecteur))
+        self.fin = min(lot.début + lot.nombre, len(self.lecteur))
+        self.nb_codes = self.fin - self.début
+
+        # Préparation de l'itération
+        self.id_code = 0
+        self._codes = iter(())
+
+    def close(self):
+        self.lecteur.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def base(self):
+        """Base commune à tous les codes
+        """
+        return self.lecteur.base
 
+    def __len__(self):
+        return self.nb_codes
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            début, fin, pas = n.indices(len(self))
+            return self.lecteur[self.début + début:self.début + fin:pas]
+
+        if n < 0:
+            n += len(self)
+        if not (0 <= n < len(self)):
+            raise IndexError(f"Code n°{n} hors du lot")
+        return self.lecteur[self.début + n]
+
+    def iter_range(self, début, fin):
+        """Itérateur des codes de rang début (inclus) à fin (exclu)
+        """
+        début = self.début + max(0, début)
+        fin = self.début + min(fin, len(self))
+        return self.lecteur.iter_range(début, fin)
+
+    def iter_lots(self, n, début=0, fin=None):
+        """Itérateur de listes d'au plus 'n' codes consécutifs, de rang
+        début (inclus) à fin (exclu)
+        """
+        if fin is None:
+            fin = len(self)
+        if not hasattr(self.lecteur, "iter_lots"):
+            return paquets(self.iter_range(début, fin), n)
+        return self.lecteur.iter_lots(n, self.début + max(0, début),
+                                      self.début + min(fin, len(self)))
+
+    def __iter__(self):
+        self.id_code = 0
+        self._codes = self.iter_range(0, len(self))
+        return self
+
+    def __next__(self):
+        retour = next(self._codes)
+        self.id_code += 1
+        return retour
+
+
+def lots(chemin, taille):
+    """Liste des lots successifs d'au plus 'taille' codes du fichier
+
+    Seuls les en-têtes de blocs sont lus pour dénombrer les codes.
+    """
+    with lecteur(chemin) as entrée:
+        nb_codes = len(entrée)
+    return [
+        Lot(chemin, début, min(taille, nb_codes - début))
+        for début in range(0, nb_codes, taille)
+    ]
+
+
+def partitionner(chemin, n):
+    """Liste de 'n' lots couvrant le fichier, de tailles égales à un code
+    près
+    """
+    with lecteur(chemin) as entrée:
+        nb_codes = len(entrée)
+    bornes = [(i * nb_codes) // n for i in range(n + 1)]
+    return [
+        Lot(chemin, début, fin - début)
+        for début, fin in zip(bornes, bornes[1:])
+    ]
+
+
+def paquets(codes, taille=2**16):
+    """Itérateur de listes d'au plus 'taille' codes consécutifs
+
+    Les lecteurs se repositionnant en début de fichier à chaque appel à
+    `iter`, on ne passe pas par `itertools.islice`. Ceux qui savent lire
+    leurs codes par lots s'en chargent directement.
+    """
+    if hasattr(codes, "iter_lots"):
+        yield from codes.iter_lots(taille)
+        return
+
+    paquet = list()
+    for code in codes:
+        paquet.append(code)
+        if len(paquet) == taille:
+            yield paquet
+            paquet = list()
+    if len(paquet) > 0:
+        yield paquet
+
+
+def statistiques(lecteur):
+    """Statistiques des codes d'un lecteur
+
+    Celles du pied du fichier sont lues directement ; à défaut (ancien
+    fichier, lot d'un fichier, codes fournis en ligne de commande), elles
+    sont calculées en parcourant les codes.
+    """
+    retour = getattr(lecteur, "statistiques", None)
+    if retour is None:
+        retour = Statistiques.depuis_lots(lecteur.base, paquets(lecteur))
     return retour
 
 
-def écrivain(chemin, base, *, reprise=False):
-    return Écrivain001(chemin, base, 2**16, reprise=reprise)
+# Codec et permutation propres à chaque processus de transposition
+_TRANSPOSITION = None
+
+
+def _préparer_transposition(base):
+    global _TRANSPOSITION
+    _TRANSPOSITION = (Codec(base), topologie(base).transposition)
+
+
+def _transposer_paquet(paquet):
+    codec, permutation = _TRANSPOSITION
+    return [codec.permuter_code(code, permutation) for code in paquet]
+
+
+def transposer(chemin, chemin_transposé, *, nb_processus=None,
+               taille_paquet=2**14):
+    """Transpose toutes les grilles d'un fichier dans un nouveau fichier
+
+    Les grilles doivent être complètes : transposées, celles d'un palier
+    intermédiaire ne respecteraient plus l'ordre de remplissage des cases.
+    Les régions sont renumérotées, l'ordre des codes est conservé.
+
+    Les paquets de codes sont répartis entre 'nb_processus' processus, au
+    plus deux paquets par processus étant en cours de traitement : la
+    mémoire consommée ne dépend pas de la taille du fichier.
+
+    Renvoie le nombre de codes transposés. Lève ValueError si une grille du
+    fichier est incomplète.
+
+    >>> import tempfile
+    >>> from tectonic import Base
+    >>> base = Base(hauteur=3, largeur=4, maximum=4)
+    >>> temporaire = tempfile.TemporaryDirectory()
+    >>> def essayer(nom, codes):
+    ...     chemin = os.path.join(temporaire.name, nom)
+    ...     sortie = écrivain(chemin, base)
+    ...     sortie.ajouter_lot(codes)
+    ...     sortie.clore()
+    ...     return transposer(chemin, chemin + ".tr", nb_processus=1)
+    >>> essayer("h03l04m04.log", [1045670326004568580])
+    1
+    >>> essayer("h03l04m04-p01.log", [1538, 1794])
+    Traceback (most recent call last):
+    ...
+    ValueError: «...h03l04m04-p01.log» : 2 grille(s) incomplète(s)
+    >>> temporaire.cleanup()
+    """
+    if nb_processus is None:
+        nb_processus = os.cpu_count()
+
+    with lecteur(chemin) as entrée:
+        # Seules les statistiques des vieux fichiers sont à calculer
+        nb_incomplets = len(entrée) - statistiques(entrée).nb_complets
+        if nb_incomplets > 0:
+            raise ValueError(
+                f"«{chemin}» : {nb_incomplets} grille(s) incomplète(s)")
+
+        base = copy.deepcopy(entrée.base)
+        base.transposer()
+        sortie = écrivain(chemin_transposé, base)
+
+        with multiprocessing.Pool(nb_processus, _préparer_transposition,
+                                  (entrée.base, )) as pool:
+            en_cours = collections.deque()
+            for paquet in paquets(entrée, taille_paquet):
+                en_cours.append(
+                    pool.apply_async(_transposer_paquet, (paquet, )))
+                if len(en_cours) > 2 * nb_processus:
+                    sortie.ajouter_lot(en_cours.popleft().get())
+            while len(en_cours) > 0:
+                sortie.ajouter_lot(en_cours.popleft().get())
+
+    retour = sortie.nb_codes
+    sortie.clore()
+    return retour
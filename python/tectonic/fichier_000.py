@@ -28,11 +28,41 @@ Définition du marqueur de fin (3 octets):
   +---+---------------------------------------+
 """
 
+import itertools
 import os
 
 from . import Base
 
 
+def intègre(chemin):
+    """Vrai si le fichier se lit jusqu'au marqueur de fin, écrit à la
+    clôture, et compte le nombre de codes annoncé par l'en-tête
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as dossier:
+    ...     chemin = os.path.join(dossier, "h03l03m04.log")
+    ...     écrivain = Écrivain(chemin, Base(hauteur=3, largeur=3, maximum=4))
+    ...     for code in (259, 515, 771):
+    ...         écrivain.ajouter(code)
+    ...     écrivain.clore()
+    ...     avant = intègre(chemin)
+    ...     os.truncate(chemin, os.path.getsize(chemin) - 3)
+    ...     avant, intègre(chemin)
+    (True, False)
+    """
+    try:
+        lecteur = Lecteur(chemin)
+    except (AssertionError, ValueError):
+        return False
+    with lecteur:
+        try:
+            nb_codes = sum(1 for _ in lecteur)
+        except ValueError:
+            # Fin de fichier avant le marqueur de fin
+            return False
+    return nb_codes == len(lecteur)
+
+
 class Écrivain:
 
     FORMAT = 0
@@ -104,12 +134,33 @@ class Lecteur:
         self.id_ligne = 0
         self._décalage = self.entrée.tell()
 
+    def close(self):
+        """Ferme le fichier
+        """
+        self.entrée.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     @property
     def base(self):
         """Base commune à tous les codes
         """
         return self._base
 
+    def __len__(self):
+        return self.nb_codes
+
+    def iter_range(self, début, fin):
+        """Itérateur des codes de rang début (inclus) à fin (exclu)
+
+        Le format texte impose de lire tous les codes précédents.
+        """
+        return itertools.islice(iter(self), début, fin)
+
     def __iter__(self):
         self.entrée.seek(self._décalage, os.SEEK_SET)
         self.id_ligne = 0
@@ -5,7 +5,7 @@ Définition de l'en-tête (16 octets):
 
   +---+---------------------------------------+
   | s | "TECTONIC"                            |
-  | B | numéro de version : '\x01'            |
+  | B | numéro de version : '\x01' ou '\x41'  |
   | B | Base.hauteur                          |
   | B | Base.largeur                          |
   | B | Base.maximum                          |
@@ -26,17 +26,261 @@ Définition d'un bloc:
    nombre[1] codes de longueur taille[1]
    …
 
+Le bit '\b01000000' du numéro de version ('\x41') signale un fichier à
+blocs contrôlés. Un lecteur antérieur à ces blocs refuse ce numéro de
+version, alors qu'il se méprendrait sur les blocs. Dans un tel fichier
+seulement, si le bit '\b01000000' du premier octet d'un bloc est levé, seuls
+les 6 bits de poids faible donnent le nombre de paires (<64), et le bloc est
+suivi de son contrôle (12 octets):
+
+  +---+---------------------------------------+
+  | L | nombre de codes, ce bloc compris      |
+  | L | taille du bloc (en octets)            |
+  | L | CRC32 du bloc                         |
+  +---+---------------------------------------+
+
+Hors marqueur de fin, le bit de poids fort y est réservé : un lecteur
+rejette tout bloc qui le lève (voir `lire_marqueur`). Un fichier de version
+'\x01' est lu comme il l'a toujours été, tout premier octet supérieur à 127
+y marquant la fin.
+
+L'Écrivain ne produit que des fichiers à blocs contrôlés, hormis à la
+reprise d'un fichier de version '\x01', qu'il prolonge de blocs non
+contrôlés. Après chaque bloc, le marqueur de fin puis le nombre total de
+codes de l'en-tête sont écrits : le fichier reste lisible en cas
+d'interruption, hors bloc en cours d'écriture.
+
 Définition du marqueur de fin (1 octet):
 
   +---+---------------------------------------+
   | B | marqueur de fin : '\b10000000'        |
   +---+---------------------------------------+
+
+À sa clôture, l'Écrivain ajoute après le marqueur de fin un pied portant les
+statistiques des codes écrits (voir `statistiques`). Le pied est retiré à la
+reprise, et réécrit à la clôture suivante.
 """
 
+import bisect
+import mmap
 import os
 import struct
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from . import Base
+from .statistiques import STAT
+from .statistiques import Statistiques
+from .statistiques import encoder_pied
+from .statistiques import lire_pied
+
+# Drapeau des fichiers à blocs contrôlés (numéro de version), et des blocs
+# suivis de leur contrôle
+CONTRÔLE = 0x40
+
+PRÉLUDE = b"TECTONIC\x01"
+PRÉLUDE_CONTRÔLÉ = b"TECTONIC" + bytes([0x01 | CONTRÔLE])
+
+_CONTRÔLE = struct.Struct(">LLL")
+TAILLE_CONTRÔLE = _CONTRÔLE.size
+
+
+def _projection(fichier):
+    """Projection en mémoire, en lecture seule, du fichier ouvert
+    """
+    return mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _est_contrôlé(données):
+    """Vrai si les données sont celles d'un fichier à blocs contrôlés
+    """
+    return données[:9] == PRÉLUDE_CONTRÔLÉ
+
+
+def lire_marqueur(marqueur, contrôlé=True):
+    """Nombre de paires et drapeau de contrôle d'un premier octet de bloc,
+    None pour le marqueur de fin
+
+    'contrôlé' indique un fichier à blocs contrôlés.
+
+    >>> lire_marqueur(3), lire_marqueur(CONTRÔLE | 3), lire_marqueur(128)
+    ((3, False), (3, True), None)
+    >>> lire_marqueur(CONTRÔLE | 3, False), lire_marqueur(129, False)
+    ((67, False), None)
+    >>> lire_marqueur(129)
+    Traceback (most recent call last):
+    ...
+    ValueError: Marqueur de bloc «0x81» inconnu
+    """
+    if not contrôlé:
+        return None if marqueur > 127 else (marqueur, False)
+    if marqueur == 128:
+        return None
+    if marqueur > 128:
+        raise ValueError(f"Marqueur de bloc «{marqueur:#x}» inconnu")
+
+    contrôlé = bool(marqueur & CONTRÔLE)
+    return (marqueur & (CONTRÔLE - 1) if contrôlé else marqueur), contrôlé
+
+
+def en_tête_bloc(paires, contrôlé=True):
+    """Octets de l'en-tête d'un bloc de paires (taille, nombre)
+
+    Un bloc contrôlé doit être suivi de son contrôle (voir `contrôle_bloc`).
+    """
+    retour = [struct.pack(">B", (CONTRÔLE if contrôlé else 0) | len(paires))]
+    for taille, nombre in paires:
+        retour.append(struct.pack(">BL", taille, nombre))
+    return b"".join(retour)
+
+
+def contrôle_bloc(cumul, longueur, crc):
+    """Octets du contrôle d'un bloc de 'longueur' octets, de CRC32 'crc',
+    à l'issue duquel le fichier compte 'cumul' codes
+    """
+    return _CONTRÔLE.pack(cumul, longueur, crc)
+
+
+def _blocs(données, contrôler=True):
+    """Itérateur des blocs complets (début, fin, nombre de codes cumulé,
+    valide)
+
+    'fin' inclut le contrôle éventuel, et 'valide' vaut None pour un bloc
+    sans contrôle, ou si 'contrôler' est faux. L'itération s'arrête au
+    marqueur de fin, ou au premier bloc tronqué.
+    """
+    contrôlé = _est_contrôlé(données)
+    cumul = 0
+    position = 16
+    while position < len(données):
+        début = position
+        marqueur = lire_marqueur(données[position], contrôlé)
+        if marqueur is None:
+            return
+
+        nb_paires, contrôlé = marqueur
+        position += 1 + 5 * nb_paires
+        if position > len(données):
+            return
+
+        nombre = 0
+        for k in range(nb_paires):
+            taille, n = struct.unpack_from(">BL", données, début + 1 + 5 * k)
+            nombre += n
+            position += taille * n
+        if position + (_CONTRÔLE.size if contrôlé else 0) > len(données):
+            return
+
+        valide = None
+        if contrôlé and contrôler:
+            cumul_lu, longueur, crc = _CONTRÔLE.unpack_from(données, position)
+            with memoryview(données) as vue:
+                valide = (longueur == position - début
+                          and cumul_lu == cumul + nombre
+                          and zlib.crc32(vue[début:position]) == crc)
+        if contrôlé:
+            position += _CONTRÔLE.size
+
+        cumul += nombre
+        yield début, position, cumul, valide
+
+
+def _fin_intègre(données):
+    """Vrai si le fichier se termine par un bloc contrôlé valide, suivi du
+    marqueur de fin, en accord avec le nombre de codes de l'en-tête
+
+    Seul le dernier bloc est relu, le pied éventuel étant ignoré.
+    """
+    if not _est_contrôlé(données):
+        return False
+    nb_codes = struct.unpack_from(">L", données, 12)[0]
+    fin, _ = lire_pied(données)
+    if données[fin - 1] != 128:
+        return False
+    if fin == 17:
+        return nb_codes == 0
+
+    fin -= 1 + _CONTRÔLE.size
+    if fin < 16:
+        return False
+    cumul, longueur, crc = _CONTRÔLE.unpack_from(données, fin)
+    début = fin - longueur
+    if cumul != nb_codes or début < 16 or not données[début] & CONTRÔLE:
+        return False
+    with memoryview(données) as vue:
+        return zlib.crc32(vue[début:fin]) == crc
+
+
+def vérifier(chemin):
+    """Vrai si tous les blocs sont valides, suivis du marqueur de fin puis
+    éventuellement d'un pied, et que l'en-tête annonce le bon nombre de
+    codes
+    """
+    with open(chemin, "rb") as entrée:
+        with _projection(entrée) as données:
+            if données[:9] not in (PRÉLUDE, PRÉLUDE_CONTRÔLÉ):
+                return False
+
+            fin = 16
+            cumul = 0
+            try:
+                for _, fin, cumul, valide in _blocs(données):
+                    if valide is False:
+                        return False
+            except ValueError:
+                return False
+
+            nb_codes = struct.unpack_from(">L", données, 12)[0]
+            return (fin < len(données) and données[fin] == 128
+                    and lire_pied(données)[0] == fin + 1
+                    and cumul == nb_codes)
+
+
+def intègre(chemin):
+    """Vrai si le fichier est intègre
+
+    Seule la fin du fichier est relue si elle est contrôlée, sinon tous les
+    blocs le sont.
+    """
+    with open(chemin, "rb") as entrée:
+        with _projection(entrée) as données:
+            if _fin_intègre(données):
+                return True
+    return vérifier(chemin)
+
+
+def réparer(chemin):
+    """Tronque le fichier après son dernier bloc valide
+
+    Le marqueur de fin et le nombre de codes de l'en-tête sont réécrits, le
+    pied est perdu. Renvoie le nombre de codes conservés.
+    """
+    with open(chemin, "r+b") as fichier:
+        with _projection(fichier) as données:
+            fin = 16
+            cumul = 0
+            try:
+                for _, fin_bloc, cumul_bloc, valide in _blocs(données):
+                    if valide is False:
+                        break
+                    fin = fin_bloc
+                    cumul = cumul_bloc
+            except ValueError:
+                # Marqueur inconnu : le bloc est perdu, comme un bloc
+                # invalide
+                pass
+
+        fichier.truncate(fin)
+        fichier.seek(fin, os.SEEK_SET)
+        fichier.write(struct.pack(">B", 128))
+        fichier.seek(12, os.SEEK_SET)
+        fichier.write(struct.pack(">L", cumul))
+
+    return cumul
 
 
 class Écrivain:
@@ -52,9 +296,36 @@ class Écrivain:
         à minimiser le nombre de blocs.
         """
         assert bloc >= 0, "Valeur positive ou nulle"
+        self.chemin = chemin
+        self.base = base
         self.bloc = bloc
 
+        # Fonctions appelées avec l'écrivain une fois le fichier clos
+        self.à_la_clôture = list()
+
+        # Sections du pied, dont les statistiques
+        self.sections = dict()
+        self.statistiques = Statistiques(base)
+
         if reprise and os.path.exists(chemin):
+            # Seule une fin de fichier douteuse impose de tout parcourir
+            with open(chemin, "rb") as entrée:
+                with _projection(entrée) as données:
+                    intègre = _fin_intègre(données)
+                    self.contrôlé = _est_contrôlé(données)
+            if not intègre:
+                réparer(chemin)
+
+            # Sans pied, les statistiques sont recalculées
+            with Lecteur(chemin) as lecteur:
+                début_pied, self.sections = lecteur.pied()
+                if STAT in self.sections:
+                    self.statistiques = Statistiques.depuis_octets(
+                        base, self.sections[STAT])
+                else:
+                    self.statistiques = Statistiques.depuis_lots(
+                        base, lecteur.iter_lots(lecteur.TAMPON))
+
             self.sortie = open(chemin, "r+b")
 
             # Lecture du nombre de codes
@@ -62,18 +333,21 @@ class Écrivain:
             tampon = self.sortie.read(4)
             self._nb_codes = struct.unpack(">L", tampon)[0]
 
-            # Repositionnement de la tête d'écriture
+            # Retrait du pied, puis repositionnement de la tête d'écriture
+            self.sortie.truncate(début_pied)
             self.sortie.seek(-1, os.SEEK_END)
         else:
             self.sortie = open(chemin, "wb")
 
             # Écriture de l'en-tête
-            self.sortie.write(b"TECTONIC\x01")
+            self.contrôlé = True
+            self.sortie.write(PRÉLUDE_CONTRÔLÉ)
             self.sortie.write(
                 struct.pack(">BBB", base.hauteur, base.largeur, base.maximum))
 
-            # Réservation de 4 octets pour la taille
-            self.sortie.write(b"\x00" * 4)
+            # Nombre de codes, puis marqueur de fin
+            self.sortie.write(struct.pack(">LB", 0, 128))
+            self.sortie.seek(-1, os.SEEK_END)
 
             self._nb_codes = 0
 
@@ -91,83 +365,165 @@ class Écrivain:
         """Transfère les codes en cache dans le fichier
         """
         tailles = sorted(self.cache)
+        if len(tailles) == 0:
+            return
 
         while len(tailles) > 0:
-            # Marqueur de structure
-            nb_tailles = min(127, len(tailles))
-            self.sortie.write(struct.pack(">B", nb_tailles))
-
             # Structure
+            nb_tailles = min(CONTRÔLE - 1 if self.contrôlé else 127,
+                             len(tailles))
+            bloc = [
+                en_tête_bloc([(taille, len(self.cache[taille]))
+                              for taille in tailles[:nb_tailles]],
+                             self.contrôlé)
+            ]
+
+            # Contenu, un segment à la fois
             for taille in tailles[:nb_tailles]:
-                self.sortie.write(
-                    struct.pack(">BL", taille, len(self.cache[taille])))
-
-            # Contenu
-            for taille in tailles[:nb_tailles]:
-                for code in self.cache[taille]:
-                    self.sortie.write(
-                        code.to_bytes(length=taille,
-                                      byteorder="big",
-                                      signed=False))
+                bloc.append(self._segment(taille, self.cache[taille]))
                 self._nb_codes += len(self.cache[taille])
+                self.statistiques.ajouter_lot(self.cache[taille], taille)
+
+            # Contrôle
+            bloc = b"".join(bloc)
+            self.sortie.write(bloc)
+            if self.contrôlé:
+                self.sortie.write(
+                    contrôle_bloc(self._nb_codes, len(bloc),
+                                  zlib.crc32(bloc)))
 
             # Itération
             del tailles[:nb_tailles]
 
+        # Marqueur de fin, puis nombre de codes, une fois le reste sur disque
+        self.sortie.write(struct.pack(">B", 128))
+        self.sortie.flush()
+        os.pwrite(self.sortie.fileno(), struct.pack(">L", self._nb_codes), 12)
+        self.sortie.seek(-1, os.SEEK_CUR)
+
         # Suppression du cache
         self._nb_codes_en_attente = 0
         self.cache.clear()
 
     def ajouter(self, code):
-        nb_bits = max(1, code.bit_length())
-        nb_octets = (nb_bits + 7) // 8
-        self.cache.setdefault(nb_octets, list()).append(code)
+        nb_octets = (code.bit_length() + 7) // 8 or 1
+        segment = self.cache.get(nb_octets)
+        if segment is None:
+            segment = self.cache[nb_octets] = list()
+        segment.append(code)
         self._nb_codes_en_attente += 1
 
         if self._nb_codes_en_attente == self.bloc:
             self.purger()
 
-    def clore(self):
-        if self._nb_codes_en_attente != 0:
-            self.purger()
+    def ajouter_lot(self, codes):
+        """Ajoute tous les codes fournis, dans l'ordre
+        """
+        cache = self.cache
+        for code in codes:
+            nb_octets = (code.bit_length() + 7) // 8 or 1
+            segment = cache.get(nb_octets)
+            if segment is None:
+                segment = cache[nb_octets] = list()
+            segment.append(code)
+            self._nb_codes_en_attente += 1
+
+            if self._nb_codes_en_attente == self.bloc:
+                self.purger()
+
+    @staticmethod
+    def _segment(taille, codes):
+        """Octets d'un segment de codes de même taille
+        """
+        if numpy is not None and taille <= 8:
+            octets = numpy.array(codes, dtype=">u8").view(numpy.uint8)
+            return octets.reshape(len(codes), 8)[:, 8 - taille:].tobytes()
 
-        # Écriture du marqueur de fin de flux
-        self.sortie.write(struct.pack(">B", 128))
+        return b"".join([
+            code.to_bytes(length=taille, byteorder="big", signed=False)
+            for code in codes
+        ])
+
+    def clore(self):
+        # Le marqueur de fin et la taille sont tenus à jour par `purger`
+        self.purger()
 
-        # Écriture de la taille
-        self.sortie.seek(12, os.SEEK_SET)
-        self.sortie.write(struct.pack(">L", self._nb_codes))
+        # Pied, après le marqueur de fin
+        self.sections[STAT] = self.statistiques.en_octets()
+        self.sortie.seek(0, os.SEEK_END)
+        self.sortie.write(encoder_pied(self.sections))
 
         # Fermeture
         self.sortie.close()
         self.sortie = None
 
+        for rappel in self.à_la_clôture:
+            rappel(self)
+
 
 class Lecteur:
+    """Lecteur à accès direct, s'appuyant sur une projection en mémoire
+
+    Les en-têtes de blocs décrivent des segments de codes de même taille :
+    ils sont indexés une fois pour toutes, au premier besoin, ce qui permet
+    d'atteindre le code n°n sans lire ceux qui le précèdent.
+
+    Un fichier tronqué est lu jusqu'à son dernier bloc complet :
+
+    >>> import os
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as dossier:
+    ...     chemin = os.path.join(dossier, "tronqué.log")
+    ...     écrivain = Écrivain(chemin, Base(hauteur=3, largeur=3, maximum=4),
+    ...                         1000)
+    ...     écrivain.ajouter_lot(range(259, 259 + 256 * 10000, 256))
+    ...     écrivain.clore()
+    ...     os.truncate(chemin, os.path.getsize(chemin) // 2)
+    ...     with Lecteur(chemin) as lecteur:
+    ...         codes = list(lecteur)
+    >>> lecteur.nb_codes, len(lecteur), codes == list(range(259, 259 + 256 *
+    ...                                                    len(codes), 256))
+    (10000, 5000, True)
+    """
 
     FORMAT = 1
 
+    # Nombre maximal de codes décodés d'un coup
+    TAMPON = 2**16
+
     def __init__(self, chemin):
         self.chemin = chemin
-        self.entrée = open(chemin, "rb")
+        with open(chemin, "rb") as entrée:
+            self.données = _projection(entrée)
 
         # Vérification du prélude
-        prélude = self.entrée.read(9)
-        assert prélude == b"TECTONIC\x01"
+        assert self.données[:9] in (PRÉLUDE, PRÉLUDE_CONTRÔLÉ)
 
         # Dimensions
-        tampon = self.entrée.read(3)
-        hauteur, largeur, maximum = struct.unpack(">3B", tampon)
+        hauteur, largeur, maximum = struct.unpack_from(">3B", self.données, 9)
         self._base = Base(largeur=largeur, hauteur=hauteur, maximum=maximum)
 
         # Nombre de codes
-        tampon = self.entrée.read(4)
-        self.nb_codes = struct.unpack(">L", tampon)[0]
+        self.nb_codes = struct.unpack_from(">L", self.données, 12)[0]
+
+        # Index des segments, construit à la demande
+        self._segments = None
+        self._rangs = None
 
         # Préparation de l'itération
-        self.fin_rencontrée = False
         self.id_code = 0
-        self.cache = list()
+        self._codes = iter(())
+
+    def close(self):
+        """Libère la projection en mémoire du fichier
+        """
+        self.données.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     @property
     def base(self):
@@ -175,36 +531,174 @@ class Lecteur:
         """
         return self._base
 
+    def pied(self):
+        """Début du pied, qui suit le marqueur de fin, et ses sections
+        {type: contenu}
+
+        Sans pied, le début est la fin du fichier.
+        """
+        return lire_pied(self.données)
+
+    @property
+    def sections(self):
+        """Sections du pied, {type: contenu}
+        """
+        return self.pied()[1]
+
+    @property
+    def statistiques(self):
+        """Statistiques lues dans le pied, None pour un fichier qui n'en a
+        pas
+        """
+        contenu = self.sections.get(STAT)
+        if contenu is None:
+            return None
+        return Statistiques.depuis_octets(self.base, contenu)
+
+    @property
+    def segments(self):
+        """Liste des segments (premier rang, décalage, taille, nombre)
+        """
+        if self._segments is None:
+            self._indexer()
+        return self._segments
+
+    def __len__(self):
+        """Nombre de codes effectivement présents dans le fichier
+        """
+        if len(self.segments) == 0:
+            return 0
+        rang, _, _, nombre = self.segments[-1]
+        return rang + nombre
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            début, fin, pas = n.indices(len(self))
+            if pas == 1:
+                return list(self.iter_range(début, fin))
+            return [self[i] for i in range(début, fin, pas)]
+
+        if n < 0:
+            n += len(self)
+        if not (0 <= n < len(self)):
+            raise IndexError(f"Code n°{n} hors du fichier")
+
+        rang, décalage, taille, _ = self.segments[
+            bisect.bisect_right(self._rangs, n) - 1]
+        décalage += (n - rang) * taille
+        return int.from_bytes(self.données[décalage:décalage + taille],
+                              byteorder="big",
+                              signed=False)
+
+    def iter_range(self, début, fin):
+        """Itérateur des codes de rang début (inclus) à fin (exclu)
+        """
+        for morceau in self._morceaux(début, fin):
+            yield from morceau
+
+    def iter_lots(self, n, début=0, fin=None):
+        """Itérateur de listes d'au plus 'n' codes consécutifs, de rang
+        début (inclus) à fin (exclu)
+        """
+        if fin is None:
+            fin = len(self)
+
+        paquet = list()
+        for morceau in self._morceaux(début, fin):
+            i = 0
+            while i < len(morceau):
+                j = i + n - len(paquet)
+                paquet.extend(morceau[i:j])
+                i = j
+                if len(paquet) == n:
+                    yield paquet
+                    paquet = list()
+        if len(paquet) > 0:
+            yield paquet
+
+    def lire_segment(self, k, premier=0, dernier=None):
+        """Codes du segment n°k, de rang premier (inclus) à dernier (exclu)
+        au sein du segment
+
+        Les codes d'au plus 8 octets sont lus d'un bloc dans un tableau NumPy
+        d'entiers non signés sur 64 bits, les autres sous forme de liste.
+        """
+        _, décalage, taille, nombre = self.segments[k]
+        if dernier is None or dernier > nombre:
+            dernier = nombre
+        nb_codes = max(0, dernier - premier)
+        décalage += premier * taille
+
+        if numpy is not None and taille <= 8:
+            if taille == 8:
+                retour = numpy.frombuffer(self.données, dtype=">u8",
+                                          count=nb_codes, offset=décalage)
+            else:
+                # Complément à 8 octets, par la gauche (gros-boutiste)
+                octets = numpy.frombuffer(self.données, dtype=numpy.uint8,
+                                          count=nb_codes * taille,
+                                          offset=décalage)
+                tampon = numpy.zeros((nb_codes, 8), dtype=numpy.uint8)
+                tampon[:, 8 - taille:] = octets.reshape(nb_codes, taille)
+                retour = tampon.view(">u8").ravel()
+            return retour.astype(numpy.uint64)
+
+        vue = memoryview(self.données)[décalage:décalage + nb_codes * taille]
+        return [
+            int.from_bytes(vue[j:j + taille], byteorder="big", signed=False)
+            for j in range(0, nb_codes * taille, taille)
+        ]
+
     def __iter__(self):
-        self.entrée.seek(16, os.SEEK_SET)
-        self.fin_rencontrée = False
         self.id_code = 0
-        self.cache.clear()
+        self._codes = self.iter_range(0, len(self))
         return self
 
     def __next__(self):
-        if len(self.cache) == 0:
-            self._charger()
-        if self.fin_rencontrée:
-            raise StopIteration
-        else:
-            taille, nombre = self.cache[0]
-            retour = int.from_bytes(self.entrée.read(taille),
-                                    byteorder="big",
-                                    signed=False)
-            self.id_code += 1
-            nombre -= 1
-            if nombre == 0:
-                del self.cache[0]
-            else:
-                self.cache[0] = (taille, nombre)
-            return retour
+        retour = next(self._codes)
+        self.id_code += 1
+        return retour
 
-    def _charger(self):
-        marqueur = struct.unpack(">B", self.entrée.read(1))[0]
-        if marqueur > 127:
-            self.fin_rencontrée = True
-        else:
-            for k in range(marqueur):
-                paire = struct.unpack(">BL", self.entrée.read(5))
-                self.cache.append(paire)
+    def _morceaux(self, début, fin):
+        """Itérateur de listes de codes, segment par segment, d'au plus
+        `TAMPON` codes chacune
+        """
+        fin = min(fin, len(self))
+        if début >= fin:
+            return
+
+        k = bisect.bisect_right(self._rangs, début) - 1
+        for rang, _, _, nombre in self.segments[k:]:
+            if rang >= fin:
+                break
+            dernier = min(fin, rang + nombre) - rang
+            for premier in range(max(début, rang) - rang, dernier,
+                                 self.TAMPON):
+                morceau = self.lire_segment(
+                    k, premier, min(premier + self.TAMPON, dernier))
+                if not isinstance(morceau, list):
+                    morceau = morceau.tolist()
+                yield morceau
+            k += 1
+
+    def _indexer(self):
+        """Parcourt les seuls en-têtes de blocs
+
+        Comme pour `_blocs`, l'indexation s'arrête au premier bloc tronqué :
+        seuls les codes effectivement présents sont indexés.
+        """
+        self._segments = list()
+        données = self.données
+        rang = 0
+        contrôlé = _est_contrôlé(données)
+        for début, _, _, _ in _blocs(données, contrôler=False):
+            nb_paires, _ = lire_marqueur(données[début], contrôlé)
+            position = début + 1 + 5 * nb_paires
+            for k in range(nb_paires):
+                taille, nombre = struct.unpack_from(">BL", données,
+                                                    début + 1 + 5 * k)
+                self._segments.append((rang, position, taille, nombre))
+                rang += nombre
+                position += taille * nombre
+
+        self._rangs = [segment[0] for segment in self._segments]
@@ -0,0 +1,577 @@
+# -*- coding:utf-8 -*-
+"""Format de fichier binaire trié, par différences
+
+Définition de l'en-tête (16 octets):
+
+  +---+---------------------------------------+
+  | s | "TECTONIC"                            |
+  | B | numéro de version : '\x02'            |
+  | B | Base.hauteur                          |
+  | B | Base.largeur                          |
+  | B | Base.maximum                          |
+  | L | nombre total de codes                 |
+  +---+---------------------------------------+
+
+Définition d'un bloc:
+
+  +---+---------------------------------------+
+  | B | drapeaux : '\b00000001' si zlib       |
+  | L | nombre de codes du bloc               |
+  | L | taille du contenu (en octets)         |
+  +---+---------------------------------------+
+
+  puis le contenu, éventuellement compressé par zlib :
+
+   le premier code du bloc, en varint
+   la différence entre chaque code et le précédent, en varint
+
+Les codes sont triés au sein de chaque bloc. Un varint range 7 bits par
+octet, poids faibles en tête, le bit de poids fort signalant qu'un octet
+suit.
+
+Définition de l'index, qui suit le dernier bloc:
+
+  +---+---------------------------------------+
+  | Q | position du bloc dans le fichier      |
+  | L | nombre de codes du bloc               |
+  | v | premier code du bloc, en varint       |
+  +---+---------------------------------------+
+
+  (×nombre de blocs)
+
+Définition de la fin de fichier (14 octets):
+
+  +---+---------------------------------------+
+  | Q | position de l'index                   |
+  | L | nombre de blocs                       |
+  | B | drapeaux : '\b00000001' si le fichier |
+  |   | est trié dans son ensemble,           |
+  |   | '\b00000010' si l'index est précédé   |
+  |   | d'un pied                             |
+  | B | marqueur de fin : '\b10000000'        |
+  +---+---------------------------------------+
+
+Le pied, qui porte notamment les statistiques des codes écrits, est décrit
+dans `statistiques`.
+"""
+
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import Base
+from .statistiques import STAT
+from .statistiques import Statistiques
+from .statistiques import encoder_pied
+from .statistiques import lire_pied
+
+# Drapeaux de bloc
+ZLIB = 0x01
+
+# Drapeaux de fin de fichier
+TRIÉ = 0x01
+PIED = 0x02
+
+_FIN = struct.Struct(">QLBB")
+_BLOC = struct.Struct(">BLL")
+_INDEX = struct.Struct(">QL")
+
+
+# Un mot de 63 bits occupe exactement 9 octets de varint
+_MOT = 63
+_OCTETS_MOT = 9
+
+
+def encoder_varints(valeurs):
+    """Octets de la suite de valeurs positives, en varints
+
+    Avec NumPy, les valeurs d'au plus 126 bits sont traitées d'un bloc,
+    scindées en deux mots de 63 bits.
+
+    >>> encoder_varints([0, 1, 127, 128, 300])
+    b'\\x00\\x01\\x7f\\x80\\x01\\xac\\x02'
+    >>> décoder_varints(_)
+    [0, 1, 127, 128, 300]
+    >>> décoder_varints(encoder_varints([2**70, 5]))
+    [1180591620717411303424, 5]
+    >>> décoder_varints(encoder_varints([2**130, 5]))
+    [1361129467683753853853498429727072845824, 5]
+    """
+    if (numpy is not None and len(valeurs) > 0
+            and max(valeurs).bit_length() <= 2 * _MOT):
+        masque_mot = (1 << _MOT) - 1
+        mots = [
+            numpy.array([v & masque_mot for v in valeurs],
+                        dtype=numpy.uint64),
+            numpy.array([v >> _MOT for v in valeurs], dtype=numpy.uint64),
+        ]
+
+        # Nombre d'octets de chaque varint : celui du mot de poids fort, s'il
+        # est non nul, vient s'ajouter à 9
+        longueurs = [numpy.ones(len(valeurs), dtype=numpy.int64)
+                     for _ in mots]
+        for longueur, mot in zip(longueurs, mots):
+            for k in range(1, _OCTETS_MOT):
+                longueur += mot >= (1 << (7 * k))
+        longueurs = numpy.where(mots[1] > 0, _OCTETS_MOT + longueurs[1],
+                                longueurs[0])
+        positions = numpy.cumsum(longueurs) - longueurs
+
+        retour = numpy.zeros(int(longueurs.sum()), dtype=numpy.uint8)
+        for k in range(int(longueurs.max())):
+            masque = longueurs > k
+            mot = mots[k // _OCTETS_MOT][masque]
+            octets = (mot >> numpy.uint64(7 * (k % _OCTETS_MOT))) & 0x7F
+            octets |= (longueurs[masque] > k + 1).astype(numpy.uint64) << 7
+            retour[positions[masque] + k] = octets
+        return retour.tobytes()
+
+    retour = bytearray()
+    for valeur in valeurs:
+        while valeur > 0x7F:
+            retour.append(0x80 | (valeur & 0x7F))
+            valeur >>= 7
+        retour.append(valeur)
+    return bytes(retour)
+
+
+def décoder_varints(octets):
+    """Liste des valeurs encodées en varints
+    """
+    if numpy is not None and len(octets) > 0:
+        tampon = numpy.frombuffer(octets, dtype=numpy.uint8)
+        fins = numpy.flatnonzero(tampon < 0x80)
+        débuts = numpy.concatenate(([0], fins[:-1] + 1))
+        longueurs = fins - débuts + 1
+
+        if longueurs.max() <= 2 * _OCTETS_MOT:
+            mots = [numpy.zeros(len(fins), dtype=numpy.uint64)
+                    for _ in range(2)]
+            for k in range(int(longueurs.max())):
+                masque = longueurs > k
+                octets_k = tampon[débuts[masque] + k] & 0x7F
+                mots[k // _OCTETS_MOT][masque] |= (
+                    octets_k.astype(numpy.uint64)
+                    << numpy.uint64(7 * (k % _OCTETS_MOT)))
+
+            if longueurs.max() <= _OCTETS_MOT:
+                return mots[0].tolist()
+            return [
+                fort << _MOT | faible
+                for faible, fort in zip(mots[0].tolist(), mots[1].tolist())
+            ]
+
+    retour = list()
+    valeur = 0
+    décalage = 0
+    for octet in octets:
+        valeur |= (octet & 0x7F) << décalage
+        if octet & 0x80:
+            décalage += 7
+        else:
+            retour.append(valeur)
+            valeur = 0
+            décalage = 0
+    return retour
+
+
+def _lire_varint(données, position):
+    """Paire (valeur, position suivante) du varint lu à la position fournie
+    """
+    valeur = 0
+    décalage = 0
+    while True:
+        octet = données[position]
+        position += 1
+        valeur |= (octet & 0x7F) << décalage
+        if octet & 0x80 == 0:
+            return valeur, position
+        décalage += 7
+
+
+class Écrivain:
+    """Codes triés par blocs, indexés en fin de fichier
+    """
+
+    FORMAT = 2
+
+    def __init__(self, chemin, base, bloc=2**16, *, reprise=False,
+                 compression=False):
+        """Prépare une nouvelle sortie
+
+        'bloc' détermine le nombre de codes par bloc, triés ensemble avant
+        écriture. 'compression' active la compression zlib des blocs.
+        """
+        assert bloc > 0, "Valeur strictement positive"
+        self.chemin = chemin
+        self.base = base
+        self.bloc = bloc
+
+        # Fonctions appelées avec l'écrivain une fois le fichier clos
+        self.à_la_clôture = list()
+        self.compression = compression
+
+        # Index des blocs : (position, nombre, premier code)
+        self.index = list()
+        self.trié = True
+        self._dernier = 0
+
+        # Sections du pied, dont les statistiques
+        self.sections = dict()
+        self.statistiques = Statistiques(base)
+
+        if reprise and os.path.exists(chemin):
+            # Relecture de l'index et du pied, qui seront réécrits à la
+            # clôture ; sans pied, les statistiques sont recalculées
+            with Lecteur(chemin) as lecteur:
+                self.index = list(lecteur.index)
+                self.trié = lecteur.trié
+                if len(self.index) > 0:
+                    self._dernier = lecteur.lire_bloc(len(self.index) - 1)[-1]
+                self._nb_codes = len(lecteur)
+                début_pied, self.sections = lecteur.pied()
+                if STAT in self.sections:
+                    self.statistiques = Statistiques.depuis_octets(
+                        base, self.sections[STAT])
+                else:
+                    self.statistiques = Statistiques.depuis_lots(
+                        base, lecteur.iter_lots(2**16))
+
+            # Repositionnement de la tête d'écriture
+            self.sortie = open(chemin, "r+b")
+            self.sortie.seek(début_pied, os.SEEK_SET)
+            self.sortie.truncate()
+        else:
+            self.sortie = open(chemin, "wb")
+
+            # Écriture de l'en-tête
+            self.sortie.write(b"TECTONIC\x02")
+            self.sortie.write(
+                struct.pack(">BBB", base.hauteur, base.largeur, base.maximum))
+
+            # Réservation de 4 octets pour la taille
+            self.sortie.write(b"\x00" * 4)
+
+            self._nb_codes = 0
+
+        self.cache = list()
+
+    @property
+    def nb_codes(self):
+        """Nombre total d'enregistrements disponibles
+        """
+        return self._nb_codes + len(self.cache)
+
+    def purger(self):
+        """Transfère les codes en cache dans le fichier, en un bloc
+        """
+        if len(self.cache) == 0:
+            return
+
+        codes = sorted(self.cache)
+        if codes[0] < self._dernier:
+            self.trié = False
+        self._dernier = codes[-1]
+
+        # Le premier code, bien plus grand que les différences, est encodé à
+        # part pour ne pas les priver du chemin NumPy
+        contenu = encoder_varints([codes[0]]) + encoder_varints(
+            [b - a for a, b in zip(codes, codes[1:])])
+        drapeaux = 0
+        if self.compression:
+            contenu = zlib.compress(contenu)
+            drapeaux |= ZLIB
+
+        self.index.append((self.sortie.tell(), len(codes), codes[0]))
+        self.sortie.write(_BLOC.pack(drapeaux, len(codes), len(contenu)))
+        self.sortie.write(contenu)
+
+        self._nb_codes += len(codes)
+        self.statistiques.ajouter_lot(codes)
+        self.cache.clear()
+
+    def ajouter(self, code):
+        self.cache.append(code)
+        if len(self.cache) == self.bloc:
+            self.purger()
+
+    def ajouter_lot(self, codes):
+        """Ajoute tous les codes fournis
+        """
+        for code in codes:
+            self.cache.append(code)
+            if len(self.cache) == self.bloc:
+                self.purger()
+
+    def clore(self):
+        self.purger()
+
+        # Écriture du pied
+        self.sections[STAT] = self.statistiques.en_octets()
+        self.sortie.write(encoder_pied(self.sections))
+
+        # Écriture de l'index
+        position_index = self.sortie.tell()
+        for position, nombre, premier in self.index:
+            self.sortie.write(_INDEX.pack(position, nombre))
+            self.sortie.write(encoder_varints([premier]))
+
+        # Écriture de la fin de fichier
+        self.sortie.write(
+            _FIN.pack(position_index, len(self.index),
+                      PIED | (TRIÉ if self.trié else 0), 128))
+
+        # Écriture de la taille
+        self.sortie.seek(12, os.SEEK_SET)
+        self.sortie.write(struct.pack(">L", self._nb_codes))
+
+        # Fermeture
+        self.sortie.close()
+        self.sortie = None
+
+        for rappel in self.à_la_clôture:
+            rappel(self)
+
+
+class Lecteur:
+    """Lecteur à accès direct, bloc par bloc
+
+    L'index permet d'atteindre le bloc contenant le code n°n, ou le premier
+    code supérieur à une valeur si le fichier est trié. Le dernier bloc
+    décodé est conservé.
+    """
+
+    FORMAT = 2
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        with open(chemin, "rb") as entrée:
+            self.données = mmap.mmap(entrée.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+
+        # Vérification du prélude
+        if self.données[:9] != b"TECTONIC\x02":
+            raise ValueError(f"«{chemin}» n'est pas au format n°2")
+
+        # Dimensions
+        hauteur, largeur, maximum = struct.unpack_from(">3B", self.données, 9)
+        self._base = Base(largeur=largeur, hauteur=hauteur, maximum=maximum)
+
+        # Nombre de codes
+        self.nb_codes = struct.unpack_from(">L", self.données, 12)[0]
+
+        # Fin de fichier, puis index, qui doit s'y terminer
+        fin = len(self.données) - _FIN.size
+        if fin < 16:
+            raise ValueError(f"«{chemin}» tronqué")
+        self.position_index, nb_blocs, drapeaux, marqueur = _FIN.unpack_from(
+            self.données, fin)
+        if marqueur != 128 or not (16 <= self.position_index <= fin):
+            raise ValueError(f"«{chemin}» tronqué ou sans fin de fichier")
+        self.trié = bool(drapeaux & TRIÉ)
+        self._pied = bool(drapeaux & PIED)
+
+        self.index = list()
+        self.rangs = list()
+        rang = 0
+        position = self.position_index
+        for _ in range(nb_blocs):
+            if position + _INDEX.size >= fin:
+                break
+            position_bloc, nombre = _INDEX.unpack_from(self.données, position)
+            premier, position = _lire_varint(self.données,
+                                             position + _INDEX.size)
+            if not (16 <= position_bloc < self.position_index):
+                break
+            self.index.append((position_bloc, nombre, premier))
+            self.rangs.append(rang)
+            rang += nombre
+        if position != fin or len(self.index) != nb_blocs:
+            raise ValueError(f"«{chemin}» : index incohérent")
+        self._nb_lus = rang
+
+        # Dernier bloc décodé
+        self._bloc = (None, None)
+
+        # Préparation de l'itération
+        self.id_code = 0
+        self._codes = iter(())
+
+    def close(self):
+        """Libère la projection en mémoire du fichier
+        """
+        self.données.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def base(self):
+        """Base commune à tous les codes
+        """
+        return self._base
+
+    def __len__(self):
+        """Nombre de codes effectivement présents dans le fichier
+        """
+        return self._nb_lus
+
+    def pied(self):
+        """Début du pied, qui précède l'index, et ses sections
+        {type: contenu}
+
+        Sans pied, le début est celui de l'index.
+        """
+        if not self._pied:
+            return self.position_index, dict()
+        return lire_pied(self.données, self.position_index)
+
+    @property
+    def sections(self):
+        """Sections du pied, {type: contenu}
+        """
+        return self.pied()[1]
+
+    @property
+    def statistiques(self):
+        """Statistiques lues dans le pied, None pour un fichier qui n'en a
+        pas
+        """
+        contenu = self.sections.get(STAT)
+        if contenu is None:
+            return None
+        return Statistiques.depuis_octets(self.base, contenu)
+
+    def lire_bloc(self, k):
+        """Liste triée des codes du bloc n°k
+        """
+        if self._bloc[0] == k:
+            return self._bloc[1]
+
+        position = self.index[k][0]
+        drapeaux, _, taille = _BLOC.unpack_from(self.données, position)
+        position += _BLOC.size
+        contenu = self.données[position:position + taille]
+        if drapeaux & ZLIB:
+            contenu = zlib.decompress(contenu)
+
+        premier, position = _lire_varint(contenu, 0)
+        retour = list(
+            itertools.accumulate(décoder_varints(contenu[position:]),
+                                 initial=premier))
+        self._bloc = (k, retour)
+        return retour
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            début, fin, pas = n.indices(len(self))
+            if pas == 1:
+                return list(self.iter_range(début, fin))
+            return [self[i] for i in range(début, fin, pas)]
+
+        if n < 0:
+            n += len(self)
+        if not (0 <= n < len(self)):
+            raise IndexError(f"Code n°{n} hors du fichier")
+
+        k = bisect.bisect_right(self.rangs, n) - 1
+        return self.lire_bloc(k)[n - self.rangs[k]]
+
+    def iter_range(self, début, fin):
+        """Itérateur des codes de rang début (inclus) à fin (exclu)
+        """
+        for morceau in self._morceaux(début, fin):
+            yield from morceau
+
+    def iter_lots(self, n, début=0, fin=None):
+        """Itérateur de listes d'au plus 'n' codes consécutifs, de rang
+        début (inclus) à fin (exclu)
+        """
+        if fin is None:
+            fin = len(self)
+
+        paquet = list()
+        for morceau in self._morceaux(début, fin):
+            i = 0
+            while i < len(morceau):
+                j = i + n - len(paquet)
+                paquet.extend(morceau[i:j])
+                i = j
+                if len(paquet) == n:
+                    yield paquet
+                    paquet = list()
+        if len(paquet) > 0:
+            yield paquet
+
+    def __iter__(self):
+        self.id_code = 0
+        self._codes = self.iter_range(0, len(self))
+        return self
+
+    def __next__(self):
+        retour = next(self._codes)
+        self.id_code += 1
+        return retour
+
+    def _morceaux(self, début, fin):
+        """Itérateur de listes de codes, bloc par bloc
+        """
+        fin = min(fin, len(self))
+        if début >= fin:
+            return
+
+        k = bisect.bisect_right(self.rangs, début) - 1
+        while k < len(self.index) and self.rangs[k] < fin:
+            rang = self.rangs[k]
+            codes = self.lire_bloc(k)
+            yield codes[max(début, rang) - rang:min(fin, rang + len(codes)) -
+                        rang]
+            k += 1
+
+
+def intègre(chemin):
+    """Vrai si la fin de fichier et l'index sont valides, et que les blocs
+    indexés s'y trouvent bien
+
+    Seuls l'index et les en-têtes de blocs sont relus.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as dossier:
+    ...     chemin = os.path.join(dossier, "h03l03m04.log")
+    ...     écrivain = Écrivain(chemin, Base(hauteur=3, largeur=3, maximum=4),
+    ...                         bloc=2)
+    ...     écrivain.ajouter_lot([259, 515, 771])
+    ...     écrivain.clore()
+    ...     avant = intègre(chemin)
+    ...     os.truncate(chemin, os.path.getsize(chemin) - 3)
+    ...     avant, intègre(chemin)
+    (True, False)
+    """
+    try:
+        lecteur = Lecteur(chemin)
+    except (ValueError, struct.error):
+        return False
+
+    with lecteur:
+        retour = len(lecteur) == lecteur.nb_codes
+        fin = lecteur.pied()[0]
+        for position, nombre, _ in reversed(lecteur.index):
+            if not retour:
+                break
+            _, nombre_bloc, taille = _BLOC.unpack_from(lecteur.données,
+                                                       position)
+            retour = (nombre_bloc == nombre
+                      and position + _BLOC.size + taille <= fin)
+            fin = position
+    return retour
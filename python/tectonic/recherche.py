@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""Recherche dichotomique dans un fichier de codes triés
+
+Les codes d'un fichier trié (par `trieur.py` par exemple) sont atteints par
+dichotomie : d'abord parmi les premiers codes de chaque segment (format n°1)
+ou de chaque bloc (format n°2), puis au sein de celui-ci.
+
+Les recherches par lot trient les codes demandés, puis les confrontent au
+fichier bloc par bloc en une seule passe : chaque bloc concerné n'est lu
+qu'une fois, et la position trouvée pour un code sert de point de départ à
+une recherche exponentielle pour le suivant.
+"""
+
+import bisect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Les blocs lus par NumPy sont des entiers non signés sur 64 bits
+_LIMITE_NUMPY = 2**64
+
+
+def _galoper(séquence, valeur, début=0):
+    """Position d'insertion de 'valeur' dans 'séquence' triée, à gauche,
+    sachant qu'elle n'est pas avant 'début'
+
+    La distance parcourue depuis 'début' double à chaque pas avant la
+    dichotomie finale : le coût est logarithmique en cette distance et non
+    en la taille de la séquence.
+
+    >>> _galoper([1, 3, 3, 5, 8, 13], 3)
+    1
+    >>> _galoper([1, 3, 3, 5, 8, 13], 6, 2)
+    4
+    >>> _galoper([1, 3, 3, 5, 8, 13], 21, 4)
+    6
+    """
+    borne = début
+    pas = 1
+    while borne < len(séquence) and séquence[borne] < valeur:
+        début = borne + 1
+        borne += pas
+        pas *= 2
+    return bisect.bisect_left(séquence, valeur, début,
+                              min(borne, len(séquence)))
+
+
+class Recherche:
+    """Accès par valeur aux codes d'un fichier trié
+
+    Le lecteur doit offrir un accès direct (formats n°1 et n°2). Le tri
+    n'est vérifiable que pour le format n°2 : pour le n°1, il est de la
+    responsabilité de l'appelant.
+    """
+
+    __slots__ = ("lecteur", "clés", "rangs", "nombres", "vectoriel")
+
+    def __init__(self, lecteur):
+        self.lecteur = lecteur
+        if lecteur.FORMAT == 1:
+            blocs = [(rang, nombre)
+                     for rang, _, _, nombre in lecteur.segments]
+            self.clés = [lecteur[rang] for rang, _ in blocs]
+        elif lecteur.FORMAT == 2:
+            if not lecteur.trié:
+                raise ValueError(f"«{lecteur.chemin}» n'est pas trié")
+            blocs = [(rang, nombre) for rang, (_, nombre, _) in zip(
+                lecteur.rangs, lecteur.index)]
+            self.clés = [premier for _, _, premier in lecteur.index]
+        else:
+            raise ValueError(f"Format n°{lecteur.FORMAT} sans accès direct")
+
+        # Premier rang et nombre de codes de chaque bloc
+        self.rangs = [rang for rang, _ in blocs]
+        self.nombres = [nombre for _, nombre in blocs]
+
+        # Le fichier étant trié, son dernier code est le plus grand
+        self.vectoriel = (numpy is not None and len(lecteur) > 0
+                          and lecteur[-1] < _LIMITE_NUMPY)
+
+    def __len__(self):
+        return len(self.lecteur)
+
+    def _bloc(self, code):
+        """Numéro du bloc où chercher 'code'
+
+        Un code égal au premier d'un bloc peut aussi terminer le précédent :
+        c'est alors dans ce dernier qu'il faut chercher.
+        """
+        return max(0, bisect.bisect_left(self.clés, code) - 1)
+
+    def _lire(self, k):
+        """Codes du bloc n°k, en tableau NumPy ou en liste
+        """
+        if self.lecteur.FORMAT == 1:
+            return self.lecteur.lire_segment(k)
+        return self.lecteur.lire_bloc(k)
+
+    def _suivant(self, k, bloc, position):
+        """Code situé à 'position' dans le bloc n°k, en débordant au besoin
+        sur le premier code du bloc suivant ; None en fin de fichier
+        """
+        if position < len(bloc):
+            return bloc[position]
+        if k + 1 < len(self.clés):
+            return self.clés[k + 1]
+        return None
+
+    def rang(self, code):
+        """Nombre de codes strictement inférieurs à 'code'
+        """
+        if len(self.clés) == 0:
+            return 0
+
+        k = self._bloc(code)
+        début = self.rangs[k]
+        if self.lecteur.FORMAT == 1:
+            # Lecture directe, code par code, sans parcourir le segment
+            return bisect.bisect_left(self.lecteur, code, début,
+                                      début + self.nombres[k])
+        return début + bisect.bisect_left(self._lire(k), code)
+
+    def contient(self, code):
+        """Vrai si 'code' figure dans le fichier
+        """
+        rang = self.rang(code)
+        return rang < len(self) and self.lecteur[rang] == code
+
+    def entre(self, a, b):
+        """Itérateur des codes c tels que a <= c < b, dans l'ordre
+        """
+        return self.lecteur.iter_range(self.rang(a), self.rang(b))
+
+    def _confronter(self, codes):
+        """Rangs et présences des codes demandés, dans l'ordre de la demande
+
+        Les codes sont triés puis répartis entre les blocs ; chaque bloc
+        concerné est lu une fois. Tant que codes et fichier tiennent sur 64
+        bits, tri et recherches sont confiés à NumPy.
+        """
+        if len(codes) == 0 or len(self.clés) == 0:
+            return [0] * len(codes), [False] * len(codes)
+        if self.vectoriel and max(codes) < _LIMITE_NUMPY:
+            return self._confronter_numpy(codes)
+
+        ordre = sorted(range(len(codes)), key=codes.__getitem__)
+        triés = [codes[i] for i in ordre]
+        rangs = [0] * len(codes)
+        présences = [False] * len(codes)
+
+        i = 0
+        while i < len(triés):
+            k, j = self._répartir(triés, i)
+            bloc = self._lire(k)
+            if not isinstance(bloc, list):
+                bloc = bloc.tolist()
+
+            position = 0
+            for indice, code in zip(ordre[i:j], triés[i:j]):
+                position = _galoper(bloc, code, position)
+                rangs[indice] = self.rangs[k] + position
+                présences[indice] = self._suivant(k, bloc, position) == code
+            i = j
+
+        return rangs, présences
+
+    def _confronter_numpy(self, codes):
+        requêtes = numpy.array(codes, dtype=numpy.uint64)
+        ordre = numpy.argsort(requêtes, kind="stable")
+        triés = requêtes[ordre]
+        rangs = numpy.empty(len(codes), dtype=numpy.int64)
+        présences = numpy.empty(len(codes), dtype=bool)
+
+        i = 0
+        while i < len(triés):
+            k, j = self._répartir(triés, i)
+            bloc = self._lire(k)
+            if isinstance(bloc, list):
+                bloc = numpy.array(bloc, dtype=numpy.uint64)
+
+            demandés = triés[i:j]
+            positions = numpy.searchsorted(bloc, demandés)
+            dedans = positions < len(bloc)
+            présents = dedans & (bloc[numpy.minimum(positions,
+                                                    len(bloc) - 1)]
+                                 == demandés)
+            if k + 1 < len(self.clés):
+                présents |= ~dedans & (demandés == self.clés[k + 1])
+            rangs[ordre[i:j]] = positions + self.rangs[k]
+            présences[ordre[i:j]] = présents
+            i = j
+
+        return rangs.tolist(), présences.tolist()
+
+    def _répartir(self, triés, i):
+        """Bloc n°k où chercher le code demandé n°i, et rang j du premier
+        code demandé relevant d'un bloc suivant
+
+        Un code égal au premier code du bloc suivant relève du bloc n°k.
+        """
+        k = self._bloc(int(triés[i]))
+        if k + 1 == len(self.clés):
+            return k, len(triés)
+        return k, bisect.bisect_right(triés, self.clés[k + 1], i)
+
+    def rang_lot(self, codes):
+        """Liste des rangs des codes demandés, dans l'ordre de la demande
+        """
+        return self._confronter(codes)[0]
+
+    def contient_lot(self, codes):
+        """Liste des présences des codes demandés, dans l'ordre de la
+        demande
+        """
+        return self._confronter(codes)[1]
@@ -4,7 +4,14 @@
 
 import copy
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import Case
 from . import Grille
+from . import GrilleCompacte
 
 
 class Codec:
@@ -23,6 +30,9 @@ class Codec:
         self.pad_dimension = 256
         self.pad_valeur = 1 + base.maximum
 
+        # Poids de chaque case dans le code, par pad_région
+        self._poids = dict()
+
     def décoder(self, code):
         """Grille de code correspondant
         """
@@ -32,6 +42,10 @@ class Codec:
         # - Décodage de la grille elle-même
         retour = Grille(copy.deepcopy(self.base))
         for case in retour.cases:
+            # -- Codage préfixe : les cases suivantes sont indéfinies
+            if code == 0:
+                break
+
             # -- Décodage de la valeur
             code, valeur = divmod(code, self.pad_valeur)
             if valeur > 0:
@@ -44,9 +58,120 @@ class Codec:
 
         return retour
 
+    def décoder_compacte(self, code):
+        """GrilleCompacte de code correspondant
+
+        La Base du Codec est partagée avec la grille produite
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> grille = codec.décoder_compacte(45665103876)
+        >>> list(grille.valeurs[:6]), list(grille.régions[:6])
+        ([2, 1, 2, 3, 3, 4], [0, 0, 1, 1, 0, 2])
+        >>> grille == codec.décoder(45665103876).compacter()
+        True
+        >>> codec.encoder(grille)
+        45665103876
+        """
+        return self.décoder_préfixe(code, self.base.nb_cases())
+
+    def décoder_préfixe(self, code, nb_cases):
+        """GrilleCompacte dont seules les 'nb_cases' premières cases sont
+        décodées
+
+        Le codage étant préfixe, le décodage s'arrête aussi dès que le reste
+        du code est nul : toutes les cases suivantes sont indéfinies.
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> grille = codec.décoder_préfixe(45665103876, 2)
+        >>> list(grille.valeurs[:4]), list(grille.régions[:4])
+        ([2, 1, -1, -1], [0, 0, -1, -1])
+        """
+        # - Décodage des caractéristiques du format
+        code, pad_région = divmod(code, self.pad_dimension)
+
+        # - Décodage de la grille elle-même, un chiffre (valeur, région) à la
+        # fois
+        retour = GrilleCompacte(self.base)
+        valeurs = retour.valeurs
+        régions = retour.régions
+        pad_valeur = self.pad_valeur
+        pad_case = pad_valeur * pad_région
+        for i in range(nb_cases):
+            if code == 0:
+                break
+            code, chiffre = divmod(code, pad_case)
+            région, valeur = divmod(chiffre, pad_valeur)
+            if valeur > 0:
+                valeurs[i] = valeur
+            if région > 0:
+                régions[i] = région - 1
+
+        return retour
+
+    def décoder_lot(self, codes):
+        """Valeurs et régions d'un lot de codes, sous forme de matrices
+
+        Renvoie deux tableaux (N, nb_cases) d'entiers non signés sur 8 bits.
+        Comme dans le code, la valeur 0 représente une caractéristique
+        indéfinie : les identifiants de région sont donc décalés d'une unité.
+
+        Les codes sont regroupés par `pad_région`. Pour chaque groupe, les
+        chiffres sont extraits par paquets de k cases, k étant choisi pour
+        que chaque paquet tienne sur 64 bits : seul ce découpage est effectué
+        entier par entier, le reste est vectorisé.
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> valeurs, régions = codec.décoder_lot([45665103876, 1])
+        >>> valeurs[:, :7].tolist(), régions[:, :7].tolist()
+        ([[2, 1, 2, 3, 3, 4, 0], [0, 0, 0, 0, 0, 0, 0]], \
+[[1, 1, 2, 2, 1, 3, 0], [0, 0, 0, 0, 0, 0, 0]])
+        """
+        if numpy is None:
+            raise ImportError("NumPy est nécessaire au décodage par lots")
+
+        nb_cases = self.base.nb_cases()
+        chiffres = numpy.zeros((len(codes), nb_cases), dtype=numpy.uint16)
+
+        # - Décodage des caractéristiques du format
+        groupes = dict()
+        for n, code in enumerate(codes):
+            groupes.setdefault(code % self.pad_dimension, list()).append(n)
+
+        # - Décodage des grilles, groupe par groupe
+        for pad_région, indices in groupes.items():
+            pad_case = self.pad_valeur * pad_région
+            k = 1
+            while pad_case**(k + 1) < 2**64:
+                k += 1
+            pad_paquet = pad_case**k
+
+            groupe = numpy.zeros((len(indices), nb_cases), dtype=numpy.uint16)
+            restes = [codes[n] // self.pad_dimension for n in indices]
+            for début in range(0, nb_cases, k):
+                # Codage préfixe : les cases suivantes sont toutes indéfinies
+                if not any(restes):
+                    break
+                paquets = numpy.array([r % pad_paquet for r in restes],
+                                      dtype=numpy.uint64)
+                restes = [r // pad_paquet for r in restes]
+                for i in range(début, min(début + k, nb_cases)):
+                    groupe[:, i] = paquets % pad_case
+                    paquets //= pad_case
+            chiffres[indices] = groupe
+
+        valeurs = (chiffres % self.pad_valeur).astype(numpy.uint8)
+        régions = (chiffres // self.pad_valeur).astype(numpy.uint8)
+        return valeurs, régions
+
     def encoder(self, grille):
-        """Code associé à la Grille fournie
+        """Code associé à la Grille (ou GrilleCompacte) fournie
         """
+        if isinstance(grille, GrilleCompacte):
+            return self._encoder_compacte(grille)
+
         pad_région = 1 + grille.nb_régions()
 
         # - Encodage de la grille elle-même
@@ -67,3 +192,467 @@ class Codec:
         retour += pad_région
 
         return retour
+
+    def code_canonique(self, code):
+        """Code de la forme canonique (et normale) de la grille identifiée
+
+        Toutes les grilles d'une même classe de symétrie partagent ce code.
+        Ici, les deux grilles ont les mêmes valeurs, à une symétrie près :
+        c'est la structure des régions qui les départage.
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=3, maximum=4))
+        >>> print(codec.décoder_compacte(1045670321714520580))
+        +-+-+-+-+
+        |1 2|3 4|
+        + + + + +
+        |3 4|1 2|
+        +-+-+-+-+
+        |1 2 3 4|
+        +-+-+-+-+
+        >>> codec.code_canonique(1045670321714520580)
+        1044983918324568580
+        >>> print(codec.décoder_compacte(1044983918324568580))
+        +-+-+-+-+
+        |1 2 3 4|
+        +-+-+-+-+
+        |3 4|1 2|
+        + + + + +
+        |1 2|3 4|
+        +-+-+-+-+
+        >>> codec.décoder_compacte(1044983918324568580).est_canonique()
+        True
+        """
+        grille = self.décoder_compacte(code)
+        return self.encoder(grille.forme_canonique())
+
+    def est_normal_code(self, code):
+        """Vrai ssi le code identifie une grille en forme normale
+
+        Le code est parcouru chiffre par chiffre, sans construire de grille.
+        Outre l'ordre de numérotation des régions, `pad_région` doit
+        correspondre au nombre de régions.
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> codec.est_normal_code(45665103876)
+        True
+        >>> codec.est_normal_code(codec.encoder_incrément(45665103876, 6,
+        ...                                               région=4))
+        False
+        """
+        code, pad_région = divmod(code, self.pad_dimension)
+        pad_case = self.pad_valeur * pad_région
+
+        # Les régions sont décalées d'une unité dans le code
+        prochaine = 1
+        while code != 0:
+            code, chiffre = divmod(code, pad_case)
+            région = chiffre // self.pad_valeur
+            if région == prochaine:
+                prochaine += 1
+            elif région > prochaine:
+                return False
+
+        return pad_région == prochaine
+
+    def normaliser_code(self, code):
+        """Code de la forme normale de la grille identifiée par le code
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> anormal = codec.encoder_incrément(45665103876, 6, région=4)
+        >>> codec.normaliser_code(anormal) == codec.encoder_incrément(
+        ...     45665103876, 6, région=3)
+        True
+        """
+        code, pad_région = divmod(code, self.pad_dimension)
+        pad_case = self.pad_valeur * pad_région
+
+        # - Extraction des chiffres
+        chiffres = list()
+        while code != 0:
+            code, chiffre = divmod(code, pad_case)
+            chiffres.append(chiffre)
+
+        return self._encoder_normalisé(chiffres, pad_région)
+
+    def permuter_code(self, code, permutation):
+        """Code de la forme normale de la grille dont la case i est la case
+        permutation[i] de la grille identifiée
+
+        Les poids ne dépendant que du nombre de cases et de régions, le même
+        Codec convient pour une permutation qui change les dimensions,
+        comme la transposition.
+
+        >>> from tectonic import Base
+        >>> from tectonic import topologie
+        >>> base = Base(largeur=4, hauteur=3, maximum=4)
+        >>> codec = Codec(base)
+        >>> code = codec.permuter_code(1045670321714520580,
+        ...                            topologie(base).transposition)
+        >>> print(Codec(Base(largeur=3, hauteur=4, maximum=4)).décoder(code))
+        +-+-+-+
+        |1 3|1|
+        + + + +
+        |2 4|2|
+        +-+-+ +
+        |3 1|3|
+        + + + +
+        |4 2|4|
+        +-+-+-+
+        """
+        code, pad_région = divmod(code, self.pad_dimension)
+        pad_case = self.pad_valeur * pad_région
+
+        # - Extraction des chiffres de toutes les cases
+        chiffres = [0] * self.base.nb_cases()
+        i = 0
+        while code != 0:
+            code, chiffres[i] = divmod(code, pad_case)
+            i += 1
+
+        return self._encoder_normalisé([chiffres[j] for j in permutation],
+                                       pad_région)
+
+    def _encoder_normalisé(self, chiffres, pad_région):
+        """Code des chiffres (valeur, région) fournis, une fois les régions
+        renumérotées dans l'ordre de première apparition
+        """
+        # - Renumérotation des régions, décalées d'une unité dans le code
+        nouvelles = [0] * pad_région
+        nb_régions = 0
+        for i, chiffre in enumerate(chiffres):
+            région, valeur = divmod(chiffre, self.pad_valeur)
+            if région > 0:
+                if nouvelles[région] == 0:
+                    nb_régions += 1
+                    nouvelles[région] = nb_régions
+                chiffres[i] = valeur + self.pad_valeur * nouvelles[région]
+
+        # - Encodage avec le nouveau pad_région
+        retour = 1 + nb_régions
+        poids = self.poids(retour)
+        for i, chiffre in enumerate(chiffres):
+            retour += chiffre * poids[i]
+
+        return retour
+
+    def encoder_incrément(self, code, index, *, valeur=-1, région=-1):
+        """Code obtenu en fixant la valeur et/ou la région d'une case
+
+        Les caractéristiques fixées doivent être indéfinies pour la case
+        'index' du code d'origine. Le code n'est recalculé entièrement que si
+        'région' est une nouvelle région, car `pad_région` augmente alors.
+
+        >>> from tectonic import Base
+        >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+        >>> def fixer(code, *changements):
+        ...     grille = codec.décoder(code)
+        ...     for index, valeur, région in changements:
+        ...         grille.cases[index].valeur = valeur
+        ...         grille.cases[index].région = région
+        ...         code = codec.encoder_incrément(code, index, valeur=valeur,
+        ...                                        région=région)
+        ...     return code == codec.encoder(grille)
+
+        Valeur et/ou région, région existante ou nouvelle, jusqu'à la
+        dernière case :
+
+        >>> [fixer(45665103876, changement) for changement in [
+        ...     (6, 1, 2), (6, -1, 3), (6, 5, -1), (9, 2, 0), (15, 4, 1),
+        ...     (15, -1, 3), (15, 3, 3)]]
+        [True, True, True, True, True, True, True]
+        >>> fixer(45665103876, (6, 1, 3), (7, -1, 3), (15, 2, 4))
+        True
+        """
+        pad_région = code % self.pad_dimension
+        if région >= pad_région - 1:
+            code = self._changer_pad_région(code, région + 2)
+
+        chiffre = self.pad_valeur * (1 + région)
+        if valeur >= 1:
+            chiffre += valeur
+
+        return code + chiffre * self.poids(code)[index]
+
+    def poids(self, code):
+        """Poids de chaque case dans un code de même `pad_région`
+        """
+        pad_région = code % self.pad_dimension
+        retour = self._poids.get(pad_région)
+        if retour is None:
+            pad_case = self.pad_valeur * pad_région
+            retour = [self.pad_dimension]
+            for i in range(1, self.base.nb_cases()):
+                retour.append(retour[-1] * pad_case)
+            self._poids[pad_région] = retour
+        return retour
+
+    def _changer_pad_région(self, code, pad_région):
+        """Même code, exprimé pour un autre `pad_région`
+
+        Le chiffre (valeur, région) d'une case ne dépend pas de `pad_région` :
+        seul son poids change.
+        """
+        code, ancien_pad_région = divmod(code, self.pad_dimension)
+        pad_case = self.pad_valeur * ancien_pad_région
+
+        retour = pad_région
+        poids = self.poids(retour)
+        i = 0
+        while code != 0:
+            code, chiffre = divmod(code, pad_case)
+            retour += chiffre * poids[i]
+            i += 1
+
+        return retour
+
+    def _encoder_compacte(self, grille):
+        pad_région = 1 + grille.nb_régions()
+        pad_valeur = self.pad_valeur
+        pad_case = pad_valeur * pad_région
+
+        # - Encodage de la grille elle-même, un chiffre (valeur, région) à la
+        # fois. Une région indéfinie (-1) est naturellement codée par 0.
+        retour = 0
+        for valeur, région in zip(reversed(grille.valeurs),
+                                  reversed(grille.régions)):
+            retour *= pad_case
+            retour += pad_valeur * (1 + région)
+            if valeur >= 1:
+                retour += valeur
+
+        # - Encodage des caractéristiques du format
+        retour *= self.pad_dimension
+        retour += pad_région
+
+        return retour
+
+
+class CodecBinaire:
+    """Transformation entre code à champs de bits fixes et GrilleCompacte
+
+    Chaque case occupe `bits_case` bits : `bits_valeur` pour la valeur, puis
+    `bits_région` pour la région, décalée d'une unité comme dans Codec. La
+    case i est rangée à partir du bit i × `bits_case` : le codage reste
+    préfixe, et l'accès à une case se résume à un décalage et un masque.
+
+    Contrairement à Codec, la disposition ne dépend ni du nombre de régions
+    de la grille, ni d'un octet de format : tous les codes d'un même palier
+    ont la même largeur.
+
+    >>> from tectonic import Base
+    >>> base = Base(largeur=4, hauteur=4, maximum=5)
+    >>> binaire = CodecBinaire(base)
+    >>> binaire.bits_valeur, binaire.bits_région
+    (3, 5)
+    >>> code = binaire.depuis_codec(Codec(base), 45665103876)
+    >>> hex(code)
+    '0x1c0b1312090a'
+    >>> binaire.valeur(code, 5), binaire.région(code, 5)
+    (4, 2)
+    >>> binaire.vers_codec(Codec(base), code)
+    45665103876
+    """
+
+    def __init__(self, base):
+        """Les informations portées par la Base ne sont pas codées
+        """
+        self.base = base
+        self.bits_valeur = base.maximum.bit_length()
+        self.bits_région = base.nb_cases().bit_length()
+        self.bits_case = self.bits_valeur + self.bits_région
+
+        self.masque_valeur = (1 << self.bits_valeur) - 1
+        self.masque_case = (1 << self.bits_case) - 1
+
+    def largeur(self, nb_cases):
+        """Nombre d'octets d'un code dont 'nb_cases' cases sont définies
+        """
+        return (nb_cases * self.bits_case + 7) // 8
+
+    def chiffre(self, code, index):
+        """Chiffre (valeur, région) de la case d'index fourni
+        """
+        return (code >> (index * self.bits_case)) & self.masque_case
+
+    def valeur(self, code, index):
+        """Valeur de la case d'index fourni, -1 si indéfinie
+        """
+        retour = self.chiffre(code, index) & self.masque_valeur
+        return retour if retour > 0 else -1
+
+    def région(self, code, index):
+        """Région de la case d'index fourni, -1 si indéfinie
+        """
+        return (self.chiffre(code, index) >> self.bits_valeur) - 1
+
+    def décoder_compacte(self, code):
+        """GrilleCompacte de code correspondant
+
+        La Base du Codec est partagée avec la grille produite
+        """
+        return self.décoder_préfixe(code, self.base.nb_cases())
+
+    def décoder_préfixe(self, code, nb_cases):
+        """GrilleCompacte dont seules les 'nb_cases' premières cases sont
+        décodées
+
+        >>> from tectonic import Base
+        >>> binaire = CodecBinaire(Base(largeur=4, hauteur=4, maximum=5))
+        >>> grille = binaire.décoder_préfixe(0x1c0b1312090a, 3)
+        >>> list(grille.valeurs[:4]), list(grille.régions[:4])
+        ([2, 1, 2, -1], [0, 0, 1, -1])
+        """
+        retour = GrilleCompacte(self.base)
+        valeurs = retour.valeurs
+        régions = retour.régions
+        bits_valeur = self.bits_valeur
+        bits_case = self.bits_case
+        masque_valeur = self.masque_valeur
+        masque_case = self.masque_case
+        for i in range(nb_cases):
+            if code == 0:
+                break
+            chiffre = code & masque_case
+            code >>= bits_case
+            valeur = chiffre & masque_valeur
+            if valeur > 0:
+                valeurs[i] = valeur
+            régions[i] = (chiffre >> bits_valeur) - 1
+
+        return retour
+
+    def encoder(self, grille):
+        """Code associé à la GrilleCompacte fournie
+
+        >>> from tectonic import Base
+        >>> base = Base(largeur=4, hauteur=4, maximum=5)
+        >>> binaire = CodecBinaire(base)
+        >>> grille = Codec(base).décoder_compacte(45665103876)
+        >>> binaire.encoder(grille) == binaire.depuis_codec(Codec(base),
+        ...                                                 45665103876)
+        True
+        """
+        bits_valeur = self.bits_valeur
+        bits_case = self.bits_case
+
+        # Une valeur ou une région indéfinie (-1) est naturellement codée
+        # par 0
+        retour = 0
+        for valeur, région in zip(reversed(grille.valeurs),
+                                  reversed(grille.régions)):
+            retour <<= bits_case
+            retour |= (1 + région) << bits_valeur
+            if valeur >= 1:
+                retour |= valeur
+
+        return retour
+
+    def encoder_incrément(self, code, index, *, valeur=-1, région=-1):
+        """Code obtenu en fixant la valeur et/ou la région d'une case
+
+        Les caractéristiques fixées doivent être indéfinies pour la case
+        'index' du code d'origine.
+        """
+        chiffre = (1 + région) << self.bits_valeur
+        if valeur >= 1:
+            chiffre |= valeur
+
+        return code | (chiffre << (index * self.bits_case))
+
+    def depuis_codec(self, codec, code):
+        """Code binaire correspondant au code produit par le Codec fourni
+        """
+        code, pad_région = divmod(code, codec.pad_dimension)
+        pad_valeur = codec.pad_valeur
+        pad_case = pad_valeur * pad_région
+
+        retour = 0
+        décalage = 0
+        while code != 0:
+            code, chiffre = divmod(code, pad_case)
+            région, valeur = divmod(chiffre, pad_valeur)
+            retour |= (région << self.bits_valeur | valeur) << décalage
+            décalage += self.bits_case
+
+        return retour
+
+    def vers_codec(self, codec, code):
+        """Code produit par le Codec fourni pour la même grille
+        """
+        pad_valeur = codec.pad_valeur
+
+        # - Extraction des chiffres, réexprimés dans la base du Codec
+        chiffres = list()
+        nb_régions = 0
+        while code != 0:
+            chiffre = code & self.masque_case
+            code >>= self.bits_case
+            région = chiffre >> self.bits_valeur
+            nb_régions = max(nb_régions, région)
+            chiffres.append(région * pad_valeur
+                            + (chiffre & self.masque_valeur))
+
+        # - Encodage avec le pad_région correspondant
+        retour = 1 + nb_régions
+        poids = codec.poids(retour)
+        for i, chiffre in enumerate(chiffres):
+            retour += chiffre * poids[i]
+
+        return retour
+
+
+class GrilleParesseuse:
+    """Vue d'un code dont les cases ne sont décodées qu'à la demande
+
+    Le chiffre (valeur, région) d'une case est extrait directement grâce à
+    son poids dans le code, puis mémorisé. Utile quand seules quelques cases
+    sont consultées.
+
+    >>> from tectonic import Base
+    >>> codec = Codec(Base(largeur=4, hauteur=4, maximum=5))
+    >>> grille = GrilleParesseuse(codec, 45665103876)
+    >>> grille.valeur(5), grille.région(5), grille[(1, 1)]
+    (4, 2, Case(valeur=4, région=2))
+    >>> grille.valeur(6), grille.région(6)
+    (-1, -1)
+    """
+
+    __slots__ = ("base", "code", "_chiffres", "_poids", "_pad_case",
+                 "_pad_valeur")
+
+    def __init__(self, codec, code):
+        self.base = codec.base
+        self.code = code
+
+        self._chiffres = [None] * self.base.nb_cases()
+        self._poids = codec.poids(code)
+        self._pad_case = codec.pad_valeur * (code % codec.pad_dimension)
+        self._pad_valeur = codec.pad_valeur
+
+    def chiffre(self, index):
+        """Chiffre (valeur, région) de la case d'index fourni
+        """
+        retour = self._chiffres[index]
+        if retour is None:
+            retour = (self.code // self._poids[index]) % self._pad_case
+            self._chiffres[index] = retour
+        return retour
+
+    def valeur(self, index):
+        """Valeur de la case d'index fourni, -1 si indéfinie
+        """
+        retour = self.chiffre(index) % self._pad_valeur
+        return retour if retour > 0 else -1
+
+    def région(self, index):
+        """Région de la case d'index fourni, -1 si indéfinie
+        """
+        return self.chiffre(index) // self._pad_valeur - 1
+
+    def __getitem__(self, position):
+        h, l = position
+        index = self.base.en_index(hauteur=h, largeur=l)
+        return Case(self.valeur(index), self.région(index))
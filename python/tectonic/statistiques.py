@@ -0,0 +1,272 @@
+# -*- coding:utf-8 -*-
+"""Statistiques d'un fichier de codes, conservées dans un pied de fichier
+
+Définition du pied:
+
+  +----+--------------------------------------+
+  | 4s | type de section : "STAT", …          |
+  | L  | taille du contenu (en octets)        |
+  +----+--------------------------------------+
+
+  puis le contenu de la section
+
+  (×nombre de sections)
+
+  +----+--------------------------------------+
+  | L  | taille du pied (en octets, fin       |
+  |    | comprise)                            |
+  | 4s | "PIED"                               |
+  +----+--------------------------------------+
+
+Les sections de type inconnu sont conservées sans être interprétées, ce qui
+permet d'en ajouter de nouvelles sans changer de format.
+
+Définition du contenu de la section "STAT":
+
+  +----+--------------------------------------+
+  | Q  | nombre de codes                      |
+  | Q  | nombre de grilles complètes          |
+  | B  | taille 'k' du plus petit code        |
+  | s  | plus petit code, sur 'k' octets      |
+  | B  | taille 'k' du plus grand code        |
+  | s  | plus grand code, sur 'k' octets      |
+  | H  | nombre d'entrées 'n'                 |
+  | BQ | taille (en octets), nombre de codes  |
+  |    | (×n)                                 |
+  | H  | nombre d'entrées 'n'                 |
+  | BQ | nombre de régions, nombre de codes   |
+  |    | (×n)                                 |
+  +----+--------------------------------------+
+
+Définition du contenu de la section "GENE", propre à la génération d'un
+palier à partir du précédent:
+
+  +----+--------------------------------------+
+  | Q  | nombre de grilles lues               |
+  | Q  | nombre de grilles sans descendance   |
+  +----+--------------------------------------+
+
+Le nombre de régions d'une grille se lit dans l'octet de poids faible de son
+code (`pad_région`, voir `serial.Codec`). Le codage étant préfixe, une grille
+est complète si sa dernière case est définie, c'est-à-dire si son code
+atteint le poids de cette case.
+"""
+
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_SECTION = struct.Struct(">4sL")
+_FIN = struct.Struct(">L4s")
+_COMPTES = struct.Struct(">QQ")
+_ENTRÉE = struct.Struct(">BQ")
+
+PIED = b"PIED"
+STAT = b"STAT"
+GÉNÉRATION = b"GENE"
+
+# Bornes des tailles de code en octets, pour le chemin NumPy
+_BORNES = [2**(8 * k) for k in range(1, 8)]
+
+
+def encoder_pied(sections):
+    """Octets du pied portant les sections {type: contenu} fournies
+    """
+    retour = [
+        _SECTION.pack(type_, len(contenu)) + contenu
+        for type_, contenu in sections.items()
+    ]
+    taille = sum(len(section) for section in retour) + _FIN.size
+    retour.append(_FIN.pack(taille, PIED))
+    return b"".join(retour)
+
+
+def lire_pied(données, fin=None):
+    """Début du pied se terminant à la position 'fin', et ses sections
+    {type: contenu}
+
+    Sans pied valide, renvoie ('fin', {}). Par défaut, le pied termine les
+    données.
+    """
+    if fin is None:
+        fin = len(données)
+    if fin < _FIN.size:
+        return fin, dict()
+    taille, marque = _FIN.unpack_from(données, fin - _FIN.size)
+    if marque != PIED or taille > fin:
+        return fin, dict()
+
+    début = fin - taille
+    sections = dict()
+    position = début
+    while position < fin - _FIN.size:
+        type_, longueur = _SECTION.unpack_from(données, position)
+        position += _SECTION.size
+        sections[type_] = bytes(données[position:position + longueur])
+        position += longueur
+    if position != fin - _FIN.size:
+        return fin, dict()
+
+    return début, sections
+
+
+class Statistiques:
+    """Statistiques cumulées au fil de l'écriture des codes d'une Base
+    """
+
+    __slots__ = ("nb_cases", "pad_valeur", "nb_codes", "nb_complets",
+                 "minimum", "maximum", "tailles", "régions", "_seuils",
+                 "_seuils_numpy", "_atteignables")
+
+    def __init__(self, base):
+        self.nb_cases = base.nb_cases()
+        self.pad_valeur = 1 + base.maximum
+
+        self.nb_codes = 0
+        self.nb_complets = 0
+        self.minimum = None
+        self.maximum = None
+        # Nombre de codes par taille (en octets) et par nombre de régions
+        self.tailles = dict()
+        self.régions = dict()
+
+        # Code minimal d'une grille complète, par pad_région
+        self._seuils = [
+            256 * (self.pad_valeur * pad_région)**(self.nb_cases - 1)
+            for pad_région in range(256)
+        ]
+
+        # Les mêmes, pour NumPy : les seuils hors d'atteinte sont remplacés
+        # par le plus grand entier
+        if numpy is not None:
+            self._seuils_numpy = numpy.array(
+                [min(s, 2**64 - 1) for s in self._seuils], dtype=numpy.uint64)
+            self._atteignables = numpy.array(
+                [s < 2**64 for s in self._seuils])
+
+    def __eq__(self, autre):
+        return all(
+            getattr(self, nom) == getattr(autre, nom)
+            for nom in ("nb_codes", "nb_complets", "minimum", "maximum",
+                        "tailles", "régions"))
+
+    def ajouter_lot(self, codes, taille=None):
+        """Prend en compte les codes fournis
+
+        'taille', si elle est connue, est la taille commune des codes (en
+        octets).
+        """
+        if len(codes) == 0:
+            return
+
+        minimum = min(codes)
+        maximum = max(codes)
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+        self.nb_codes += len(codes)
+
+        if numpy is not None and maximum < 2**64:
+            self._ajouter_numpy(codes, taille)
+            return
+
+        for code in codes:
+            nb_octets = taille or (code.bit_length() + 7) // 8 or 1
+            self.tailles[nb_octets] = self.tailles.get(nb_octets, 0) + 1
+            pad_région = code & 0xFF
+            self.régions[pad_région - 1] = self.régions.get(
+                pad_région - 1, 0) + 1
+            if code >= self._seuils[pad_région]:
+                self.nb_complets += 1
+
+    def _ajouter_numpy(self, codes, taille):
+        codes = numpy.array(codes, dtype=numpy.uint64)
+        pad_régions = (codes & numpy.uint64(0xFF)).astype(numpy.intp)
+
+        if taille is None:
+            tailles = 1 + numpy.searchsorted(
+                numpy.array(_BORNES, dtype=numpy.uint64), codes, side="right")
+            for nb_octets, nombre in enumerate(numpy.bincount(tailles)):
+                if nombre > 0:
+                    self.tailles[nb_octets] = self.tailles.get(
+                        nb_octets, 0) + int(nombre)
+        else:
+            self.tailles[taille] = self.tailles.get(taille, 0) + len(codes)
+
+        for pad_région, nombre in enumerate(numpy.bincount(pad_régions)):
+            if nombre > 0:
+                self.régions[pad_région - 1] = self.régions.get(
+                    pad_région - 1, 0) + int(nombre)
+
+        self.nb_complets += int(
+            numpy.count_nonzero(
+                self._atteignables[pad_régions]
+                & (codes >= self._seuils_numpy[pad_régions])))
+
+    def fusionner(self, autre):
+        """Ajoute les statistiques d'un autre fichier de même Base
+        """
+        if autre.nb_codes == 0:
+            return
+        if self.nb_codes == 0 or autre.minimum < self.minimum:
+            self.minimum = autre.minimum
+        if self.nb_codes == 0 or autre.maximum > self.maximum:
+            self.maximum = autre.maximum
+        self.nb_codes += autre.nb_codes
+        self.nb_complets += autre.nb_complets
+        for taille, nombre in autre.tailles.items():
+            self.tailles[taille] = self.tailles.get(taille, 0) + nombre
+        for nb_régions, nombre in autre.régions.items():
+            self.régions[nb_régions] = self.régions.get(nb_régions, 0) + nombre
+
+    def en_octets(self):
+        """Contenu de la section "STAT"
+        """
+        retour = [_COMPTES.pack(self.nb_codes, self.nb_complets)]
+        for code in (self.minimum or 0, self.maximum or 0):
+            taille = (code.bit_length() + 7) // 8
+            retour.append(struct.pack(">B", taille))
+            retour.append(code.to_bytes(taille, byteorder="big"))
+        for histogramme in (self.tailles, self.régions):
+            retour.append(struct.pack(">H", len(histogramme)))
+            for clé in sorted(histogramme):
+                retour.append(_ENTRÉE.pack(clé, histogramme[clé]))
+        return b"".join(retour)
+
+    @staticmethod
+    def depuis_octets(base, octets):
+        """Statistiques décrites par le contenu d'une section "STAT"
+        """
+        retour = Statistiques(base)
+        retour.nb_codes, retour.nb_complets = _COMPTES.unpack_from(octets, 0)
+        position = _COMPTES.size
+        extrêmes = list()
+        for _ in range(2):
+            taille = octets[position]
+            extrêmes.append(
+                int.from_bytes(octets[position + 1:position + 1 + taille],
+                               byteorder="big"))
+            position += 1 + taille
+        if retour.nb_codes > 0:
+            retour.minimum, retour.maximum = extrêmes
+        for histogramme in (retour.tailles, retour.régions):
+            nb_entrées = struct.unpack_from(">H", octets, position)[0]
+            position += 2
+            for _ in range(nb_entrées):
+                clé, nombre = _ENTRÉE.unpack_from(octets, position)
+                histogramme[clé] = nombre
+                position += _ENTRÉE.size
+        return retour
+
+    @staticmethod
+    def depuis_lots(base, lots):
+        """Statistiques calculées en parcourant des listes de codes
+        """
+        retour = Statistiques(base)
+        for lot in lots:
+            retour.ajouter_lot(lot)
+        return retour
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Tri externe et dédoublonnage de fichiers de codes
+
+Le fichier est découpé en séquences dont le tri tient dans le budget
+mémoire. Chaque séquence est triée, dédoublonnée et écrite dans un fichier
+temporaire au format n°2, par un processus dédié. Les séquences sont ensuite
+fusionnées par `heapq.merge`, les doublons entre séquences étant retirés au
+passage.
+
+Une fusion décode un bloc de chaque séquence à la fois : le nombre de
+séquences fusionnées ensemble est borné par le budget mémoire. Au-delà, les
+séquences sont fusionnées par groupes, en parallèle, en autant de passes que
+nécessaire.
+"""
+
+import contextlib
+import heapq
+import multiprocessing
+import os
+import tempfile
+
+from .fichier import lecteur
+from .fichier import écrivain
+from .fichier_002 import Écrivain as Écrivain002
+
+# Estimation de l'empreinte d'un code en cours de tri : entier Python,
+# référence dans la liste et dans sa copie triée
+OCTETS_PAR_CODE = 128
+
+# Nombre de codes par bloc des fichiers temporaires, décodés d'un coup à la
+# fusion
+TAILLE_BLOC = 2**12
+
+
+def _trier_séquence(tâche):
+    """Trie et dédoublonne une séquence, renvoie le nombre de doublons
+    """
+    chemin, début, fin, chemin_séquence = tâche
+    with lecteur(chemin) as entrée:
+        sortie = Écrivain002(chemin_séquence, entrée.base, TAILLE_BLOC)
+        codes = sorted(entrée.iter_range(début, fin))
+
+    doublons = 0
+    précédent = None
+    for code in codes:
+        if code == précédent:
+            doublons += 1
+        else:
+            sortie.ajouter(code)
+            précédent = code
+    sortie.clore()
+
+    return doublons
+
+
+def _fusionner(chemins, sortie):
+    """Fusionne les séquences dans la sortie, qui est close, renvoie le
+    nombre de doublons
+    """
+    doublons = 0
+    précédent = None
+    # `heapq.merge` termine par `yield from` sur le dernier itérateur : un
+    # lecteur y serait rembobiné par `iter`, d'où `iter_range`
+    with contextlib.ExitStack() as pile:
+        séquences = [pile.enter_context(lecteur(chemin)) for chemin in chemins]
+        for code in heapq.merge(*(s.iter_range(0, len(s))
+                                  for s in séquences)):
+            if code == précédent:
+                doublons += 1
+            else:
+                sortie.ajouter(code)
+                précédent = code
+    sortie.clore()
+
+    return doublons
+
+
+def _fusionner_séquences(tâche):
+    """Fusionne un groupe de séquences en une nouvelle, renvoie le nombre de
+    doublons
+
+    Les séquences fusionnées sont supprimées.
+    """
+    chemins, chemin_fusion = tâche
+    with lecteur(chemins[0]) as séquence:
+        base = séquence.base
+    doublons = _fusionner(chemins,
+                          Écrivain002(chemin_fusion, base, TAILLE_BLOC))
+    for chemin in chemins:
+        os.remove(chemin)
+    return doublons
+
+
+def trier(chemin, chemin_trié, *, mémoire=2**30, nb_processus=None,
+          format=None, dossier=None):
+    """Écrit dans 'chemin_trié' les codes de 'chemin', triés et dédoublonnés
+
+    'mémoire' est le budget, en octets, partagé entre les 'nb_processus'
+    processus de tri. Les séquences intermédiaires sont écrites dans un
+    dossier temporaire créé dans 'dossier', par défaut celui du fichier
+    trié. Par défaut, le format du fichier d'origine est conservé (le
+    format n°0 donnant le n°1).
+
+    Renvoie le couple (nombre de codes lus, nombre de doublons retirés).
+
+    >>> import random
+    >>> import tempfile
+    >>> from tectonic import Base
+    >>> hasard = random.Random(0)
+    >>> codes = [259 + 256 * hasard.randrange(5000) for _ in range(20000)]
+    >>> with tempfile.TemporaryDirectory() as dossier:
+    ...     chemin = os.path.join(dossier, "h03l03m04.log")
+    ...     sortie = écrivain(chemin, Base(hauteur=3, largeur=3, maximum=4))
+    ...     sortie.ajouter_lot(codes)
+    ...     sortie.clore()
+    ...     # Séquences de 256 codes, fusionnées deux à deux
+    ...     compte = trier(chemin, chemin + ".tri", mémoire=2**15,
+    ...                    nb_processus=1)
+    ...     with lecteur(chemin + ".tri") as trié:
+    ...         triés = list(trié)
+    >>> compte == (len(codes), len(codes) - len(set(codes)))
+    True
+    >>> triés == sorted(set(codes))
+    True
+    """
+    if nb_processus is None:
+        nb_processus = os.cpu_count()
+    if dossier is None:
+        dossier = os.path.dirname(os.path.abspath(chemin_trié))
+
+    with lecteur(chemin) as entrée:
+        base = entrée.base
+        nb_codes = len(entrée)
+        if format is None:
+            format = max(1, entrée.FORMAT)
+    taille = max(1, mémoire // (nb_processus * OCTETS_PAR_CODE))
+
+    # Nombre de séquences fusionnées ensemble, par chaque processus pour les
+    # passes intermédiaires, puis par le seul processus principal
+    arité = max(2, mémoire // (nb_processus * OCTETS_PAR_CODE * TAILLE_BLOC))
+    arité_finale = max(2, mémoire // (OCTETS_PAR_CODE * TAILLE_BLOC))
+
+    with tempfile.TemporaryDirectory(dir=dossier) as temporaire:
+        with multiprocessing.Pool(nb_processus) as pool:
+            # - Tri des séquences
+            tâches = [(chemin, début, min(début + taille, nb_codes),
+                       os.path.join(temporaire, f"séquence{i:06d}.log"))
+                      for i, début in enumerate(range(0, nb_codes, taille))]
+            doublons = sum(pool.imap_unordered(_trier_séquence, tâches))
+            séquences = [tâche[-1] for tâche in tâches]
+
+            # - Fusions intermédiaires
+            passe = 0
+            while len(séquences) > arité_finale:
+                passe += 1
+                tâches = [(séquences[i:i + arité],
+                           os.path.join(temporaire,
+                                        f"fusion{passe:02d}-{i:06d}.log"))
+                          for i in range(0, len(séquences), arité)]
+                doublons += sum(
+                    pool.imap_unordered(_fusionner_séquences, tâches))
+                séquences = [tâche[-1] for tâche in tâches]
+
+        # - Fusion finale
+        doublons += _fusionner(
+            séquences, écrivain(chemin_trié, base, format=format))
+
+    return nb_codes, doublons
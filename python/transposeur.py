@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Transpose des fichiers de grilles complètes
+
+Le fichier produit est rangé à côté de l'original, sous le nom correspondant
+aux dimensions interverties : h03l04m04.log donne h04l03m04.log.
+
+  transposeur.py [-j nb_processus] fichier…
+"""
+
+import getopt
+import logging
+import os.path
+import sys
+import time
+
+from tectonic import Progrès
+from tectonic import fichier
+
+
+class Transposeur:
+
+    def __init__(self, nb_processus=None, chemins=list()):
+        self.nb_processus = nb_processus
+        self.chemins = chemins
+
+    @staticmethod
+    def charger():
+        retour = Transposeur()
+        opts, args = getopt.getopt(sys.argv[1:], "j:")
+        for opt, val in opts:
+            if not val.isdecimal() or int(val) < 1:
+                logging.warning(f"Option «{opt} {val}» ignorée")
+            elif opt == "-j":
+                retour.nb_processus = int(val)
+        retour.chemins[:] = args
+
+        return retour
+
+    @staticmethod
+    def chemin_transposé(chemin):
+        """Chemin du fichier transposé, None si le fichier n'est pas celui
+        de grilles complètes
+        """
+        dossier, nom = os.path.split(chemin)
+        progrès = Progrès.depuis_chaîne(nom)
+        if progrès is None or progrès.palier != (progrès.hauteur *
+                                                 progrès.largeur):
+            return None
+
+        progrès.hauteur, progrès.largeur = progrès.largeur, progrès.hauteur
+        return os.path.join(dossier, str(progrès) + ".log")
+
+    def transposer(self, chemin):
+        chemin_transposé = self.chemin_transposé(chemin)
+        if chemin_transposé is None:
+            logging.warning(f"«{chemin}» ignoré : grilles incomplètes")
+            return
+
+        logging.info(f"Transposition de «{chemin}» vers "
+                     f"«{chemin_transposé}»")
+        début = time.perf_counter()
+        try:
+            nb_codes = fichier.transposer(chemin,
+                                          chemin_transposé,
+                                          nb_processus=self.nb_processus)
+        except ValueError as erreur:
+            logging.warning(f"{erreur}, fichier ignoré")
+            return
+        durée = time.perf_counter() - début
+        logging.info(f"{nb_codes} grilles transposées en {durée:.1f}s "
+                     f"({nb_codes / durée:.0f} grilles/s)")
+
+    def lancer(self):
+        for chemin in self.chemins:
+            self.transposer(chemin)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    TRANSPOSEUR = Transposeur.charger()
+    TRANSPOSEUR.lancer()
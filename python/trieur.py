@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Trie et dédoublonne des fichiers de codes, en mémoire bornée
+
+  trieur.py [-j nb_processus] [-M mébioctets] [-b format] [-o suffixe] \
+fichier…
+
+Chaque fichier trié est écrit à côté de l'original, suffixé par «.tri» par
+défaut. Le nombre de doublons retirés est rapporté pour chaque fichier,
+c'est-à-dire pour chaque palier.
+"""
+
+import getopt
+import logging
+import sys
+import time
+
+from tectonic import Progrès
+from tectonic.tri import trier
+
+
+class Trieur:
+
+    def __init__(self, nb_processus=None, mémoire=2**30, format=None,
+                 suffixe=".tri", chemins=list()):
+        self.nb_processus = nb_processus
+        self.mémoire = mémoire
+        self.format = format
+        self.suffixe = suffixe
+        self.chemins = chemins
+
+    @staticmethod
+    def charger():
+        retour = Trieur()
+        opts, args = getopt.getopt(sys.argv[1:], "b:j:M:o:")
+        for opt, val in opts:
+            if opt == "-o":
+                retour.suffixe = val
+            elif not val.isdecimal():
+                logging.warning(f"Option «{opt} {val}» ignorée")
+            elif opt == "-b" and int(val) in (1, 2):
+                retour.format = int(val)
+            elif opt == "-j" and int(val) > 0:
+                retour.nb_processus = int(val)
+            elif opt == "-M" and int(val) > 0:
+                retour.mémoire = int(val) * 2**20
+            else:
+                logging.warning(f"Option «{opt} {val}» ignorée")
+        retour.chemins[:] = args
+
+        return retour
+
+    def trier(self, chemin):
+        début = time.perf_counter()
+        nb_codes, doublons = trier(chemin,
+                                   chemin + self.suffixe,
+                                   mémoire=self.mémoire,
+                                   nb_processus=self.nb_processus,
+                                   format=self.format)
+        durée = time.perf_counter() - début
+
+        progrès = Progrès.depuis_chaîne(chemin)
+        palier = "" if progrès is None else f"palier n°{progrès.palier}, "
+        logging.info(f"«{chemin}» : {palier}{nb_codes} codes, "
+                     f"{doublons} doublons retirés "
+                     f"({doublons / max(1, nb_codes):.2%}) en {durée:.1f}s")
+
+    def lancer(self):
+        for chemin in self.chemins:
+            self.trier(chemin)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    TRIEUR = Trieur.charger()
+    TRIEUR.lancer()